@@ -0,0 +1,83 @@
+"""Measure lookups in the AMS filament index for a simulated fleet
+
+Fills the index with N printers of random AMS contents plus an inventory
+spool in some slots, then reports:
+
+    update   time to re-index one printer's AMS report
+    query    time to find the printers able to run a random 1-4 color file,
+             over all printers and over the idle ones only
+
+Usage:
+    python benchmarks/filament_index.py --printers 200 --units 4
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.filament_index import FilamentIndex, Requirement  # noqa: E402
+
+MATERIALS = ["PLA", "PLA", "PLA", "PETG", "PETG", "ABS", "ASA", "TPU"]
+COLORS = ["#000000", "#FFFFFF", "#00AE42", "#0A2989", "#C12E1F", "#FFD700", "#808080", "#F5A9B8",
+          "#4B0082", "#FF6A13", "#1E90FF", "#32CD32", "#8B4513", "#D3D3D3"]
+
+
+def random_trays(rng: random.Random, units: int):
+    return {
+        slot: (rng.choice(MATERIALS), rng.choice(COLORS), rng.choice([-1, rng.randint(0, 100)]))
+        for slot in range(1, units * 4 + 1)
+    }
+
+
+def timed(function, *args) -> float:
+    began = time.perf_counter()
+    function(*args)
+    return (time.perf_counter() - began) * 1000
+
+
+def run(printers: int, units: int, queries: int, seed: int):
+    rng = random.Random(seed)
+    index = FilamentIndex()
+    fleet = [f"printer{i}" for i in range(printers)]
+    for printer_id in fleet:
+        index.set_trays(printer_id, random_trays(rng, units))
+        for slot in rng.sample(range(1, units * 4 + 1), units):
+            index.set_spool({
+                "id": f"{printer_id}-{slot}", "printer": printer_id, "slot": slot,
+                "material": rng.choice(MATERIALS), "color": rng.choice(COLORS), "remaining_g": rng.uniform(0, 1000)
+            })
+    idle = [printer_id for printer_id in fleet if rng.random() < 0.3]
+
+    updates = [timed(index.set_trays, rng.choice(fleet), random_trays(rng, units)) for _ in range(queries)]
+    files = [
+        [Requirement(rng.choice(MATERIALS), rng.choice(COLORS), rng.uniform(5, 200)) for _ in range(rng.randint(1, 4))]
+        for _ in range(queries)
+    ]
+    fleet_queries = [timed(index.find_printers, requirements) for requirements in files]
+    idle_queries = [timed(index.find_printers, requirements, idle) for requirements in files]
+    matched = statistics.mean(len(index.find_printers(requirements)) for requirements in files)
+    return updates, fleet_queries, idle_queries, matched
+
+
+def summary(times) -> str:
+    times = sorted(times)
+    return f"median {statistics.median(times):.3f} ms, p99 {times[int(len(times) * 0.99)]:.3f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=200)
+    parser.add_argument("--units", type=int, default=4, help="AMS units per printer (4 slots each)")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    updates, fleet_queries, idle_queries, matched = run(args.printers, args.units, args.queries, args.seed)
+    print(f"{args.printers} printers with {args.units * 4} slots each\n")
+    print(f"update         {summary(updates)} per AMS report")
+    print(f"query fleet    {summary(fleet_queries)}, {matched:.1f} printers matched on average")
+    print(f"query idle     {summary(idle_queries)}")
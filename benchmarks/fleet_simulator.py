@@ -0,0 +1,196 @@
+"""Simulated Bambu printer fleet publishing realistic LAN-mode reports
+
+Each SimulatedPrinter walks through print jobs (PREPARE, RUNNING, the
+occasional PAUSE or FAILED, FINISH, IDLE) and produces the same
+``device/<serial>/report`` payloads as real firmware: a full report for
+every pushall and, once per report interval, a delta with only the
+fields that changed. That covers progress and layers, temperatures
+wandering around their targets, fans, AMS trays running down, and HMS
+errors coming and going.
+
+Run standalone to point a development server at a local fleet:
+
+    python benchmarks/fleet_simulator.py --printers 50
+    # then start the app with the printed LAN_PRINTERS value
+"""
+import argparse
+import asyncio
+import random
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+COLORS = ["00AE42FF", "0A2989FF", "C12E1FFF", "000000FF", "FFFFFFFF", "FFD700FF", "4B0082FF", "808080FF"]
+MATERIALS = ["PLA", "PLA", "PLA", "PETG", "ABS", "TPU"]
+HMS_CODES = [(0x0300_0100, 0x0001_0001), (0x0700_0200, 0x0002_0002), (0x0C00_0300, 0x0003_0003)]
+
+
+def serial_number(i: int) -> str:
+    return f"01S00C{i:09d}"
+
+
+class SimulatedPrinter:
+    """State machine of one printer, advanced once per report"""
+
+    def __init__(self, serial: str, layer_every: int = 5, seed: Optional[int] = None):
+        self.serial = serial
+        self.layer_every = layer_every
+        self.rng = random.Random(seed if seed is not None else serial)
+        self.sequence = 0
+        self.ticks = 0
+        self.state = self.rng.choice(["RUNNING", "RUNNING", "RUNNING", "IDLE"])
+        self.job = 0
+        self.total_layers = 0
+        self.layer = 0
+        self.nozzle = 25.0
+        self.bed = 25.0
+        self.chamber = 25.0
+        self.hms: List[Dict[str, int]] = []
+        self.trays = [
+            {"id": str(i), "tray_color": self.rng.choice(COLORS), "tray_type": self.rng.choice(MATERIALS),
+             "remain": self.rng.randint(10, 100), "tray_temp": "220"}
+            for i in range(4)
+        ]
+        self.active_tray = "0"
+        self.humidity = str(self.rng.randint(1, 5))
+        self.wifi = f"-{self.rng.randint(40, 60)}dBm"
+        self._new_job(started=self.state == "RUNNING")
+        self._last = self._fields()
+
+    def _new_job(self, started: bool):
+        self.job += 1
+        self.total_layers = self.rng.randint(50, 1500)
+        self.layer = self.rng.randint(0, self.total_layers - 1) if started else 0
+        self.active_tray = str(self.rng.randrange(len(self.trays)))
+
+    @property
+    def progress(self) -> int:
+        return int(self.layer * 100 / self.total_layers) if self.total_layers else 0
+
+    @property
+    def targets(self):
+        heating = self.state in ("PREPARE", "RUNNING", "PAUSE")
+        return (220, 60) if heating else (0, 0)
+
+    def _fields(self) -> Dict[str, Any]:
+        nozzle_target, bed_target = self.targets
+        printing = self.state == "RUNNING"
+        return {
+            "gcode_state": self.state,
+            "subtask_name": f"part_{self.serial[-4:]}_{self.job}",
+            "mc_percent": self.progress,
+            "mc_remaining_time": (self.total_layers - self.layer) // 10,
+            "layer_num": self.layer,
+            "total_layer_num": self.total_layers,
+            "nozzle_temper": round(self.nozzle, 1),
+            "nozzle_target_temper": nozzle_target,
+            "bed_temper": round(self.bed, 1),
+            "bed_target_temper": bed_target,
+            "chamber_temper": round(self.chamber, 1),
+            "cooling_fan_speed": "15" if printing else "0",
+            "big_fan1_speed": "10" if printing else "0",
+            "big_fan2_speed": "0",
+            "heatbreak_fan_speed": "15" if self.nozzle > 50 else "0",
+            "print_error": 50348044 if self.state == "FAILED" else 0,
+            "hms": list(self.hms),
+            "wifi_signal": self.wifi,
+        }
+
+    def _ams(self, trays: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"tray_now": self.active_tray, "ams": [{"id": "0", "humidity": self.humidity, "tray": trays}]}
+
+    def step(self):
+        """Advance the simulation by one report interval"""
+        self.ticks += 1
+        nozzle_target, bed_target = self.targets
+        # Heaters approach their target, then hover around it
+        self.nozzle += (max(nozzle_target, 25) - self.nozzle) * 0.3 + self.rng.uniform(-0.6, 0.6)
+        self.bed += (max(bed_target, 25) - self.bed) * 0.2 + self.rng.uniform(-0.2, 0.2)
+        self.chamber += ((35 if nozzle_target else 25) - self.chamber) * 0.01 + self.rng.uniform(-0.1, 0.1)
+        if self.ticks % 30 == 0:
+            self.wifi = f"-{self.rng.randint(40, 60)}dBm"
+
+        if self.state == "PREPARE" and self.nozzle > 200:
+            self.state = "RUNNING"
+        elif self.state == "RUNNING":
+            if self.ticks % self.layer_every == 0:
+                self.layer += 1
+                tray = self.trays[int(self.active_tray)]
+                if self.rng.random() < 0.1:
+                    tray["remain"] = max(0, tray["remain"] - 1)
+            if self.layer >= self.total_layers:
+                self.state = "FINISH"
+            elif self.rng.random() < 0.0005:
+                self.state = "FAILED"
+            elif self.rng.random() < 0.001:
+                self.state = "PAUSE"
+        elif self.state == "PAUSE" and self.rng.random() < 0.05:
+            self.state = "RUNNING"
+        elif self.state in ("FINISH", "FAILED") and self.rng.random() < 0.02:
+            self.state = "IDLE"
+        elif self.state == "IDLE" and self.rng.random() < 0.01:
+            self._new_job(started=False)
+            self.state = "PREPARE"
+
+        if self.hms and self.rng.random() < 0.05:
+            self.hms.pop()
+        elif self.rng.random() < 0.002:
+            attr, code = self.rng.choice(HMS_CODES)
+            self.hms.append({"attr": attr, "code": code})
+
+    def full_report(self) -> Dict[str, Any]:
+        self.sequence += 1
+        self._last = self._fields()
+        return {"print": {
+            "command": "push_status", "sequence_id": str(self.sequence), **self._last,
+            "ams": self._ams([dict(tray) for tray in self.trays]),
+        }}
+
+    def delta_report(self) -> Dict[str, Any]:
+        """Step the simulation and report only what changed, like the firmware does"""
+        trays_before = [dict(tray) for tray in self.trays]
+        active_before = self.active_tray
+        self.step()
+        self.sequence += 1
+        fields = self._fields()
+        report = {"command": "push_status", "sequence_id": str(self.sequence)}
+        report.update({key: value for key, value in fields.items() if self._last.get(key) != value})
+        self._last = fields
+        trays = [
+            {"id": tray["id"], **{k: v for k, v in tray.items() if before.get(k) != v}}
+            for tray, before in zip(self.trays, trays_before) if tray != before
+        ]
+        if trays or self.active_tray != active_before:
+            report["ams"] = self._ams(trays)
+        return {"print": report}
+
+
+def lan_printers_spec(printers: int, host: str, base_port: int, access_code: str) -> str:
+    """LAN_PRINTERS value pointing the app at a simulated fleet"""
+    return ",".join(
+        f"{serial_number(i)}@{host}:{base_port + i}={access_code}" for i in range(printers)
+    )
+
+
+if __name__ == "__main__":
+    from benchmarks.lan_broker import StandInPrinter, make_certificate, serve, server_context
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between reports per printer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=18883)
+    parser.add_argument("--access-code", default="12345678")
+    args = parser.parse_args()
+
+    fleet = [StandInPrinter(serial_number(i), args.access_code, args.interval) for i in range(args.printers)]
+    print(f"LAN_PRINTERS={lan_printers_spec(args.printers, args.host, args.base_port, args.access_code)}")
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(Path(directory))
+        try:
+            asyncio.run(serve(fleet, args.host, args.base_port, server_context(cert, key)))
+        except KeyboardInterrupt:
+            pass
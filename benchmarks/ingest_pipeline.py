@@ -0,0 +1,255 @@
+"""End-to-end load benchmark: simulated printers -> MQTT ingest -> state -> WebSocket
+
+Runs N simulated printers (benchmarks/fleet_simulator.py) behind stand-in
+LAN brokers in a separate process. In this process it runs the real
+MQTTClient, device state store, printer_state publisher and PubSubHub,
+with in-memory WebSocket clients subscribed to the fleet topic. Reports:
+
+    throughput   MQTT messages/s ingested, WebSocket frames/s delivered
+    latency      time from a printer publishing a new layer number until
+                 a WebSocket client is handed the patch (p50/p95/p99/max)
+    CPU          server CPU ms per second and per 1000 messages
+    memory       RSS growth per printer once the fleet is connected
+
+Save a run as the baseline, then compare later runs against it; the exit
+status is non-zero when a metric regresses beyond the tolerance:
+
+    python benchmarks/ingest_pipeline.py --printers 300 --save baseline.json
+    python benchmarks/ingest_pipeline.py --printers 300 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fleet_simulator import SimulatedPrinter, serial_number  # noqa: E402
+from benchmarks.lan_broker import StandInPrinter, make_certificate, serve, server_context  # noqa: E402
+from services import printer_state  # noqa: E402
+from services.device_state import device_states  # noqa: E402
+from services.mqtt_client import MQTTClient, PrinterLink  # noqa: E402
+
+HOST = "127.0.0.1"
+ACCESS_CODE = "12345678"
+# Publish times are kept for the last RING layers of each printer
+RING = 64
+
+# name -> whether a higher value is better
+GATED_METRICS = {
+    "messages_per_second": True,
+    "latency_p95_ms": False,
+    "cpu_ms_per_1000_messages": False,
+    "rss_kib_per_printer": False,
+}
+
+
+def run_brokers(printers: int, base_port: int, interval: float, cert, key, stamps, ready):
+    last_layer: Dict[str, int] = {}
+
+    def on_report(printer: SimulatedPrinter):
+        if last_layer.get(printer.serial) != printer.layer:
+            last_layer[printer.serial] = printer.layer
+            stamps[int(printer.serial[-9:]) * RING + printer.layer % RING] = time.time()
+
+    fleet = [
+        StandInPrinter(serial_number(i), ACCESS_CODE, interval, on_report=on_report)
+        for i in range(printers)
+    ]
+
+    async def main():
+        task = asyncio.create_task(serve(fleet, HOST, base_port, server_context(cert, key)))
+        await asyncio.sleep(0.5)
+        ready.set()
+        await task
+
+    asyncio.run(main())
+
+
+class BenchmarkWebSocket:
+    """Just enough of starlette's WebSocket for PubSubHub"""
+
+    def __init__(self, record: bool):
+        self.scope = {"subprotocols": []}
+        self.record = record
+        self.frames = 0
+        self.bytes = 0
+        self.received: List[Tuple[float, str]] = []
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames += 1
+        self.bytes += len(data)
+        if self.record:
+            # Decoded after the run so it does not count as server CPU
+            self.received.append((time.time(), data))
+
+    async def send_bytes(self, data: bytes):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def layer_updates(message: dict):
+    """(serial, layer) pairs carried by a fleet patch"""
+    for op in message.get("ops", []):
+        parts = op["path"].split("/")[1:]
+        value = op.get("value")
+        if len(parts) == 3 and parts[1:] == ["current_job", "layer"]:
+            yield parts[0], value
+        elif len(parts) == 2 and parts[1] == "current_job" and value:
+            yield parts[0], value.get("layer")
+        elif len(parts) == 1 and value and value.get("current_job"):
+            yield parts[0], value["current_job"].get("layer")
+
+
+def rss_kib() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def benchmark(args, stamps) -> Dict[str, float]:
+    hub, publisher = printer_state.hub, printer_state.publisher
+    sockets = [BenchmarkWebSocket(record=i == 0) for i in range(args.clients)]
+    for websocket in sockets:
+        await hub.connect(websocket)
+        await publisher.subscribe(websocket, "fleet")
+    publisher_task = asyncio.create_task(publisher.run())
+
+    client = MQTTClient(connect_stagger=0.01)
+    links = [PrinterLink(serial_number(i), HOST, ACCESS_CODE, args.base_port + i) for i in range(args.printers)]
+    serials = {link.serial for link in links}
+    rss_before = rss_kib()
+    await client.start(links)
+    if not await wait_for(lambda: serials <= device_states.states.keys(), args.printers * 0.01 + 60):
+        raise RuntimeError("Not every simulated printer reported in time")
+    await asyncio.sleep(args.warmup)
+
+    received = client.counters["received"]
+    frames = sum(websocket.frames for websocket in sockets)
+    sockets[0].received.clear()
+    cpu, start = time.process_time(), time.monotonic()
+    await asyncio.sleep(args.seconds)
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    messages = client.counters["received"] - received
+    frames = sum(websocket.frames for websocket in sockets) - frames
+    rss_after = rss_kib()
+    metrics = client.metrics()
+
+    await client.stop()
+    publisher_task.cancel()
+    for websocket in sockets:
+        hub.disconnect(websocket)
+
+    latencies = []
+    for received_at, data in sockets[0].received:
+        for serial, layer in layer_updates(json.loads(data)):
+            if layer is None or serial not in serials:
+                continue
+            published_at = stamps[int(serial[-9:]) * RING + layer % RING]
+            if published_at:
+                latencies.append((received_at - published_at) * 1000)
+    latencies.sort()
+    if not latencies:
+        raise RuntimeError("No layer changes reached the WebSocket clients")
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        "printers": args.printers,
+        "clients": args.clients,
+        "messages_per_second": messages / elapsed,
+        "frames_per_second": frames / elapsed,
+        "latency_samples": len(latencies),
+        "latency_p50_ms": statistics.median(latencies),
+        "latency_p95_ms": percentile(0.95),
+        "latency_p99_ms": percentile(0.99),
+        "latency_max_ms": latencies[-1],
+        "cpu_ms_per_second": cpu / elapsed * 1000,
+        "cpu_ms_per_1000_messages": cpu * 1000 / messages * 1000 if messages else 0.0,
+        "rss_kib_per_printer": (rss_after - rss_before) / args.printers,
+        "dropped": metrics["dropped"],
+        "parse_errors": metrics["parse_errors"],
+    }
+
+
+def report(result: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> bool:
+    print(f"{result['printers']} printers, {result['clients']} WebSocket clients, "
+          f"{result['latency_samples']} latency samples\n")
+    if baseline and (baseline.get("printers"), baseline.get("clients")) != (result["printers"], result["clients"]):
+        print("warning: baseline was recorded with a different fleet size or client count\n")
+    ok = True
+    for name, value in result.items():
+        if name in ("printers", "clients", "latency_samples"):
+            continue
+        line = f"{name:<28}{value:>12,.2f}"
+        if name in GATED_METRICS and name in baseline and baseline[name]:
+            change = value / baseline[name] - 1
+            higher_is_better = GATED_METRICS[name]
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            line += f"{change:>+10.1%}  {'REGRESSION' if regressed else 'ok'}"
+            ok = ok and not regressed
+        print(line)
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=300)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between reports per printer")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--base-port", type=int, default=18883)
+    parser.add_argument("--save", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="compare against results saved earlier")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(Path(directory))
+        stamps = multiprocessing.Array("d", args.printers * RING, lock=False)
+        ready = multiprocessing.Event()
+        brokers = multiprocessing.Process(
+            target=run_brokers,
+            args=(args.printers, args.base_port, args.interval, cert, key, stamps, ready),
+            daemon=True
+        )
+        brokers.start()
+        ready.wait()
+        try:
+            result = asyncio.run(benchmark(args, stamps))
+        finally:
+            brokers.terminate()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else {}
+    ok = report(result, baseline, args.tolerance)
+    if args.save:
+        args.save.write_text(json.dumps(result, indent=2))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,179 @@
+"""Minimal stand-in for the MQTT broker built into a Bambu printer in LAN mode
+
+Speaks just enough MQTT 3.1.1 over TLS for MQTTClient: CONNECT with the
+bblp user and the access code, SUBSCRIBE, PUBLISH at QoS 0, PINGREQ and
+DISCONNECT. Subscribers to ``device/<serial>/report`` receive a full
+report after each pushall request and a delta every ``report_interval``
+seconds, both produced by benchmarks/fleet_simulator.py. A ``mute``
+printer keeps the session alive but never reports, which is how a wedged
+printer looks to the health check.
+"""
+import asyncio
+import json
+import ssl
+import subprocess
+import struct
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from benchmarks.fleet_simulator import SimulatedPrinter
+
+CONNECT, CONNACK, PUBLISH, SUBSCRIBE, SUBACK = 1, 2, 3, 8, 9
+UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 10, 11, 12, 13, 14
+
+
+def make_certificate(directory: Path) -> Tuple[Path, Path]:
+    """Create a throwaway self-signed certificate like the printers use"""
+    cert, key = directory / "printer.crt", directory / "printer.key"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=stand-in-printer", "-keyout", str(key), "-out", str(cert)],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+def server_context(cert: Path, key: Path) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def _string(data: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", data, offset)
+    start = offset + 2
+    return data[start:start + length].decode(), start + length
+
+
+def _packet(kind: int, body: bytes, flags: int = 0) -> bytes:
+    header = bytearray([kind << 4 | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(header) + body
+
+
+def publish_packet(topic: str, payload: bytes) -> bytes:
+    encoded = topic.encode()
+    return _packet(PUBLISH, struct.pack("!H", len(encoded)) + encoded + payload)
+
+
+async def _read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    first = (await reader.readexactly(1))[0]
+    length, shift = 0, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return first >> 4, first & 0x0F, await reader.readexactly(length)
+
+
+class StandInPrinter:
+    """One simulated printer and its broker
+
+    ``on_report`` is called with the SimulatedPrinter after every report
+    sent, e.g. to record when a value was published.
+    """
+
+    def __init__(
+        self,
+        serial: str,
+        access_code: str,
+        report_interval: float = 1.0,
+        mute: bool = False,
+        on_report: Optional[Callable[[SimulatedPrinter], None]] = None
+    ):
+        self.serial = serial
+        self.access_code = access_code
+        self.report_interval = report_interval
+        self.mute = mute
+        self.on_report = on_report
+        self.printer = SimulatedPrinter(serial)
+
+    @property
+    def report_topic(self) -> str:
+        return f"device/{self.serial}/report"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        reporter: Optional[asyncio.Task] = None
+        try:
+            kind, _, body = await _read_packet(reader)
+            if kind != CONNECT or not self._authorized(body):
+                writer.write(_packet(CONNACK, b"\x00\x05"))
+                return
+            writer.write(_packet(CONNACK, b"\x00\x00"))
+
+            while True:
+                kind, flags, body = await _read_packet(reader)
+                if kind == SUBSCRIBE:
+                    topics, offset = [], 2
+                    while offset < len(body):
+                        topic, offset = _string(body, offset)
+                        topics.append(topic)
+                        offset += 1  # requested QoS
+                    writer.write(_packet(SUBACK, body[:2] + b"\x00" * len(topics)))
+                    if self.report_topic in topics and reporter is None and not self.mute:
+                        reporter = asyncio.create_task(self._report(writer))
+                elif kind == PUBLISH:
+                    _, offset = _string(body, 0)
+                    if (flags >> 1) & 3:
+                        offset += 2  # packet id; QoS > 0 is acknowledged implicitly
+                    if b"pushall" in body[offset:] and not self.mute:
+                        self._send(writer, self.printer.full_report())
+                elif kind == UNSUBSCRIBE:
+                    writer.write(_packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP, b""))
+                elif kind == DISCONNECT:
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            if reporter:
+                reporter.cancel()
+            writer.close()
+
+    def _authorized(self, body: bytes) -> bool:
+        _, offset = _string(body, 0)  # protocol name
+        flags = body[offset + 1]
+        _, offset = _string(body, offset + 4)  # client id
+        if flags & 0x04:  # will topic and message
+            _, offset = _string(body, offset)
+            _, offset = _string(body, offset)
+        username = password = None
+        if flags & 0x80:
+            username, offset = _string(body, offset)
+        if flags & 0x40:
+            password, offset = _string(body, offset)
+        return username == "bblp" and password == self.access_code
+
+    def _send(self, writer: asyncio.StreamWriter, report: dict):
+        writer.write(publish_packet(self.report_topic, json.dumps(report).encode()))
+        if self.on_report:
+            self.on_report(self.printer)
+
+    async def _report(self, writer: asyncio.StreamWriter):
+        # Printers are not synchronized with each other
+        await asyncio.sleep(self.printer.rng.uniform(0, self.report_interval))
+        while not writer.is_closing():
+            self._send(writer, self.printer.delta_report())
+            await writer.drain()
+            await asyncio.sleep(self.report_interval)
+
+
+async def serve(printers: List[StandInPrinter], host: str, base_port: int, context: ssl.SSLContext):
+    """Listen for each printer on consecutive ports until cancelled"""
+    servers = [
+        await asyncio.start_server(printer.handle, host, base_port + i, ssl=context)
+        for i, printer in enumerate(printers)
+    ]
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for server in servers:
+            server.close()
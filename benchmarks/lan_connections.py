@@ -0,0 +1,144 @@
+"""Load-test the per-printer LAN connection pool against local stand-in brokers
+
+Starts N stand-in printers (benchmarks/lan_broker.py) in a separate
+process, plus a few muted printers and some addresses where nothing
+listens. It then runs MQTTClient against all of them and reports:
+
+    startup      time until every live printer is connected and has sent
+                 its full report, and the client CPU spent on it
+    steady state client CPU ms/s and messages/s while printers report
+    health       muted printers detected as stale, dead printers whose
+                 circuit breaker opened
+
+Usage:
+    python benchmarks/lan_connections.py --printers 300 --seconds 20
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fleet_simulator import serial_number as serial  # noqa: E402
+from benchmarks.lan_broker import StandInPrinter, make_certificate, serve, server_context  # noqa: E402
+from services.device_state import device_states  # noqa: E402
+from services.mqtt_client import CircuitBreaker, MQTTClient, PrinterLink  # noqa: E402
+
+HOST = "127.0.0.1"
+ACCESS_CODE = "12345678"
+
+
+def run_brokers(printers: int, muted: int, base_port: int, interval: float, cert, key, ready):
+    fleet = [
+        StandInPrinter(serial(i), ACCESS_CODE, interval, mute=i >= printers)
+        for i in range(printers + muted)
+    ]
+
+    async def main():
+        task = asyncio.create_task(serve(fleet, HOST, base_port, server_context(cert, key)))
+        await asyncio.sleep(0.5)
+        ready.set()
+        await task
+
+    asyncio.run(main())
+
+
+async def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def benchmark(args):
+    live = [PrinterLink(serial(i), HOST, ACCESS_CODE, args.base_port + i) for i in range(args.printers)]
+    muted = [
+        PrinterLink(serial(i), HOST, ACCESS_CODE, args.base_port + i)
+        for i in range(args.printers, args.printers + args.muted)
+    ]
+    # Nothing listens on these ports
+    dead_port = args.base_port + args.printers + args.muted
+    dead = [PrinterLink(f"DEAD{i:04d}", HOST, ACCESS_CODE, dead_port + i) for i in range(args.dead)]
+
+    client = MQTTClient(
+        min_backoff=0.2,
+        max_backoff=2.0,
+        connect_stagger=args.stagger,
+        max_concurrent_connects=args.concurrency,
+        stale_after=args.stale_after,
+        failure_threshold=3,
+        reset_timeout=60.0
+    )
+    live_serials = {link.serial for link in live}
+
+    cpu, start = time.process_time(), time.monotonic()
+    await client.start(live + muted + dead)
+    connected = await wait_for(
+        lambda: all(client.connections[s].client for s in live_serials), args.printers * args.stagger + 60
+    )
+    connect_time, connect_cpu = time.monotonic() - start, time.process_time() - cpu
+    reported = await wait_for(lambda: live_serials <= device_states.states.keys(), 30)
+    startup_time, startup_cpu = time.monotonic() - start, time.process_time() - cpu
+
+    received, cpu = client.counters["received"], time.process_time()
+    await asyncio.sleep(args.seconds)
+    steady_cpu = (time.process_time() - cpu) / args.seconds * 1000
+    rate = (client.counters["received"] - received) / args.seconds
+
+    # Muted printers go stale after 2 * stale_after
+    await wait_for(lambda: client.counters["stale"] >= args.muted, args.stale_after * 3)
+    now = time.monotonic()
+    open_circuits = sum(
+        1 for link in dead if client.connections[link.serial].breaker.state(now) == CircuitBreaker.OPEN
+    )
+    metrics = client.metrics()
+    await client.stop()
+
+    print(f"{args.printers} live, {args.muted} muted, {args.dead} dead printers; "
+          f"stagger {args.stagger}s, {args.concurrency} concurrent connects\n")
+    print(f"connected        {'yes' if connected else 'NO'} in {connect_time:.2f}s ({connect_cpu:.2f}s CPU)")
+    print(f"full reports     {'yes' if reported else 'NO'} in {startup_time:.2f}s ({startup_cpu:.2f}s CPU)")
+    print(f"steady state     {rate:,.0f} msg/s, {steady_cpu:.1f} CPU ms/s "
+          f"({steady_cpu / args.printers:.3f} per printer)")
+    print(f"stale sessions   {metrics['stale']} (expected >= {args.muted})")
+    print(f"open circuits    {open_circuits}/{args.dead}")
+    print(f"dropped          {metrics['dropped']}, parse errors {metrics['parse_errors']}")
+    return connected and reported and metrics["stale"] >= args.muted and open_circuits == args.dead
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=300)
+    parser.add_argument("--muted", type=int, default=5)
+    parser.add_argument("--dead", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between delta reports")
+    parser.add_argument("--stagger", type=float, default=0.01)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stale-after", type=float, default=3.0)
+    parser.add_argument("--base-port", type=int, default=18883)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(Path(directory))
+        ready = multiprocessing.Event()
+        brokers = multiprocessing.Process(
+            target=run_brokers,
+            args=(args.printers, args.muted, args.base_port, args.interval, cert, key, ready),
+            daemon=True
+        )
+        brokers.start()
+        ready.wait()
+        try:
+            ok = asyncio.run(benchmark(args))
+        finally:
+            brokers.terminate()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,130 @@
+"""Measure print queue planning for a simulated fleet
+
+Builds a fleet with random AMS contents and models, and a queue of jobs
+copied from a set of files with random colors, sizes, priorities and
+deadlines, then reports the time to:
+
+    submit      queue one job
+    plan burst  assign work when a share of the fleet goes idle at once
+    plan one    assign work when a single printer becomes idle
+    cancel      remove a queued job
+
+Usage:
+    python benchmarks/scheduler.py --printers 200 --jobs 5000 --files 300
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.filament_index import COLORS, MATERIALS, random_trays  # noqa: E402
+from services.filament_index import FilamentIndex, Requirement  # noqa: E402
+from services.scheduler import SERIAL_PREFIXES, Scheduler  # noqa: E402
+
+
+async def no_dispatch(assignment):
+    pass
+
+
+def random_file(rng: random.Random):
+    requirements = [
+        Requirement(rng.choice(MATERIALS), rng.choice(COLORS), rng.uniform(5, 150))
+        for _ in range(rng.choice([1, 1, 1, 2, 2, 3, 4]))
+    ]
+    size = (rng.uniform(20, 250), rng.uniform(20, 250), rng.uniform(5, 250))
+    return requirements, size, rng.randint(10, 900)
+
+
+def ms(began: float) -> float:
+    return (time.perf_counter() - began) * 1000
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    index = FilamentIndex()
+    printers = {}
+    prefixes = list(SERIAL_PREFIXES)
+    for i in range(args.printers):
+        printer_id = f"{rng.choice(prefixes)}{i:012d}"
+        index.set_trays(printer_id, random_trays(rng, args.units))
+        printers[printer_id] = {"status": "printing"}
+    scheduler = Scheduler(index=index, printers=printers, dispatch=no_dispatch)
+
+    files = [random_file(rng) for _ in range(args.files)]
+    now = datetime.now(timezone.utc)
+    submits = []
+    for i in range(args.jobs):
+        file_index = rng.randrange(args.files)
+        requirements, size, minutes = files[file_index]
+        began = time.perf_counter()
+        scheduler.submit(
+            f"file{file_index}", f"file{file_index}.3mf", requirements,
+            size=size, estimated_minutes=minutes,
+            quantity=rng.choice([1, 1, 1, 2, 5]),
+            priority=rng.choice([0, 0, 0, 1, 2]),
+            deadline=now + timedelta(hours=rng.randint(1, 72)) if rng.random() < 0.3 else None,
+            models=[rng.choice(list(SERIAL_PREFIXES.values()))] if rng.random() < 0.1 else None
+        )
+        submits.append(ms(began))
+
+    bursts, singles, assigned = [], [], 0
+    fleet = list(printers)
+    for _ in range(args.rounds):
+        for printer_id in rng.sample(fleet, int(len(fleet) * args.idle_share)):
+            printers[printer_id]["status"] = "idle"
+        began = time.perf_counter()
+        assignments = scheduler.plan()
+        bursts.append(ms(began))
+        assigned += len(assignments)
+        for assignment in assignments:
+            printers[assignment.printer_id]["status"] = "printing"
+            del scheduler.assignments[assignment.printer_id]
+
+        printer_id = rng.choice(fleet)
+        printers[printer_id]["status"] = "idle"
+        began = time.perf_counter()
+        assignments = scheduler.plan()
+        singles.append(ms(began))
+        for assignment in assignments:
+            printers[assignment.printer_id]["status"] = "printing"
+            del scheduler.assignments[assignment.printer_id]
+        # Printers with nothing they can print stay idle
+        for state in printers.values():
+            state["status"] = "printing"
+
+    cancels = []
+    for job_id in rng.sample(list(scheduler.jobs), min(500, len(scheduler.jobs))):
+        began = time.perf_counter()
+        scheduler.cancel(job_id)
+        cancels.append(ms(began))
+    return submits, bursts, singles, cancels, assigned, len(scheduler.jobs)
+
+
+def summary(times) -> str:
+    times = sorted(times)
+    return f"median {statistics.median(times):.3f} ms, p99 {times[int(len(times) * 0.99)]:.3f} ms"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=200)
+    parser.add_argument("--units", type=int, default=1, help="AMS units per printer (4 slots each)")
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--idle-share", type=float, default=0.25, help="share of the fleet idle in a burst")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    submits, bursts, singles, cancels, assigned, left = run(args)
+    print(f"{args.printers} printers, {args.jobs} jobs from {args.files} files\n")
+    print(f"submit       {summary(submits)}")
+    print(f"plan burst   {summary(bursts)} with {int(args.printers * args.idle_share)} idle printers")
+    print(f"plan one     {summary(singles)}")
+    print(f"cancel       {summary(cancels)}")
+    print(f"assigned     {assigned} prints over {args.rounds} rounds, {left} jobs still queued")
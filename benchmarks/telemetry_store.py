@@ -0,0 +1,84 @@
+"""Measure the telemetry store's cost on the event loop and its storage footprint
+
+Feeds simulated printers into a scratch database and replays hours of
+1 Hz sampling as fast as possible, reporting:
+
+    sample       event-loop time per 1 s tick for the whole fleet
+    flush        worker-thread time to write one minute of chunks
+    query        time to read an hour at 1 s and a day at 1 min
+    storage      database bytes per printer-hour
+
+Usage:
+    python benchmarks/telemetry_store.py --printers 200 --hours 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+async def run(printers: int, hours: float):
+    from benchmarks.fleet_simulator import SimulatedPrinter, serial_number
+    from core.database import init_db
+    from services.device_state import device_states
+    from services.telemetry import TelemetryStore
+
+    init_db()
+    fleet = [SimulatedPrinter(serial_number(i)) for i in range(printers)]
+    for printer in fleet:
+        await device_states.apply(printer.serial, printer.full_report())
+
+    store = TelemetryStore({1: 6 * 3600, 60: 7 * 86400, 3600: 365 * 86400})
+    start = int(time.time() - hours * 3600)
+    start -= start % 3600
+    ticks, flushes = [], []
+    for second in range(int(hours * 3600)):
+        for printer in fleet:
+            printer.step()
+            state = device_states.get(printer.serial)
+            state.nozzle_temp, state.bed_temp = printer.nozzle, printer.bed
+            state.progress, state.layer = printer.progress, printer.layer
+            state.last_report = start + second
+        began = time.perf_counter()
+        store.sample(start + second)
+        ticks.append(time.perf_counter() - began)
+        if second % 60 == 59:
+            began = time.perf_counter()
+            await store.flush()
+            flushes.append(time.perf_counter() - began)
+
+    end = start + int(hours * 3600)
+    began = time.perf_counter()
+    await store.query(fleet[0].serial, end - 3600, end, resolution=1)
+    hour_query = time.perf_counter() - began
+    began = time.perf_counter()
+    await store.query(fleet[0].serial, end - 86400, end, resolution=60)
+    day_query = time.perf_counter() - began
+    return ticks, flushes, hour_query, day_query
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=200)
+    parser.add_argument("--hours", type=float, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = Path(directory) / "telemetry.db"
+        os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+        ticks, flushes, hour_query, day_query = asyncio.run(run(args.printers, args.hours))
+        size = database.stat().st_size
+
+    ticks.sort()
+    print(f"{args.printers} printers, {args.hours:g} hours at 1 Hz\n")
+    print(f"sample tick    median {statistics.median(ticks) * 1000:.2f} ms, "
+          f"p99 {ticks[int(len(ticks) * 0.99)] * 1000:.2f} ms on the event loop")
+    print(f"flush          median {statistics.median(flushes) * 1000:.1f} ms per minute, in a worker thread")
+    print(f"query          1 h at 1 s: {hour_query * 1000:.1f} ms, 1 day at 1 min: {day_query * 1000:.1f} ms")
+    print(f"storage        {size / args.printers / args.hours / 1024:.1f} KiB per printer-hour")
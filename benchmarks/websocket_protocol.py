@@ -0,0 +1,119 @@
+"""Compare WebSocket bandwidth and server CPU for dashboard update encodings
+
+Simulates a printer fleet whose progress, temperatures and AMS levels
+change every second and measures, per dashboard client:
+
+    full-json        the original protocol: whole fleet as JSON every second
+    patch-json       versioned JSON patches (StatePublisher/TopicState)
+    patch-msgpack    the same patches as MessagePack
+    ... +deflate     with permessage-deflate (per-connection zlib context)
+
+Usage:
+    python benchmarks/websocket_protocol.py --printers 200 --clients 40 --seconds 60
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import zlib
+from copy import deepcopy
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.connections import Message  # noqa: E402
+from services.fleet_state import TopicState  # noqa: E402
+
+COLORS = ["#00AE42", "#0A2989", "#C12E1F", "#000000", "#FFFFFF", "#FFD700", "#4B0082", "#808080"]
+
+
+def make_fleet(printers: int, rng: random.Random) -> dict:
+    fleet = {}
+    for i in range(printers):
+        fleet[f"printer{i + 1}"] = {
+            "name": f"Printer {i + 1}",
+            "status": rng.choice(["printing", "printing", "idle", "paused"]),
+            "current_job": {"name": f"part_{i}.3mf", "progress": rng.randint(0, 100)},
+            "temperatures": {"nozzle": 220.0, "bed": 60.0, "chamber": 35.0},
+            "ams": {"slots": [
+                {"color": rng.choice(COLORS), "remaining": rng.randint(5, 100)} for _ in range(4)
+            ]},
+        }
+    return fleet
+
+
+def tick(fleet: dict, rng: random.Random):
+    """Advance the simulation by one second"""
+    for printer in fleet.values():
+        if printer["status"] != "printing":
+            continue
+        printer["temperatures"]["nozzle"] = round(220 + rng.uniform(-1.5, 1.5), 1)
+        printer["temperatures"]["bed"] = round(60 + rng.uniform(-0.5, 0.5), 1)
+        if rng.random() < 0.1:
+            job = printer["current_job"]
+            job["progress"] = min(100, job["progress"] + 1)
+        if rng.random() < 0.02:
+            slot = rng.choice(printer["ams"]["slots"])
+            slot["remaining"] = max(0, slot["remaining"] - 1)
+
+
+def run(printers: int, clients: int, seconds: int, seed: int):
+    rng = random.Random(seed)
+    fleet = make_fleet(printers, rng)
+    frames = []
+    for _ in range(seconds):
+        tick(fleet, rng)
+        frames.append(deepcopy(fleet))
+
+    results = []
+    for name, encoding, deflate, full in (
+        ("full-json", "json", False, True),
+        ("full-json+deflate", "json", True, True),
+        ("patch-json", "json", False, False),
+        ("patch-json+deflate", "json", True, False),
+        ("patch-msgpack", "msgpack", False, False),
+        ("patch-msgpack+deflate", "msgpack", True, False),
+    ):
+        compressors = [zlib.compressobj(wbits=-zlib.MAX_WBITS) for _ in range(clients)]
+        state = TopicState("fleet")
+        state.update(frames[0])
+        sent = 0
+        start = time.process_time()
+        for frame in frames[1:]:
+            if full:
+                # The original endpoint serialized once per client per second
+                payloads = [json.dumps(frame) for _ in range(clients)]
+            else:
+                message = state.update(frame)
+                if message is None:
+                    continue
+                data = message.encode(encoding)
+                payloads = [data] * clients
+            for payload, compressor in zip(payloads, compressors):
+                raw = payload.encode() if isinstance(payload, str) else payload
+                if deflate:
+                    raw = compressor.compress(raw) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                sent += len(raw)
+        cpu = time.process_time() - start
+        intervals = len(frames) - 1
+        results.append((name, sent / intervals / clients, cpu / intervals * 1000))
+
+    baseline_bytes, baseline_cpu = results[0][1], results[0][2]
+    print(f"{printers} printers, {clients} clients, {seconds}s simulated\n")
+    print(f"{'protocol':<24}{'bytes/s/client':>16}{'vs full':>10}{'server CPU ms/s':>18}{'vs full':>10}")
+    for name, per_client, cpu_ms in results:
+        print(
+            f"{name:<24}{per_client:>16,.0f}{per_client / baseline_bytes:>10.1%}"
+            f"{cpu_ms:>18.2f}{cpu_ms / baseline_cpu:>10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--printers", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    run(args.printers, args.clients, args.seconds, args.seed)
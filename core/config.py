@@ -2,8 +2,30 @@ import os
 
 class Settings:
     def __init__(self):
-        self.mqtt_host = os.getenv("MQTT_HOST", "mqtt.bambulab.com")
-        self.mqtt_port = int(os.getenv("MQTT_PORT", "8883"))
         self.cert_path = os.getenv("CERT_PATH")
+        # Printers reached directly in LAN mode: "SERIAL@HOST[:PORT]=ACCESS_CODE,..."
+        self.lan_printers = os.getenv("LAN_PRINTERS", "")
+        self.mqtt_queue_size = int(os.getenv("MQTT_QUEUE_SIZE", "10000"))
+        self.mqtt_connect_concurrency = int(os.getenv("MQTT_CONNECT_CONCURRENCY", "16"))
+        self.mqtt_connect_stagger = float(os.getenv("MQTT_CONNECT_STAGGER_SECONDS", "0.05"))
+        self.mqtt_stale_seconds = float(os.getenv("MQTT_STALE_SECONDS", "30"))
+        self.telemetry_raw_retention_hours = float(os.getenv("TELEMETRY_RAW_RETENTION_HOURS", "6"))
+        self.telemetry_minute_retention_days = float(os.getenv("TELEMETRY_MINUTE_RETENTION_DAYS", "7"))
+        self.telemetry_hour_retention_days = float(os.getenv("TELEMETRY_HOUR_RETENTION_DAYS", "365"))
+        self.telemetry_flush_seconds = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "60"))
+        self.database_url = os.getenv("DATABASE_URL", "sqlite:///data/pandaherd.db")
+        self.library_path = os.getenv("LIBRARY_PATH", "data/library")
+        self.max_upload_bytes = int(os.getenv("MAX_UPLOAD_BYTES", str(1024 * 1024 * 1024)))
+        self.analysis_workers = int(os.getenv("ANALYSIS_WORKERS", "2"))
+        self.analysis_max_pending = int(os.getenv("ANALYSIS_MAX_PENDING", "16"))
+        self.analysis_cache_max_bytes = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        # Fill an empty inventory with demo spools on startup, for development
+        self.demo_data = os.getenv("DEMO_DATA", "").lower() in ("1", "true", "yes")
+        # Spools at or below this percentage count as low stock
+        self.filament_low_stock_pct = float(os.getenv("FILAMENT_LOW_STOCK_PCT", "20"))
+        self.qr_cache_size = int(os.getenv("QR_CACHE_SIZE", "1024"))
+        self.label_workers = int(os.getenv("LABEL_WORKERS", "2"))
+        self.ws_queue_size = int(os.getenv("WS_QUEUE_SIZE", "64"))
+        self.ws_max_lag_seconds = float(os.getenv("WS_MAX_LAG_SECONDS", "10"))
 
 settings = Settings()
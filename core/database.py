@@ -1,10 +1,17 @@
+from pathlib import Path
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
-from pandaherd.core.config import settings
+from core.config import settings
+
+# SQLite connections are shared between the event loop and worker threads
+url = make_url(settings.database_url)
+connect_args = {"check_same_thread": False} if url.get_backend_name() == "sqlite" else {}
 
 # Create engine
-engine = create_engine(settings.database_url)
+engine = create_engine(settings.database_url, connect_args=connect_args)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -12,6 +19,18 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create declarative base
 Base = declarative_base()
 
+def init_db():
+    """Create any missing tables"""
+    if url.get_backend_name() == "sqlite" and url.database:
+        Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+    
+    # Import models so they register with Base.metadata
+    import models.inventory  # noqa: F401
+    import models.library  # noqa: F401
+    import models.telemetry  # noqa: F401
+    
+    Base.metadata.create_all(bind=engine)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,19 +1,30 @@
-from fastapi import FastAPI, Request, WebSocket, HTTPException, File, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Response, WebSocket, HTTPException, Depends, Query
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+from datetime import datetime, timedelta
 import json
-from typing import List
+from typing import List, Optional
 import asyncio
 from fastapi import WebSocketDisconnect
 from version import VERSION
-from routers import printers, jobs
-import qrcode
-import qrcode.image.svg
-import base64
-from io import BytesIO
-from services.analyzer import ThreeMFAnalyzer
+from routers import printers, jobs, library, filament as filament_router
+from urllib.parse import quote
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.database import SessionLocal, get_db, init_db
+from services.filament_index import filament_index
+from services.filament_usage import file_filaments, usage_tracker
+from services.scheduler import scheduler
+from services.inventory import InventoryRepository, load_views
+from services.library import LibraryRepository
+from services import printer_state
+from services.mqtt_client import get_mqtt_client, parse_lan_printers
+from services.telemetry import get_telemetry_store
+from services.connections import Message
+from services.labels import LabelLayout, LabelRenderer
+from services.qrcodes import MEDIA_TYPES, generate_qr_code, qr_etag, render_qr_code, spool_qr_data
 
 app = FastAPI(
     title="PandaHerd",
@@ -34,73 +45,135 @@ templates = Jinja2Templates(directory=str(templates_dir))
 # Include routers
 app.include_router(printers.router)
 app.include_router(jobs.router)
-
-def generate_qr_code(data: str, size: int = 10) -> str:
-    """Generate QR code as base64 SVG
-    
-    Args:
-        data: String to encode in QR code
-        size: Size of QR code in cm
-        
-    Returns:
-        Base64 encoded SVG string
-    """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=size,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-
-    # Create SVG image
-    img = qr.make_image(image_factory=qrcode.image.svg.SvgImage)
-    
-    # Convert to base64
-    buffer = BytesIO()
-    img.save(buffer)
-    
-    # Return as base64 data URL
-    svg_base64 = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/svg+xml;base64,{svg_base64}"
+app.include_router(library.router)
+app.include_router(filament_router.router)
 
 @app.get("/api/qrcode")
-async def get_qr_code(data: str, size: int = 10):
+async def get_qr_code(data: str, size: int = Query(10, ge=1, le=50), format: str = "svg"):
     """Generate QR code for any data
     
     Args:
         data: String to encode
-        size: Size in cm (default: 10)
+        size: Module size in pixels (default: 10)
+        format: svg or png
     """
     try:
-        qr_code = generate_qr_code(data, size)
+        qr_code = generate_qr_code(data, size, format)
         return {"qr_code": qr_code}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+def _spool_qr_url(spool_id: str, size: int = 10, format: str = "svg") -> str:
+    return f"/api/filament/{quote(spool_id)}/qr/image?size={size}&format={format}"
+
+@app.get("/api/filament/qr")
+async def get_spool_qr_codes(
+    spool_id: List[str] = Query([], description="Spools to include (default: all)"),
+    size: int = Query(10, ge=1, le=50),
+    format: str = Query("svg", pattern="^(svg|png)$"),
+    inline: bool = Query(True, description="Return data URLs instead of image URLs"),
+    db: Session = Depends(get_db)
+):
+    """Get QR codes for many spools at once, keyed by spool ID"""
+    known = [s.id for s in InventoryRepository(db).search(spool_ids=spool_id)]
+    ids = spool_id or known
+    missing = [i for i in ids if i not in set(known)]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Spools not found: {', '.join(missing)}")
+
+    if inline:
+        qr_codes = {i: generate_qr_code(spool_qr_data(i), size, format) for i in ids}
+    else:
+        qr_codes = {i: _spool_qr_url(i, size, format) for i in ids}
+    return {"qr_codes": qr_codes}
+
 # Example for filament spool QR codes
 @app.get("/api/filament/{spool_id}/qr")
-async def get_spool_qr(spool_id: str):
+async def get_spool_qr(
+    spool_id: str,
+    size: int = Query(10, ge=1, le=50),
+    format: str = Query("svg", pattern="^(svg|png)$"),
+    db: Session = Depends(get_db)
+):
     """Get QR code for a filament spool
     
     The QR code contains a URL to quickly access the spool's weight update page:
     pandaherd://filament/spool/{id}/weight
     """
-    spool = next((s for s in MOCK_FILAMENT if s["id"] == spool_id), None)
-    if not spool:
+    if InventoryRepository(db).get(spool_id) is None:
         raise HTTPException(status_code=404, detail="Spool not found")
         
-    # Generate URL for spool weight update
-    data = f"pandaherd://filament/spool/{spool_id}/weight"
-    qr_code = generate_qr_code(data)
-    
+    data = spool_qr_data(spool_id)
     return {
-        "qr_code": qr_code,
+        "qr_code": generate_qr_code(data, size, format),
+        "url": _spool_qr_url(spool_id, size, format),
         "data": data
     }
 
-# Mock data for filament inventory
+@app.get("/api/filament/{spool_id}/qr/image")
+async def get_spool_qr_image(
+    spool_id: str,
+    request: Request,
+    size: int = Query(10, ge=1, le=50),
+    format: str = Query("svg", pattern="^(svg|png)$"),
+    db: Session = Depends(get_db)
+):
+    """Serve a spool's QR code as a cacheable image"""
+    if InventoryRepository(db).get(spool_id) is None:
+        raise HTTPException(status_code=404, detail="Spool not found")
+
+    data = spool_qr_data(spool_id)
+    etag = qr_etag(data, size, format)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(render_qr_code(data, size, format), media_type=MEDIA_TYPES[format], headers=headers)
+
+label_renderer = LabelRenderer(max_workers=settings.label_workers)
+
+@app.get("/api/filament/labels")
+async def get_spool_labels(
+    spool_id: List[str] = Query([], description="Spools to include (default: all matching the filters)"),
+    material: Optional[str] = None,
+    brand: Optional[str] = None,
+    max_remaining_pct: Optional[float] = Query(None, ge=0, le=100),
+    format: str = Query("pdf", pattern="^(pdf|png)$"),
+    page: int = Query(1, ge=1, description="Page to render for png"),
+    page_size: str = Query("A4", pattern="^(A4|Letter)$"),
+    columns: int = Query(3, ge=1, le=10),
+    rows: int = Query(8, ge=1, le=30),
+    margin_mm: float = Query(8.0, ge=0, le=50),
+    dpi: int = Query(200, ge=72, le=600),
+    db: Session = Depends(get_db)
+):
+    """Printable sheet of QR labels for a filtered set of spools
+
+    PDF sheets are streamed page by page as they are rendered; png returns a
+    single page of the sheet.
+    """
+    spools = [
+        s.to_dict() for s in InventoryRepository(db).search(
+            spool_ids=spool_id, material=material, brand=brand, max_remaining_pct=max_remaining_pct
+        )
+    ]
+    if not spools:
+        raise HTTPException(status_code=404, detail="No spools match the given filters")
+
+    layout = LabelLayout(page_size=page_size, columns=columns, rows=rows, margin_mm=margin_mm, dpi=dpi)
+
+    if format == "png":
+        if page > label_renderer.page_count(spools, layout):
+            raise HTTPException(status_code=404, detail="Page out of range")
+        image = await label_renderer.render_page(spools, layout, page - 1)
+        return Response(image, media_type="image/png")
+
+    return StreamingResponse(
+        label_renderer.stream_pdf(spools, layout),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="spool-labels.pdf"'}
+    )
+
+# Demo spools added to an empty inventory on startup
 MOCK_FILAMENT = [
     {
         "id": "RFID-01234567",  # This would come from the AMS RFID reader
@@ -112,9 +185,9 @@ MOCK_FILAMENT = [
         "remaining_pct": 92,
         "initial_weight_g": 1000,
         "empty_spool_g": 250,
-        "printer": "Printer 1",
+        "printer": "printer1",
         "slot": 1,
-        "last_used": "2 hours ago"
+        "last_used_at": datetime.utcnow() - timedelta(hours=2)
     },
     {
         "id": "RFID-89ABCDEF",
@@ -126,9 +199,9 @@ MOCK_FILAMENT = [
         "remaining_pct": 78,
         "initial_weight_g": 1000,
         "empty_spool_g": 250,
-        "printer": "Printer 1",
+        "printer": "printer1",
         "slot": 2,
-        "last_used": "1 day ago"
+        "last_used_at": datetime.utcnow() - timedelta(days=1)
     },
     {
         "id": "RFID-12345678",
@@ -140,9 +213,9 @@ MOCK_FILAMENT = [
         "remaining_pct": 45,
         "initial_weight_g": 1000,
         "empty_spool_g": 250,
-        "printer": "Printer 1",
+        "printer": "printer1",
         "slot": 3,
-        "last_used": "3 days ago"
+        "last_used_at": datetime.utcnow() - timedelta(days=3)
     },
     {
         "id": "RFID-90123456",
@@ -154,9 +227,9 @@ MOCK_FILAMENT = [
         "remaining_pct": 88,
         "initial_weight_g": 500,
         "empty_spool_g": 250,
-        "printer": "Printer 1",
+        "printer": "printer1",
         "slot": 4,
-        "last_used": "1 week ago"
+        "last_used_at": datetime.utcnow() - timedelta(weeks=1)
     },
     {
         "id": "RFID-11111111",
@@ -170,7 +243,7 @@ MOCK_FILAMENT = [
         "empty_spool_g": 180,
         "printer": None,
         "slot": None,
-        "last_used": "2 weeks ago"
+        "last_used_at": datetime.utcnow() - timedelta(weeks=2)
     },
     {
         "id": "RFID-22222222",
@@ -184,184 +257,16 @@ MOCK_FILAMENT = [
         "empty_spool_g": 180,
         "printer": None,
         "slot": None,
-        "last_used": "1 month ago"
+        "last_used_at": datetime.utcnow() - timedelta(days=30)
     }
 ]
 
-# Mock data for 3MF library
-MOCK_FILES = [
-    {
-        "id": "file-001",
-        "name": "benchy.3mf",
-        "category": "Calibration",
-        "uploaded": "2 hours ago",
-        "size": "12.5 MB",
-        "print_time": "2h 15m",
-        "material": "PLA",
-        "thumbnail": None,
-        "dimensions": {
-            "width": 60.0,
-            "depth": 31.0,
-            "height": 48.0
-        },
-        "volume_cm3": 15.8,
-        "vertices": 27644,
-        "triangles": 55288,
-        "print_settings": {
-            "layer_height": "0.2",
-            "infill_density": "20",
-            "nozzle_temperature": "215",
-            "bed_temperature": "60",
-            "supports": "none",
-            "adhesion_type": "brim"
-        },
-        "estimated_material_grams": 18.9,
-        "bambu_metadata": {
-            "ams_mapping": [
-                {
-                    "ams_slot": 0,
-                    "type": "PLA",
-                    "color": "#FF0000",
-                    "temperature": 215,
-                    "weight_used": 18.9,
-                    "name": "Red PLA"
-                }
-            ],
-            "plate_info": {
-                "plate_type": "smooth",
-                "bed_temp": 60,
-                "chamber_temp": 0,
-                "first_layer_bed_temp": 60
-            },
-            "print_params": {
-                "layer_height": 0.2,
-                "initial_layer_height": 0.2,
-                "perimeters": 3,
-                "infill_density": 20,
-                "support_type": "normal",
-                "enable_support": False,
-                "brim_type": "brim",
-                "brim_width": 5
-            }
-        }
-    },
-    {
-        "id": "file-002",
-        "name": "phone_stand.3mf",
-        "category": "Functional",
-        "uploaded": "1 day ago",
-        "size": "24.8 MB",
-        "print_time": "4h 30m",
-        "material": "PETG",
-        "thumbnail": None,
-        "dimensions": {
-            "width": 85.0,
-            "depth": 120.0,
-            "height": 75.0
-        },
-        "volume_cm3": 45.2,
-        "vertices": 42156,
-        "triangles": 84312,
-        "print_settings": {
-            "layer_height": "0.2",
-            "infill_density": "30",
-            "nozzle_temperature": "240",
-            "bed_temperature": "80",
-            "supports": "minimal",
-            "adhesion_type": "skirt"
-        },
-        "estimated_material_grams": 54.2,
-        "bambu_metadata": {
-            "ams_mapping": [
-                {
-                    "ams_slot": 1,
-                    "type": "PETG",
-                    "color": "#000000",
-                    "temperature": 240,
-                    "weight_used": 54.2,
-                    "name": "Black PETG"
-                }
-            ],
-            "plate_info": {
-                "plate_type": "textured",
-                "bed_temp": 80,
-                "chamber_temp": 0,
-                "first_layer_bed_temp": 85
-            },
-            "print_params": {
-                "layer_height": 0.2,
-                "initial_layer_height": 0.2,
-                "perimeters": 4,
-                "infill_density": 30,
-                "support_type": "normal",
-                "enable_support": True,
-                "brim_type": "skirt",
-                "brim_width": 0
-            }
-        }
-    },
-    {
-        "id": "file-003",
-        "name": "vase_mode.3mf",
-        "category": "Decorative",
-        "uploaded": "3 days ago",
-        "size": "8.2 MB",
-        "print_time": "1h 45m",
-        "material": "PLA",
-        "thumbnail": None,
-        "dimensions": {
-            "width": 100.0,
-            "depth": 100.0,
-            "height": 150.0
-        },
-        "volume_cm3": 8.5,
-        "vertices": 15422,
-        "triangles": 30844,
-        "print_settings": {
-            "layer_height": "0.2",
-            "infill_density": "0",
-            "nozzle_temperature": "210",
-            "bed_temperature": "60",
-            "supports": "none",
-            "adhesion_type": "brim",
-            "special_mode": "spiralize"
-        },
-        "estimated_material_grams": 10.2,
-        "bambu_metadata": {
-            "ams_mapping": [
-                {
-                    "ams_slot": 2,
-                    "type": "PLA",
-                    "color": "#00FF00",
-                    "temperature": 210,
-                    "weight_used": 10.2,
-                    "name": "Green PLA"
-                }
-            ],
-            "plate_info": {
-                "plate_type": "smooth",
-                "bed_temp": 60,
-                "chamber_temp": 0,
-                "first_layer_bed_temp": 65
-            },
-            "print_params": {
-                "layer_height": 0.2,
-                "initial_layer_height": 0.2,
-                "perimeters": 2,
-                "infill_density": 0,
-                "support_type": "none",
-                "enable_support": False,
-                "brim_type": "brim",
-                "brim_width": 3
-            }
-        }
-    }
-]
-
-# Mock data - in real app this would come from MQTT
-MOCK_PRINTERS = {
+# Mock data - in real app this would come from MQTT via printer_state.update_printer_state
+MOCK_PRINTERS = printer_state.printers
+MOCK_PRINTERS.update({
     "printer1": {
         "name": "Printer 1",
+        "model": "X1C",
         "status": "printing",
         "current_job": {
             "name": "benchy.3mf",
@@ -378,6 +283,7 @@ MOCK_PRINTERS = {
     },
     "printer2": {
         "name": "Printer 2",
+        "model": "P1S",
         "status": "paused",
         "current_job": {
             "name": "calibration_cube.3mf",
@@ -394,6 +300,7 @@ MOCK_PRINTERS = {
     },
     "printer3": {
         "name": "Printer 3",
+        "model": "A1 mini",
         "status": "idle",
         "current_job": None,
         "ams": {
@@ -405,35 +312,49 @@ MOCK_PRINTERS = {
             ]
         }
     }
-}
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+})
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+for printer_id, printer in MOCK_PRINTERS.items():
+    filament_index.set_dashboard_trays(printer_id, printer.get("ams"))
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-manager = ConnectionManager()
+# Data owned here is published on its own topics
+printer_state.publisher.register("jobs", lambda _: {i: j.model_dump() for i, j in jobs.MOCK_JOBS.items()})
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    """Publish state on the topics a client subscribes to
+
+    Client messages:
+        {"type": "subscribe", "topics": ["fleet", "printer/printer1"]}
+        {"type": "unsubscribe", "topics": [...]}
+        {"type": "resync", "topic": "fleet"}  # after missing a version
+
+    Each subscription starts with a snapshot, followed by patches as the
+    topic changes. Messages are JSON text unless the client requested the
+    "pandaherd.msgpack" subprotocol, in which case they are MessagePack
+    binary frames; client messages are always JSON.
+    """
+    hub = printer_state.hub
+    await hub.connect(websocket)
     try:
         while True:
-            # In a real app, this would be updated from MQTT
-            await websocket.send_json(MOCK_PRINTERS)
-            await asyncio.sleep(1)
+            message = await websocket.receive_json()
+            if message.get("type") == "resync":
+                topics = [message.get("topic")]
+            else:
+                topics = message.get("topics") or []
+
+            for topic in topics:
+                if not isinstance(topic, str) or not printer_state.publisher.is_topic(topic):
+                    hub.send(websocket, Message({"type": "error", "detail": f"Unknown topic: {topic}"}))
+                elif message.get("type") == "unsubscribe":
+                    hub.unsubscribe(websocket, topic)
+                elif message.get("type") in ("subscribe", "resync"):
+                    await printer_state.publisher.subscribe(websocket, topic)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        hub.disconnect(websocket)
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -450,132 +371,100 @@ async def root(request: Request):
     )
 
 @app.get("/filament", response_class=HTMLResponse)
-async def filament(request: Request):
+async def filament(request: Request, db: Session = Depends(get_db)):
     """Filament inventory page"""
-    # Generate QR codes for each spool
-    spools_with_qr = []
-    for spool in MOCK_FILAMENT:
-        spool_copy = dict(spool)
-        spool_copy["qr_code"] = generate_qr_code(spool["id"])
-        spools_with_qr.append(spool_copy)
-    
-    total_weight = sum(spool["remaining_pct"] / 100 * (spool["initial_weight_g"] - spool["empty_spool_g"]) 
-                      for spool in MOCK_FILAMENT)
-    low_stock = [s for s in MOCK_FILAMENT if s["remaining_pct"] <= 20]
+    repo = InventoryRepository(db)
+    # QR codes are fetched by the browser from the cacheable image endpoint
+    spools_with_qr = [
+        dict(
+            spool.to_dict(),
+            printer=MOCK_PRINTERS.get(spool.printer_id, {}).get("name", spool.printer_id),
+            qr_url=_spool_qr_url(spool.id)
+        )
+        for spool in repo.search()
+    ]
+    summary = repo.summary()
     
     return templates.TemplateResponse(
         "filament.html",
         {
             "request": request,
             "spools": spools_with_qr,
-            "total_spools": len(MOCK_FILAMENT),
-            "total_weight": round(total_weight, 1),
-            "low_stock_count": len(low_stock),
+            "total_spools": summary["total_spools"],
+            "total_weight": round(summary["total_weight"] / 1000, 2),
+            "low_stock_count": summary["low_stock_count"],
             "version": VERSION,
             "active_page": "filament"
         }
     )
 
 @app.get("/library", response_class=HTMLResponse)
-async def library(request: Request):
-    """3MF file library page"""
+async def library_page(
+    request: Request,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """3MF file library page
+
+    Only the first page of files is rendered; "Load more" requests the next
+    page of this view with the returned cursor.
+    """
+    library_repo = LibraryRepository(db)
+    try:
+        files, next_cursor = library_repo.search(query=q, category=category, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return templates.TemplateResponse(
         "library.html",
         {
             "request": request,
-            "files": MOCK_FILES,
+            "files": [f.to_dict() for f in files],
+            "next_cursor": next_cursor,
+            "query": q or "",
+            "category": category or "",
+            "categories": library_repo.categories(),
             "printers": MOCK_PRINTERS.values(),
             "version": VERSION,
             "active_page": "library"
         }
     )
 
-@app.get("/api/filament")
-async def get_filament():
-    """API endpoint for filament inventory"""
-    return {
-        "spools": MOCK_FILAMENT,
-        "total_spools": len(MOCK_FILAMENT),
-        "total_weight": round(sum(spool["remaining_pct"] / 100 * (spool["initial_weight_g"] - spool["empty_spool_g"]) for spool in MOCK_FILAMENT), 1),
-        "low_stock_count": len([s for s in MOCK_FILAMENT if s["remaining_pct"] <= 20])
-    }
-
-@app.post("/api/filament/{spool_id}/weight")
-async def update_spool_weight(spool_id: str, total_weight_g: float):
-    """Update spool weight and recalculate remaining percentage"""
-    spool = next((s for s in MOCK_FILAMENT if s["id"] == spool_id), None)
-    if not spool:
-        raise HTTPException(status_code=404, detail="Spool not found")
-    
-    if total_weight_g < spool["empty_spool_g"]:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Total weight ({total_weight_g}g) cannot be less than empty spool weight ({spool['empty_spool_g']}g)"
-        )
-    
-    # Calculate remaining percentage based on weight
-    filament_weight = total_weight_g - spool["empty_spool_g"]
-    max_filament = spool["initial_weight_g"] - spool["empty_spool_g"]
-    spool["remaining_pct"] = round((filament_weight / max_filament) * 100)
-    
-    return spool
+@app.get("/api/mqtt/connections")
+async def mqtt_connections():
+    """Connection and circuit breaker state of every LAN printer"""
+    client = get_mqtt_client()
+    return {"metrics": client.metrics(), "printers": client.connection_status()}
 
-@app.post("/api/library/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload a 3MF file to the library"""
-    if not file.filename.endswith('.3mf'):
-        raise HTTPException(status_code=400, detail="Only .3MF files are allowed")
-    
-    # Read file content
-    content = await file.read()
-    
-    # Analyze the file
-    try:
-        with ThreeMFAnalyzer(file_content=content) as analyzer:
-            analysis = analyzer.analyze()
-            
-            # Create mock file entry with analysis data
-            new_file = {
-                "id": f"file-{len(MOCK_FILES) + 1:03d}",
-                "name": file.filename,
-                "category": "Uncategorized",
-                "uploaded": "Just now",
-                "size": f"{len(content) / 1024 / 1024:.1f} MB",
-                "print_time": analysis['model_info'].get('estimated_print_time', 'Unknown'),
-                "material": analysis['print_settings'].get('material', 'PLA'),
-                "thumbnail": analysis.get('thumbnail'),
-                "dimensions": analysis['model_info'].get('dimensions', {}),
-                "volume_cm3": analysis['model_info'].get('volume_cm3', 0),
-                "vertices": analysis['model_info'].get('vertices', 0),
-                "triangles": analysis['model_info'].get('triangles', 0),
-                "print_settings": analysis['print_settings'],
-                "bambu_metadata": analysis.get('bambu_metadata', {})
-            }
-            
-            MOCK_FILES.append(new_file)
-            return new_file
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to analyze file: {str(e)}")
+@app.on_event("startup")
+async def startup():
+    init_db()
+    with SessionLocal() as db:
+        if settings.demo_data:
+            InventoryRepository(db).seed(MOCK_FILAMENT)
+        load_views(db)
+    library.analysis_executor.start()
+    label_renderer.start()
+    app.state.publisher_task = asyncio.create_task(printer_state.publisher.run())
+    get_telemetry_store().start()
+    scheduler.start()
+    await get_mqtt_client().start(parse_lan_printers(settings.lan_printers))
 
-@app.get("/api/library/{file_id}/analysis")
-async def get_file_analysis(file_id: str):
-    """Get detailed analysis of a file"""
-    file = next((f for f in MOCK_FILES if f["id"] == file_id), None)
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    return {
-        "dimensions": file.get("dimensions", {}),
-        "volume_cm3": file.get("volume_cm3", 0),
-        "vertices": file.get("vertices", 0),
-        "triangles": file.get("triangles", 0),
-        "print_settings": file.get("print_settings", {})
-    }
+@app.on_event("shutdown")
+async def shutdown():
+    library.analysis_executor.shutdown()
+    app.state.publisher_task.cancel()
+    await get_mqtt_client().stop()
+    await get_telemetry_store().stop()
+    await scheduler.stop()
+    label_renderer.shutdown()
 
 @app.post("/api/library/print")
-async def start_print(file_id: str, printer_id: str):
+async def start_print(file_id: str, printer_id: str, db: Session = Depends(get_db)):
     """Start printing a file on a specific printer"""
-    file = next((f for f in MOCK_FILES if f["id"] == file_id), None)
+    file = LibraryRepository(db).get(file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
@@ -587,20 +476,12 @@ async def start_print(file_id: str, printer_id: str):
         raise HTTPException(status_code=400, detail="Printer is already printing")
     
     # Mock print start
+    usage_tracker.expect(printer_id, file.name, file_filaments(file))
     printer["status"] = "printing"
     printer["current_job"] = {
-        "name": file["name"],
+        "name": file.name,
         "progress": 0
     }
+    await printer_state.publisher.sync()
     
     return {"status": "success"}
-
-@app.delete("/api/library/{file_id}")
-async def delete_file(file_id: str):
-    """Delete a file from the library"""
-    file = next((f for f in MOCK_FILES if f["id"] == file_id), None)
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Mock file deletion
-    return {"status": "success"}
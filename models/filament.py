@@ -1,6 +1,8 @@
+from array import array
 from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from pydantic import BaseModel, Field, GetCoreSchemaHandler, PrivateAttr
+from pydantic_core import core_schema
 
 class FilamentUsage(BaseModel):
     """Record of filament usage from a print job"""
@@ -10,14 +12,80 @@ class FilamentUsage(BaseModel):
     purge_tower_grams: float = 0.0
     notes: Optional[str] = None
 
+class UsageRecord(BaseModel):
+    """Filament used from one spool, as submitted for bulk recording"""
+    spool_id: str
+    job_name: str
+    grams_used: float = Field(ge=0)
+    purge_tower_grams: float = Field(default=0.0, ge=0)
+    timestamp: Optional[datetime] = None  # Defaults to the time of recording
+    notes: Optional[str] = None
+
 class SpoolWeight(BaseModel):
     """Manual weight measurement of a spool"""
     timestamp: datetime
     total_weight_g: float  # Total weight including spool
     notes: Optional[str] = None
 
+class UsageLog:
+    """Usage records of one spool stored column by column
+
+    Timestamps are kept as Unix seconds and read back as naive local
+    time, like the datetime.now() that record_usage stamps them with.
+    Notes are rare, so only the records that have one store it. Reads as
+    and serializes to a list of FilamentUsage.
+    """
+    __slots__ = ("timestamps", "grams_used", "purge_tower_grams", "job_names", "notes")
+
+    def __init__(self, records: Iterable[FilamentUsage] = ()):
+        self.timestamps = array("d")
+        self.grams_used = array("d")
+        self.purge_tower_grams = array("d")
+        self.job_names: List[str] = []
+        self.notes: Dict[int, str] = {}
+        for record in records:
+            self.append(record.timestamp, record.job_name, record.grams_used,
+                        record.purge_tower_grams, record.notes)
+
+    def append(self, timestamp: datetime, job_name: str, grams_used: float,
+               purge_tower_grams: float = 0.0, notes: Optional[str] = None):
+        if notes is not None:
+            self.notes[len(self.job_names)] = notes
+        self.timestamps.append(timestamp.timestamp())
+        self.grams_used.append(grams_used)
+        self.purge_tower_grams.append(purge_tower_grams)
+        self.job_names.append(job_name)
+
+    def __len__(self) -> int:
+        return len(self.job_names)
+
+    def __getitem__(self, index: int) -> FilamentUsage:
+        index = range(len(self))[index]
+        return FilamentUsage(
+            timestamp=datetime.fromtimestamp(self.timestamps[index]),
+            job_name=self.job_names[index],
+            grams_used=self.grams_used[index],
+            purge_tower_grams=self.purge_tower_grams[index],
+            notes=self.notes.get(index)
+        )
+
+    def __iter__(self) -> Iterator[FilamentUsage]:
+        return (self[i] for i in range(len(self)))
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        records = handler.generate_schema(List[FilamentUsage])
+        return core_schema.union_schema(
+            [core_schema.is_instance_schema(cls), core_schema.no_info_after_validator_function(cls, records)],
+            serialization=core_schema.plain_serializer_function_ser_schema(list, return_schema=records)
+        )
+
 class FilamentSpool(BaseModel):
-    """Represents a filament spool in an AMS slot"""
+    """Represents a filament spool in an AMS slot
+
+    Running totals are kept up to date by record_usage and record_weight,
+    so remaining weight does not depend on the length of the history.
+    """
     id: str
     name: str
     material: str  # PLA, PETG, etc.
@@ -25,20 +93,46 @@ class FilamentSpool(BaseModel):
     brand: str
     initial_weight_g: float = Field(default=1000.0)  # Usually 1kg
     empty_spool_weight_g: float = Field(default=250.0)  # Typical empty spool weight
-    usage_history: List[FilamentUsage] = Field(default_factory=list)
+    usage_history: UsageLog = Field(default_factory=UsageLog)
     weight_measurements: List[SpoolWeight] = Field(default_factory=list)
-    
+
+    _total_used_g: float = PrivateAttr(default=0.0)
+    _total_purge_g: float = PrivateAttr(default=0.0)
+    # Filament and purge recorded after the latest weight measurement
+    _used_since_weight_g: float = PrivateAttr(default=0.0)
+
+    def model_post_init(self, __context: Any):
+        """Rebuild the running totals from the stored history"""
+        log = self.usage_history
+        since = self.weight_measurements[-1].timestamp.timestamp() if self.weight_measurements else None
+        for timestamp, grams, purge in zip(log.timestamps, log.grams_used, log.purge_tower_grams):
+            self._total_used_g += grams
+            self._total_purge_g += purge
+            if since is None or timestamp > since:
+                self._used_since_weight_g += grams + purge
+
+    @property
+    def total_used_g(self) -> float:
+        """Filament used by prints over the spool's life, excluding purge"""
+        return self._total_used_g
+
+    @property
+    def total_purge_g(self) -> float:
+        """Filament spent on purge towers over the spool's life"""
+        return self._total_purge_g
+
     def get_remaining_weight(self) -> float:
-        """Calculate remaining filament weight"""
+        """Calculate remaining filament weight
+
+        Usage recorded after the most recent manual weight measurement is
+        taken off that measurement; without one, all usage is taken off
+        the initial weight.
+        """
         if self.weight_measurements:
-            # Use the most recent manual weight measurement
-            latest_weight = self.weight_measurements[-1].total_weight_g
-            return max(0.0, latest_weight - self.empty_spool_weight_g)
+            start = self.weight_measurements[-1].total_weight_g - self.empty_spool_weight_g
         else:
-            # Calculate based on usage history
-            total_used = sum(usage.grams_used + usage.purge_tower_grams 
-                           for usage in self.usage_history)
-            return max(0.0, self.initial_weight_g - total_used)
+            start = self.initial_weight_g
+        return max(0.0, start - self._used_since_weight_g)
     
     def get_remaining_percentage(self) -> float:
         """Calculate remaining filament percentage"""
@@ -48,14 +142,10 @@ class FilamentSpool(BaseModel):
     def record_usage(self, job_name: str, grams_used: float, 
                     purge_tower_grams: float = 0.0, notes: Optional[str] = None):
         """Record filament usage from a print job"""
-        usage = FilamentUsage(
-            timestamp=datetime.now(),
-            job_name=job_name,
-            grams_used=grams_used,
-            purge_tower_grams=purge_tower_grams,
-            notes=notes
-        )
-        self.usage_history.append(usage)
+        self.usage_history.append(datetime.now(), job_name, grams_used, purge_tower_grams, notes)
+        self._total_used_g += grams_used
+        self._total_purge_g += purge_tower_grams
+        self._used_since_weight_g += grams_used + purge_tower_grams
     
     def record_weight(self, total_weight_g: float, notes: Optional[str] = None):
         """Record a manual weight measurement"""
@@ -71,3 +161,4 @@ class FilamentSpool(BaseModel):
             notes=notes
         )
         self.weight_measurements.append(measurement)
+        self._used_since_weight_g = 0.0
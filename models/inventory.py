@@ -0,0 +1,109 @@
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String
+
+from core.database import Base
+from models.library import _time_ago
+
+
+class Spool(Base):
+    """A filament spool in the inventory
+
+    remaining_g and the usage totals are kept up to date by
+    InventoryRepository as usage and weighings are recorded, so listings
+    and aggregates never have to read the history tables.
+    """
+    __tablename__ = "spools"
+
+    id = Column(String, primary_key=True)  # AMS RFID tag or a user-chosen id
+    name = Column(String, nullable=False)
+    brand = Column(String, nullable=False, default="", index=True)
+    material = Column(String, nullable=False, index=True)
+    color = Column(String(7), nullable=False, index=True)  # Normalized "#RRGGBB"
+    color_name = Column(String)
+    initial_weight_g = Column(Float, nullable=False, default=1000.0)  # Filament on a full spool
+    empty_spool_weight_g = Column(Float, nullable=False, default=250.0)
+    remaining_g = Column(Float, nullable=False)
+    remaining_pct = Column(Float, nullable=False, index=True)
+    total_used_g = Column(Float, nullable=False, default=0.0)
+    total_purge_g = Column(Float, nullable=False, default=0.0)
+    printer_id = Column(String)  # Printer and AMS slot the spool is loaded in, if any
+    slot = Column(Integer)  # 1-based across AMS units: unit * 4 + tray + 1
+    last_used_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_spools_printer_slot", "printer_id", "slot"),
+    )
+
+    def set_remaining(self, grams: float):
+        self.remaining_g = max(0.0, grams)
+        self.remaining_pct = self.remaining_g / self.initial_weight_g * 100 if self.initial_weight_g else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize in the shape used by the filament page and API"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "brand": self.brand,
+            "material": self.material,
+            "color": self.color,
+            "color_name": self.color_name,
+            "remaining_pct": round(self.remaining_pct, 1),
+            "remaining_g": round(self.remaining_g, 1),
+            "initial_weight_g": self.initial_weight_g,
+            "empty_spool_g": self.empty_spool_weight_g,
+            "total_used_g": round(self.total_used_g, 1),
+            "total_purge_g": round(self.total_purge_g, 1),
+            "printer": self.printer_id,
+            "slot": self.slot,
+            "last_used": _time_ago(self.last_used_at) if self.last_used_at else "Never",
+        }
+
+
+class SpoolUsage(Base):
+    """Filament taken from a spool by one print job"""
+    __tablename__ = "spool_usage"
+
+    id = Column(Integer, primary_key=True)
+    spool_id = Column(String, ForeignKey("spools.id", ondelete="CASCADE"), nullable=False)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    job_name = Column(String, nullable=False)
+    grams_used = Column(Float, nullable=False)
+    purge_tower_grams = Column(Float, nullable=False, default=0.0)
+    notes = Column(String)
+
+    __table_args__ = (
+        Index("ix_spool_usage_spool_timestamp", "spool_id", "timestamp"),
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "job_name": self.job_name,
+            "grams_used": self.grams_used,
+            "purge_tower_grams": self.purge_tower_grams,
+            "notes": self.notes,
+        }
+
+
+class SpoolWeighing(Base):
+    """A manual weight measurement of a spool, including the spool itself"""
+    __tablename__ = "spool_weighings"
+
+    id = Column(Integer, primary_key=True)
+    spool_id = Column(String, ForeignKey("spools.id", ondelete="CASCADE"), nullable=False)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    total_weight_g = Column(Float, nullable=False)
+    notes = Column(String)
+
+    __table_args__ = (
+        Index("ix_spool_weighings_spool_timestamp", "spool_id", "timestamp"),
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "total_weight_g": self.total_weight_g,
+            "notes": self.notes,
+        }
@@ -0,0 +1,110 @@
+from datetime import datetime
+from typing import Any, Dict
+
+from sqlalchemy import (
+    DDL, JSON, Column, DateTime, Float, ForeignKey, Index, Integer, String, event
+)
+from sqlalchemy.orm import relationship
+
+from core.database import Base
+
+
+def _time_ago(timestamp: datetime) -> str:
+    """Format a timestamp relative to now, e.g. "2 hours ago" """
+    seconds = (datetime.utcnow() - timestamp).total_seconds()
+    for unit, length in (("month", 2592000), ("week", 604800), ("day", 86400),
+                         ("hour", 3600), ("minute", 60)):
+        count = int(seconds // length)
+        if count >= 1:
+            return f"{count} {unit}{'s' if count > 1 else ''} ago"
+    return "Just now"
+
+
+class LibraryFile(Base):
+    """A 3MF file in the library together with its analysis results"""
+    __tablename__ = "library_files"
+
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False, index=True)
+    sha256 = Column(String(64), nullable=False, index=True)  # Blob in the analysis cache
+    category = Column(String, nullable=False, default="Uncategorized", index=True)
+    material = Column(String, index=True)
+    uploaded_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    print_time = Column(String)
+    print_time_minutes = Column(Integer, index=True)  # Parsed from print_time for range filters
+    thumbnails = Column(JSON, default=list)  # Plate numbers with a preview image, 0 is the cover
+    width = Column(Float)
+    depth = Column(Float)
+    height = Column(Float)
+    volume_cm3 = Column(Float)
+    vertices = Column(Integer)
+    triangles = Column(Integer)
+    estimated_material_grams = Column(Float)
+    print_settings = Column(JSON, default=dict)
+    bambu_metadata = Column(JSON, default=dict)
+
+    colors = relationship(
+        "LibraryFileColor", cascade="all, delete-orphan", lazy="selectin"
+    )
+
+    __table_args__ = (
+        # Category listings are shown newest first
+        Index("ix_library_files_category_uploaded_at", "category", "uploaded_at"),
+    )
+
+    @property
+    def dimensions(self) -> Dict[str, float]:
+        if self.width is None:
+            return {}
+        return {"width": self.width, "depth": self.depth, "height": self.height}
+
+    def thumbnail_url(self, plate: int, size: str = "medium") -> str:
+        """URL of a resized preview, served from /api/library/thumbnails"""
+        return f"/api/library/thumbnails/{self.sha256}?plate={plate}&size={size}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize in the shape used by the library page and API"""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "sha256": self.sha256,
+            "category": self.category,
+            "uploaded": _time_ago(self.uploaded_at),
+            "uploaded_at": self.uploaded_at.isoformat(),
+            "size": f"{self.size_bytes / 1024 / 1024:.1f} MB",
+            "print_time": self.print_time,
+            "material": self.material,
+            "thumbnail": self.thumbnail_url(self.thumbnails[0]) if self.thumbnails else None,
+            "thumbnails": [
+                {"plate": plate, **{size: self.thumbnail_url(plate, size) for size in ("small", "medium", "large")}}
+                for plate in self.thumbnails or []
+            ],
+            "dimensions": self.dimensions,
+            "volume_cm3": self.volume_cm3,
+            "vertices": self.vertices,
+            "triangles": self.triangles,
+            "estimated_material_grams": self.estimated_material_grams,
+            "print_settings": self.print_settings or {},
+            "bambu_metadata": self.bambu_metadata or {}
+        }
+
+
+class LibraryFileColor(Base):
+    """A filament color used by a library file, for AMS color filters"""
+    __tablename__ = "library_file_colors"
+
+    file_id = Column(String, ForeignKey("library_files.id", ondelete="CASCADE"), primary_key=True)
+    color = Column(String(7), primary_key=True, index=True)  # Normalized "#RRGGBB"
+
+
+# Full-text index over file names and extracted metadata (SQLite only).
+# Rows are maintained by LibraryRepository alongside library_files.
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS library_files_fts "
+        "USING fts5(file_id UNINDEXED, name, keywords)"
+    ).execute_if(dialect="sqlite")
+)
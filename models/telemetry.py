@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, LargeBinary, String
+
+from core.database import Base
+
+
+class TelemetryChunk(Base):
+    """A fixed run of telemetry samples for one printer at one resolution
+
+    ``data`` holds float32 samples laid out field by field (see
+    services.telemetry.TELEMETRY_FIELDS), NaN where nothing was recorded.
+    """
+    __tablename__ = "telemetry_chunks"
+
+    printer_id = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)  # Seconds per sample
+    start = Column(Integer, primary_key=True, index=True)  # Unix time of the first sample
+    data = Column(LargeBinary, nullable=False)
@@ -1,54 +1,139 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, List
-from models.filament import FilamentSpool
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from core.config import settings
+from core.database import get_db
+from models.filament import FilamentSpool, UsageRecord
+from services import printer_state
+from services.inventory import InventoryRepository, spool_views
 
-router = APIRouter(prefix="/filament", tags=["filament"])
+router = APIRouter(prefix="/api/filament", tags=["filament"])
 
-# In-memory storage for filament spools
-spools: Dict[str, FilamentSpool] = {}
+# Published from the copy the repository keeps current, so syncs never query
+printer_state.publisher.register("filament", lambda _: spool_views)
 
-@router.post("/spools/")
-async def create_spool(spool: FilamentSpool):
-    """Create a new filament spool"""
-    spools[spool.id] = spool
-    return spool
+@router.get("")
+async def get_filament(
+    material: Optional[str] = None,
+    color: Optional[str] = None,
+    brand: Optional[str] = None,
+    printer_id: Optional[str] = None,
+    max_remaining_pct: Optional[float] = Query(None, ge=0, le=100),
+    db: Session = Depends(get_db)
+):
+    """Filament inventory, optionally filtered, with totals over all spools"""
+    repo = InventoryRepository(db)
+    spools = repo.search(
+        material=material,
+        color=color,
+        brand=brand,
+        printer_id=printer_id,
+        max_remaining_pct=max_remaining_pct
+    )
+    return {"spools": [s.to_dict() for s in spools], **repo.summary()}
+
+@router.get("/totals")
+async def get_totals(
+    by: str = Query("material", pattern="^(material|color|brand)$"),
+    db: Session = Depends(get_db)
+):
+    """Spool count, filament left and filament used grouped by material, color or brand"""
+    return {"by": by, "totals": InventoryRepository(db).totals(by)}
+
+@router.get("/low-stock")
+async def get_low_stock(
+    threshold: float = Query(settings.filament_low_stock_pct, ge=0, le=100),
+    db: Session = Depends(get_db)
+):
+    """Spools with at most threshold percent left, emptiest first"""
+    return {"threshold": threshold, "spools": [s.to_dict() for s in InventoryRepository(db).low_stock(threshold)]}
+
+@router.post("/spools")
+async def create_spool(
+    spool: FilamentSpool,
+    printer_id: Optional[str] = None,
+    slot: Optional[int] = Query(None, ge=1),
+    color_name: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Add a spool to the inventory"""
+    try:
+        created = InventoryRepository(db).add(spool, printer_id=printer_id, slot=slot, color_name=color_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await printer_state.publisher.sync()
+    return created.to_dict()
 
 @router.get("/spools/{spool_id}")
-async def get_spool(spool_id: str):
+async def get_spool(spool_id: str, db: Session = Depends(get_db)):
     """Get a filament spool by ID"""
-    if spool_id not in spools:
+    spool = InventoryRepository(db).get(spool_id)
+    if spool is None:
         raise HTTPException(status_code=404, detail="Spool not found")
-    return spools[spool_id]
+    return spool.to_dict()
+
+@router.get("/spools/{spool_id}/usage")
+async def get_usage(
+    spool_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = Query(None, description="next_before from the previous page"),
+    db: Session = Depends(get_db)
+):
+    """Usage history of a spool, newest first"""
+    repo = InventoryRepository(db)
+    if repo.get(spool_id) is None:
+        raise HTTPException(status_code=404, detail="Spool not found")
+    records, next_before = repo.usage(spool_id, limit=limit, before=before)
+    return {"usage": [r.to_dict() for r in records], "next_before": next_before}
 
 @router.post("/spools/{spool_id}/usage")
 async def record_usage(
-    spool_id: str, 
+    spool_id: str,
     job_name: str,
     grams_used: float,
     purge_tower_grams: float = 0.0,
-    notes: str = None
+    notes: str = None,
+    db: Session = Depends(get_db)
 ):
     """Record filament usage for a print job"""
-    if spool_id not in spools:
+    try:
+        spool = InventoryRepository(db).record_usage(spool_id, job_name, grams_used, purge_tower_grams, notes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if spool is None:
         raise HTTPException(status_code=404, detail="Spool not found")
-    
-    spool = spools[spool_id]
-    spool.record_usage(job_name, grams_used, purge_tower_grams, notes)
-    return spool
+    await printer_state.publisher.sync()
+    return spool.to_dict()
+
+@router.post("/usage")
+async def record_usage_bulk(records: List[UsageRecord], db: Session = Depends(get_db)):
+    """Record many usage records in one transaction, e.g. for end-of-shift reconciliation
 
+    Either every record is stored or, if any names an unknown spool, none is.
+    Timestamps without a time zone are taken as UTC.
+    """
+    try:
+        spools = await run_in_threadpool(InventoryRepository(db).record_usage_bulk, records)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await printer_state.publisher.sync()
+    return {"recorded": len(records), "spools": len(spools)}
+
+@router.post("/{spool_id}/weight")
 @router.post("/spools/{spool_id}/weight")
 async def record_weight(
     spool_id: str,
     total_weight_g: float,
-    notes: str = None
+    notes: str = None,
+    db: Session = Depends(get_db)
 ):
-    """Record a manual weight measurement for a spool"""
-    if spool_id not in spools:
-        raise HTTPException(status_code=404, detail="Spool not found")
-    
+    """Record a manual weight measurement and recalculate the remaining filament"""
     try:
-        spool = spools[spool_id]
-        spool.record_weight(total_weight_g, notes)
-        return spool
+        spool = InventoryRepository(db).record_weight(spool_id, total_weight_g, notes)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if spool is None:
+        raise HTTPException(status_code=404, detail="Spool not found")
+    await printer_state.publisher.sync()
+    return spool.to_dict()
@@ -1,8 +1,14 @@
 from typing import List
-from fastapi import APIRouter, HTTPException
-from datetime import datetime
-from schemas import PrintJob, PrintJobCreate, PrinterStatus
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+from core.database import get_db
+from schemas import PrintJob, PrintJobCreate, PrinterStatus, QueuedJobCreate
 from routers.printers import MOCK_PRINTERS
+from services.device_state import ChangeSet, device_states
+from services.filament_index import file_requirements
+from services.library import LibraryRepository
+from services.scheduler import scheduler
 
 router = APIRouter(prefix="/api/jobs", tags=["jobs"])
 
@@ -18,6 +24,60 @@ MOCK_JOBS = {
     )
 }
 
+@router.post("/queue")
+async def queue_job(request: QueuedJobCreate, db: Session = Depends(get_db)):
+    """
+    Queue copies of a library file; the scheduler starts them on compatible idle printers.
+    """
+    file = LibraryRepository(db).get(request.file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    deadline = request.deadline
+    if deadline and deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    job = scheduler.submit(
+        file.id,
+        file.name,
+        file_requirements(file),
+        size=(file.width, file.depth, file.height),
+        estimated_minutes=file.print_time_minutes,
+        quantity=request.quantity,
+        priority=request.priority,
+        deadline=deadline,
+        models=request.printer_models
+    )
+    return job.to_dict()
+
+@router.get("/queue")
+async def get_queue(limit: int = Query(100, ge=1, le=1000)):
+    """
+    Queued jobs in the order they will be started, and the prints assigned so far.
+    """
+    return {
+        "total": len(scheduler.jobs),
+        "jobs": [job.to_dict() for job in scheduler.queued(limit)],
+        "assignments": [a.to_dict() for a in scheduler.assignments.values()],
+        "awaiting_clearing": sorted(scheduler.needs_clearing)
+    }
+
+@router.delete("/queue/{job_id}")
+async def cancel_queued_job(job_id: str):
+    """
+    Remove the copies of a queued job that have not been started.
+    """
+    if not scheduler.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Queued job not found")
+    return {"status": "success"}
+
+@router.post("/printers/{printer_id}/cleared")
+async def printer_cleared(printer_id: str):
+    """
+    Confirm a printer's plate was cleared after its last print so it can take queued jobs.
+    """
+    scheduler.mark_cleared(printer_id)
+    return {"status": "success"}
+
 @router.get("/", response_model=List[PrintJob])
 async def list_jobs():
     """
@@ -82,3 +142,13 @@ async def cancel_job(job_id: str):
     
     del MOCK_JOBS[job_id]
     return {"status": "success"}
+
+async def _on_device_change(change: ChangeSet):
+    """Track progress of the job running on a printer from its reports."""
+    if "progress" not in change.fields:
+        return
+    printer = MOCK_PRINTERS.get(change.device_id)
+    if printer and printer.current_job and change.state.progress is not None:
+        printer.current_job.progress = max(0, min(100, change.state.progress))
+
+device_states.add_listener(_on_device_change)
@@ -1,6 +1,17 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+from core.config import settings
+from core.database import SessionLocal, get_db
+from services.analysis_cache import MultipartFileStream, UploadTooLargeError, get_analysis_cache
+from services.analysis_executor import AnalysisExecutor, AnalysisJob, QueueFullError
+from services.filament_index import COLOR_TOLERANCE, file_requirements, filament_index, idle_printers
+from services import printer_state
+from services.library import LibraryRepository
+from services.thumbnails import MEDIA_TYPE, THUMBNAIL_SIZES, get_thumbnail_store
 
 router = APIRouter(
     prefix="/api/library",
@@ -8,70 +19,234 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# Mock data for 3MF library
-MOCK_FILES = [
-    {
-        "id": "file-001",
-        "name": "benchy.3mf",
-        "category": "Calibration",
-        "uploaded": "2 hours ago",
-        "size": "12.5 MB",
-        "print_time": "2h 15m",
-        "material": "PLA",
-        "thumbnail": None
-    },
-    {
-        "id": "file-002",
-        "name": "phone_stand.3mf",
-        "category": "Functional",
-        "uploaded": "1 day ago",
-        "size": "24.8 MB",
-        "print_time": "4h 30m",
-        "material": "PETG",
-        "thumbnail": None
-    },
-    {
-        "id": "file-003",
-        "name": "vase_mode.3mf",
-        "category": "Decorative",
-        "uploaded": "3 days ago",
-        "size": "8.2 MB",
-        "print_time": "1h 45m",
-        "material": "PLA",
-        "thumbnail": None
-    }
-]
+analysis_cache = get_analysis_cache()
+# Room for the form's boundaries and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+thumbnail_store = get_thumbnail_store()
+
+def add_library_file(job: AnalysisJob, analysis: dict) -> dict:
+    """Create a library entry from a finished analysis"""
+    size = analysis_cache.blob_path(job.sha256).stat().st_size
+    with SessionLocal() as db:
+        file = LibraryRepository(db).add_from_analysis(job.filename, job.sha256, size, analysis)
+        return file.to_dict()
+
+def discard_unused_blob(sha256: str):
+    """Remove an uploaded blob no library file uses (callers check pending analyses)"""
+    with SessionLocal() as db:
+        if LibraryRepository(db).has_blob(sha256):
+            return
+    analysis_cache.blob_path(sha256).unlink(missing_ok=True)
+    thumbnail_store.remove(sha256)
+
+analysis_executor = AnalysisExecutor(
+    analysis_cache,
+    add_library_file,
+    max_workers=settings.analysis_workers,
+    max_pending=settings.analysis_max_pending,
+    on_failed=lambda job: discard_unused_blob(job.sha256)
+)
 
 @router.get("")
-async def get_files() -> List[dict]:
-    """Get all files in the library"""
-    return MOCK_FILES
-
-@router.post("/upload")
-async def upload_file(file: UploadFile = File(...)) -> dict:
-    """Upload a 3MF file to the library"""
-    if not file.filename.endswith('.3mf'):
+async def get_files(
+    q: Optional[str] = Query(None, description="Full-text search over names and metadata"),
+    category: Optional[str] = None,
+    material: Optional[str] = None,
+    min_print_minutes: Optional[int] = Query(None, ge=0),
+    max_print_minutes: Optional[int] = Query(None, ge=0),
+    bed_width: Optional[float] = Query(None, gt=0, description="Only files fitting this bed (mm)"),
+    bed_depth: Optional[float] = Query(None, gt=0),
+    bed_height: Optional[float] = Query(None, gt=0),
+    color: List[str] = Query([], description="Filament colors the file must use, e.g. #00AE42"),
+    sort: str = "uploaded_at",
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(24, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+) -> dict:
+    """Search the library one page at a time
+
+    Pass the returned next_cursor back as cursor to fetch the following page.
+    """
+    try:
+        files, next_cursor = LibraryRepository(db).search(
+            query=q,
+            category=category,
+            material=material,
+            min_print_minutes=min_print_minutes,
+            max_print_minutes=max_print_minutes,
+            bed=(bed_width, bed_depth, bed_height),
+            colors=color,
+            sort=sort,
+            descending=order == "desc",
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"files": [f.to_dict() for f in files], "next_cursor": next_cursor}
+
+@router.post("/upload", status_code=202, openapi_extra={
+    "requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": ["file"],
+        "properties": {"file": {"type": "string", "format": "binary"}}
+    }}}}
+})
+async def upload_file(request: Request) -> dict:
+    """Upload a 3MF file to the library as the "file" field of a form
+
+    The body is streamed into the store as it arrives, so oversized or
+    non-3MF uploads are refused before the rest is read. The file is
+    analyzed in a worker process; the returned job can be polled at
+    /api/library/jobs/{job_id} or followed at /api/library/jobs/{job_id}/events.
+    """
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > settings.max_upload_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"File exceeds maximum upload size of {settings.max_upload_bytes} bytes"
+        )
+
+    try:
+        upload = MultipartFileStream(request)
+        await upload.open()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not upload.filename.endswith('.3mf'):
         raise HTTPException(status_code=400, detail="Only .3MF files are allowed")
-    
-    # Mock file save
-    return {"filename": file.filename}
 
-@router.delete("/{file_id}")
-async def delete_file(file_id: str) -> dict:
-    """Delete a file from the library"""
-    file = next((f for f in MOCK_FILES if f["id"] == file_id), None)
+    # Stream the upload into the content-addressed store
+    try:
+        sha256, _ = await analysis_cache.store_stream(upload.chunks(), settings.max_upload_bytes)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Queue analysis (repeat uploads of the same content complete from the cache)
+    try:
+        job = analysis_executor.submit(sha256, upload.filename)
+    except QueueFullError as e:
+        if not analysis_executor.is_pending(sha256):
+            await run_in_threadpool(discard_unused_blob, sha256)
+        raise HTTPException(
+            status_code=503,
+            detail=f"Analysis queue is full: {str(e)}",
+            headers={"Retry-After": "5"}
+        )
+
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str) -> dict:
+    """Get the status of an upload analysis job"""
+    job = analysis_executor.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str):
+    """Stream analysis progress as server-sent events until the job finishes"""
+    if not analysis_executor.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        async for event in analysis_executor.events(job_id):
+            yield f"data: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@router.get("/thumbnails/{sha256}")
+async def get_thumbnail(
+    sha256: str,
+    request: Request,
+    plate: int = Query(0, ge=0),
+    size: str = "medium",
+    db: Session = Depends(get_db)
+):
+    """Serve a resized preview image of a library file
+
+    Thumbnails are addressed by content hash and never change, so clients may
+    cache them indefinitely; If-None-Match is answered with 304.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of: {', '.join(THUMBNAIL_SIZES)}")
+    if not LibraryRepository(db).has_blob(sha256):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    etag = thumbnail_store.etag(sha256, plate, size)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    # Rendered during analysis; regenerate from the blob if it has gone missing
+    path = await run_in_threadpool(
+        thumbnail_store.ensure, sha256, plate, size, analysis_cache.blob_path(sha256)
+    )
+    if path is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return FileResponse(path, media_type=MEDIA_TYPE, headers=headers)
+
+@router.get("/{file_id}/analysis")
+async def get_file_analysis(file_id: str, db: Session = Depends(get_db)) -> dict:
+    """Get detailed analysis of a file"""
+    file = LibraryRepository(db).get(file_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return {
+        "dimensions": file.dimensions,
+        "volume_cm3": file.volume_cm3 or 0,
+        "vertices": file.vertices or 0,
+        "triangles": file.triangles or 0,
+        "print_settings": file.print_settings or {}
+    }
+
+@router.get("/{file_id}/printers")
+async def get_file_printers(
+    file_id: str,
+    idle: bool = Query(True, description="Only printers that are idle now"),
+    tolerance: float = Query(COLOR_TOLERANCE, ge=0, le=442, description="Largest RGB distance between colors"),
+    db: Session = Depends(get_db)
+) -> dict:
+    """Printers with the material and colors the file needs loaded, and enough of each"""
+    file = LibraryRepository(db).get(file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Mock file deletion
-    return {"status": "success"}
 
-@router.post("/print")
-async def start_print(file_id: str, printer_id: str) -> dict:
-    """Start printing a file on a specific printer"""
-    file = next((f for f in MOCK_FILES if f["id"] == file_id), None)
+    requirements = file_requirements(file)
+    matches = filament_index.find_printers(
+        requirements, printer_ids=idle_printers() if idle else None, tolerance=tolerance
+    )
+    return {
+        "file_id": file_id,
+        "requirements": [r.to_dict() for r in requirements],
+        "printers": [
+            {
+                "printer_id": printer_id,
+                "name": printer_state.printers.get(printer_id, {}).get("name", printer_id),
+                "slots": [entry.to_dict() for entry in slots]
+            }
+            for printer_id, slots in sorted(matches.items())
+        ]
+    }
+
+@router.delete("/{file_id}")
+async def delete_file(file_id: str, db: Session = Depends(get_db)) -> dict:
+    """Delete a file from the library"""
+    library = LibraryRepository(db)
+    file = library.get(file_id)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # In real implementation, would check printer status and send file
+
+    sha256 = file.sha256
+    library.delete(file)
+
+    # Blobs are shared between identical uploads; remove only the last reference
+    if not library.has_blob(sha256):
+        analysis_cache.blob_path(sha256).unlink(missing_ok=True)
+        thumbnail_store.remove(sha256)
+
     return {"status": "success"}
@@ -1,7 +1,9 @@
-from typing import List
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
 from datetime import datetime, timedelta
+import time
 from schemas import Printer, PrinterCreate, PrinterStatus, AMSSlot, AMS, PrintJob
+from services.telemetry import RESOLUTIONS, get_telemetry_store
 
 router = APIRouter(prefix="/api/printers", tags=["printers"])
 
@@ -124,3 +126,24 @@ async def stop_printer(printer_id: str):
     printer.status = PrinterStatus.ONLINE
     printer.current_job = None
     return {"status": "success"}
+
+@router.get("/{printer_id}/telemetry")
+async def get_printer_telemetry(
+    printer_id: str,
+    start: Optional[float] = Query(None, description="Unix time, defaults to one hour before end"),
+    end: Optional[float] = Query(None, description="Unix time, defaults to now"),
+    field: List[str] = Query([], description="Fields to return, e.g. nozzle_temp; all by default"),
+    resolution: Optional[int] = Query(None, description=f"Seconds per sample, one of {RESOLUTIONS}")
+):
+    """
+    Get a printer's temperature, fan and progress history as arrays aligned with timestamps.
+    """
+    end = time.time() if end is None else end
+    start = end - 3600 if start is None else start
+    try:
+        result = await get_telemetry_store().query(printer_id, start, end, field, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="No telemetry recorded for this printer")
+    return result
@@ -43,3 +43,10 @@ class PrinterCreate(BaseModel):
 class PrintJobCreate(BaseModel):
     file_name: str = Field(..., description="Name of the file to print")
     printer_id: str = Field(..., description="ID of the printer to use")
+
+class QueuedJobCreate(BaseModel):
+    file_id: str = Field(..., description="Library file to print")
+    quantity: int = Field(1, description="Number of copies", ge=1, le=1000)
+    priority: int = Field(0, description="Higher priorities are printed first")
+    deadline: Optional[datetime] = Field(None, description="When the copies are needed; UTC unless a time zone is given")
+    printer_models: Optional[List[str]] = Field(None, description="Printer models allowed to print it (X1C, P1S, etc)")
@@ -0,0 +1,269 @@
+"""Content-addressed storage for uploaded 3MF files and their analysis"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, AsyncIterable, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from services.analyzer import ANALYZER_VERSION
+
+# Keys of ThreeMFAnalyzer.analyze() that are persisted in the cache
+CACHED_KEYS = ('thumbnails', 'model_info', 'print_settings', 'bambu_metadata')
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Local file header signature; every 3MF is a zip archive
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured maximum size"""
+
+
+class MultipartFileStream:
+    """One file field of a multipart/form-data request, read as the body arrives
+
+    Parsing the form up front would spool the whole body to disk before any
+    check could run; this hands the file's content over chunk by chunk
+    instead. Other fields are skipped.
+    """
+
+    def __init__(self, request: Request, field: str = "file"):
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("Expected a multipart/form-data upload")
+        self.field = field.encode()
+        self.filename: Optional[str] = None
+        self._body = request.stream().__aiter__()
+        self._data: List[bytes] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = self._header_value = b""
+        self._in_file = self._file_done = False
+        self._parser = MultipartParser(options[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    async def open(self):
+        """Read up to the start of the file's content, setting filename
+
+        Raises:
+            ValueError: If the body has no such file field
+        """
+        while self.filename is None:
+            if not await self._feed():
+                raise ValueError(f"Missing file field {self.field.decode()!r}")
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """The file's content; call open() first"""
+        while True:
+            if self._data:
+                data, self._data = b"".join(self._data), []
+                yield data
+            if self._file_done:
+                return
+            if not await self._feed():
+                raise ValueError("Upload ended before the file did")
+
+    async def _feed(self) -> bool:
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._parser.write(chunk)
+        return True
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and options.get(b"name") == self.field and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._file_done = True
+
+
+class AnalysisCache:
+    """Deduplicated 3MF blob store with a size-bounded LRU cache of analysis results
+
+    Files are stored once under ``blobs/`` by SHA-256. Analysis results are
+    stored under ``analysis/`` keyed by content hash and analyzer version, so
+    bumping ``ANALYZER_VERSION`` invalidates stale entries automatically.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.entry_dir = self.root / "analysis"
+        self.tmp_dir = self.root / "tmp"
+        self.max_bytes = max_bytes
+        for directory in (self.blob_dir, self.entry_dir, self.tmp_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # entry name -> size, oldest first
+        self._total_bytes = 0
+
+        # Rebuild LRU order from modification times (touched on every hit)
+        existing = sorted(self.entry_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for path in existing:
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._total_bytes += size
+        self._evict()
+
+    def blob_path(self, sha256: str) -> Path:
+        """Location of the deduplicated file for a content hash"""
+        return self.blob_dir / sha256[:2] / f"{sha256}.3mf"
+
+    async def store_stream(self, chunks: AsyncIterable[bytes], max_bytes: int) -> Tuple[str, int]:
+        """Stream an upload into the blob store, hashing it on the way
+
+        The content is written in UPLOAD_CHUNK_SIZE pieces to a temporary
+        file next to the blobs and renamed into place, so repeat uploads
+        reuse the existing blob and memory use does not depend on the file
+        size. Content that is not a zip archive or grows past max_bytes is
+        rejected as soon as it arrives, before the rest is read.
+
+        Returns:
+            Tuple of (SHA-256 hex digest, size in bytes)
+
+        Raises:
+            ValueError: If the content is not a zip archive
+            UploadTooLargeError: If the upload exceeds max_bytes
+        """
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir, suffix=".upload")
+        tmp_path = Path(tmp_name)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                async for chunk in chunks:
+                    # Reject non-3MF content before writing anything; the
+                    # buffer holds everything so far while the head is short
+                    if size < len(ZIP_MAGIC) and not ZIP_MAGIC.startswith((bytes(buffer) + chunk)[:len(ZIP_MAGIC)]):
+                        raise ValueError("File is not a valid 3MF (zip) archive")
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLargeError(f"File exceeds maximum upload size of {max_bytes} bytes")
+                    buffer += chunk
+                    if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                        await run_in_threadpool(self._write_chunk, out, digest, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await run_in_threadpool(self._write_chunk, out, digest, bytes(buffer))
+
+            if size == 0:
+                raise ValueError("Uploaded file is empty")
+            if size < len(ZIP_MAGIC):
+                raise ValueError("File is not a valid 3MF (zip) archive")
+
+            sha256 = digest.hexdigest()
+            path = self.blob_path(sha256)
+            if path.exists():
+                tmp_path.unlink()
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+            return sha256, size
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _write_chunk(out: BinaryIO, digest, chunk: bytes):
+        digest.update(chunk)
+        out.write(chunk)
+
+    def _entry_name(self, sha256: str) -> str:
+        return f"{sha256}-v{ANALYZER_VERSION}.json"
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Return the cached analysis for a content hash, or None on a miss"""
+        name = self._entry_name(sha256)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+
+        path = self.entry_dir / name
+        try:
+            analysis = json.loads(path.read_text())
+            os.utime(path)
+        except (OSError, ValueError):
+            self._discard(name)
+            return None
+        return analysis
+
+    def put(self, sha256: str, analysis: Dict[str, Any]):
+        """Persist an analysis result and evict least recently used entries"""
+        name = self._entry_name(sha256)
+        data = json.dumps({key: analysis.get(key) for key in CACHED_KEYS})
+        path = self.entry_dir / name
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _discard(self, name: str):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(name, 0)
+        try:
+            (self.entry_dir / name).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        """Drop the oldest entries until the cache fits in max_bytes (lock held)"""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self.entry_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+
+
+@lru_cache()
+def get_analysis_cache() -> AnalysisCache:
+    """Return the shared cache, creating its directories on first use"""
+    return AnalysisCache(settings.library_path, settings.analysis_cache_max_bytes)
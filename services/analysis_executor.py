@@ -0,0 +1,251 @@
+"""Process pool for running 3MF analysis off the event loop"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from services.analysis_cache import AnalysisCache
+from services.analyzer import ThreeMFAnalyzer
+from services.thumbnails import get_thumbnail_store
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 1000
+
+# Set in each worker process by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_analysis(job_id: str, sha256: str, path: str) -> Dict[str, Any]:
+    """Analyze a stored file and render its thumbnails inside a worker process"""
+    def report(stage: str, fraction: float):
+        if _progress_queue is not None:
+            _progress_queue.put((job_id, stage, fraction))
+
+    with ThreeMFAnalyzer(file_path=path) as analyzer:
+        analysis = analyzer.analyze(progress=report)
+        get_thumbnail_store().render(sha256, analyzer.get_thumbnails())
+        return analysis
+
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue cannot accept more work"""
+
+
+class AnalysisJob:
+    """State of a single submitted analysis"""
+
+    def __init__(self, job_id: str, sha256: str, filename: str):
+        self.id = job_id
+        self.sha256 = sha256
+        self.filename = filename
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._listeners: List[asyncio.Queue] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "sha256": self.sha256,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 2),
+            "file": self.result,
+            "error": self.error
+        }
+
+    def _notify(self):
+        event = self.to_dict()
+        for listener in self._listeners:
+            listener.put_nowait(event)
+
+
+class AnalysisExecutor:
+    """Runs ThreeMFAnalyzer in a process pool with bounded pending work
+
+    Results are written to the analysis cache and handed to ``on_complete``
+    in a worker thread, which turns them into a library entry. Failed jobs
+    whose blob no other job is analyzing go to ``on_failed`` there too,
+    e.g. to remove the blob.
+    """
+
+    def __init__(
+        self,
+        cache: AnalysisCache,
+        on_complete: Callable[[AnalysisJob, Dict[str, Any]], Dict[str, Any]],
+        max_workers: int,
+        max_pending: int,
+        on_failed: Optional[Callable[[AnalysisJob], None]] = None
+    ):
+        self.cache = cache
+        self.on_complete = on_complete
+        self.on_failed = on_failed
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._pending = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._progress_queue = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Create the worker pool; must be called from the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._progress_queue = multiprocessing.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,)
+        )
+        self._progress_thread = threading.Thread(
+            target=self._read_progress, name="analysis-progress", daemon=True
+        )
+        self._progress_thread.start()
+
+    def shutdown(self):
+        """Stop the worker pool and progress reader"""
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_thread.join(timeout=1)
+            self._progress_queue = None
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self.jobs.get(job_id)
+
+    def is_pending(self, sha256: str) -> bool:
+        """Whether an unfinished job still needs the blob"""
+        return any(job.sha256 == sha256 and not job.finished for job in self.jobs.values())
+
+    def submit(self, sha256: str, filename: str) -> AnalysisJob:
+        """Queue analysis of a stored blob, completing immediately on a cache hit
+
+        Raises:
+            QueueFullError: If max_pending analyses are already queued or running
+        """
+        cached = self.cache.get(sha256)
+        if cached is None and self._pending >= self.max_pending:
+            raise QueueFullError(f"{self._pending} analyses already pending")
+
+        job = AnalysisJob(uuid.uuid4().hex, sha256, filename)
+        self.jobs[job.id] = job
+        self._trim()
+
+        if cached is not None:
+            self._complete(job, cached)
+            return job
+
+        if self._pool is None:
+            raise RuntimeError("Analysis executor not started")
+        self._pending += 1
+        future = self._pool.submit(_run_analysis, job.id, sha256, str(self.cache.blob_path(sha256)))
+        future.add_done_callback(
+            lambda f: self._loop.call_soon_threadsafe(self._finish, job, f)
+        )
+        return job
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield job status updates until the job finishes"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        yield job.to_dict()
+        if job.finished:
+            return
+
+        listener: asyncio.Queue = asyncio.Queue()
+        job._listeners.append(listener)
+        try:
+            while True:
+                event = await listener.get()
+                yield event
+                if event["status"] in ("done", "failed"):
+                    return
+        finally:
+            job._listeners.remove(listener)
+
+    def _read_progress(self):
+        """Forward worker progress reports to the event loop"""
+        queue = self._progress_queue
+        while True:
+            message = queue.get()
+            if message is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_progress, *message)
+
+    def _on_progress(self, job_id: str, stage: str, fraction: float):
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return
+        job.status = "running"
+        job.stage = stage
+        job.progress = fraction
+        job._notify()
+
+    def _finish(self, job: AnalysisJob, future: Future):
+        self._pending -= 1
+        try:
+            analysis = future.result()
+            self.cache.put(job.sha256, analysis)
+        except Exception as e:
+            logger.error(f"Analysis of {job.filename} failed: {e}")
+            self._fail(job, str(e))
+            return
+        self._complete(job, analysis)
+
+    def _complete(self, job: AnalysisJob, analysis: Dict[str, Any]):
+        """Hand a result to on_complete in a thread; it writes to the database"""
+        job.status = "running"
+        job.stage = "saving"
+        future = self._loop.run_in_executor(None, self.on_complete, job, analysis)
+        future.add_done_callback(lambda f: self._completed(job, f))
+
+    def _completed(self, job: AnalysisJob, future: "asyncio.Future"):
+        try:
+            job.result = future.result()
+        except Exception as e:
+            self._fail(job, f"Failed to analyze file: {e}")
+            return
+        job.status = "done"
+        job.stage = "done"
+        job.progress = 1.0
+        job._notify()
+
+    def _fail(self, job: AnalysisJob, error: str):
+        job.status = "failed"
+        job.error = error
+        job._notify()
+        # Other uploads of the same content may still be analyzing it
+        if self.on_failed is not None and not self.is_pending(job.sha256):
+            self._loop.run_in_executor(None, self.on_failed, job)
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS"""
+        excess = len(self.jobs) - MAX_FINISHED_JOBS
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+                excess -= 1
@@ -2,10 +2,21 @@ import zipfile
 from xml.etree import ElementTree as ET
 import io
 import os
+import re
 from PIL import Image
 import math
 import json
-from typing import Optional, Dict, Any, Tuple, List
+from typing import Optional, Dict, Any, Tuple, List, Callable
+
+import numpy as np
+
+from services.mesh import Model, iter_instances, measure, read_model
+
+# Bump whenever analysis output changes so cached results are invalidated
+ANALYZER_VERSION = 4
+
+# Bambu Studio stores one preview per plate, e.g. Metadata/plate_1.png
+PLATE_THUMBNAIL = re.compile(r'Metadata/plate_(\d+)\.(?:png|jpg)$')
 
 class ThreeMFAnalyzer:
     """Analyzer for 3MF files to extract metadata, thumbnails, and print settings"""
@@ -16,6 +27,7 @@ class ThreeMFAnalyzer:
         self.file_content = file_content
         self.zip_file = None
         self.metadata = {}
+        self._models: Dict[str, Model] = {}
         
     def __enter__(self):
         """Context manager entry"""
@@ -52,66 +64,147 @@ class ThreeMFAnalyzer:
             print(f"Error extracting thumbnail: {e}")
             return None
             
+    def get_thumbnail_paths(self) -> Dict[int, str]:
+        """Map plate numbers to preview images in the archive (0 is the cover thumbnail)"""
+        paths = {}
+        names = self.zip_file.namelist()
+        for name in ('Metadata/thumbnail.png', 'Metadata/thumbnail.jpg', 'thumbnail.png', 'thumbnail.jpg'):
+            if name in names:
+                paths[0] = name
+                break
+        for name in names:
+            match = PLATE_THUMBNAIL.match(name)
+            if match:
+                paths.setdefault(int(match.group(1)), name)
+        return paths
+
+    def get_thumbnails(self) -> Dict[int, bytes]:
+        """Read every preview image, keyed by plate number (0 is the cover)"""
+        return {plate: self.zip_file.read(name) for plate, name in self.get_thumbnail_paths().items()}
+            
+    def _load_model(self, path: str) -> Model:
+        """Parse a model part from the archive, caching it for reuse"""
+        name = path.lstrip('/')
+        if name not in self._models:
+            with self.zip_file.open(name) as stream:
+                self._models[name] = read_model(stream)
+        return self._models[name]
+    
+    def _get_plate_assignments(self) -> Dict[str, List[int]]:
+        """Map object ids to Bambu plate numbers (in instance order)"""
+        try:
+            root = ET.fromstring(self.zip_file.read('Metadata/model_settings.config'))
+        except KeyError:
+            return {}
+        
+        plates: Dict[str, List[int]] = {}
+        for plate in root.iter('plate'):
+            plate_id = next(
+                (m.get('value') for m in plate.findall('metadata') if m.get('key') == 'plater_id'),
+                None
+            )
+            if plate_id is None:
+                continue
+            for instance in plate.iter('model_instance'):
+                for meta in instance.findall('metadata'):
+                    if meta.get('key') == 'object_id':
+                        plates.setdefault(meta.get('value'), []).append(int(plate_id))
+        return plates
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Extract model information from 3MF file"""
         try:
-            # Read 3D model data
-            model_data = self.zip_file.read('3D/3dmodel.model')
-            root = ET.fromstring(model_data)
+            model = self._load_model('3D/3dmodel.model')
+            plate_assignments = self._get_plate_assignments()
             
-            # Extract namespace for proper XML parsing
-            ns = {'': root.tag.split('}')[0][1:]} if '}' in root.tag else {}
+            lower = np.full(3, np.inf)
+            upper = np.full(3, -np.inf)
+            objects = []
+            plates: Dict[int, Dict[str, Any]] = {}
             
-            # Find all mesh objects
-            objects = root.findall('.//mesh', ns)
-            
-            total_vertices = 0
-            total_triangles = 0
-            min_x = min_y = min_z = float('inf')
-            max_x = max_y = max_z = float('-inf')
-            
-            # Analyze each mesh
-            for mesh in objects:
-                vertices = mesh.findall('.//vertex', ns)
-                triangles = mesh.findall('.//triangle', ns)
+            # Measure every build item with its transform and component parts applied
+            for item in model.items:
+                volume = area = 0.0
+                triangles = 0
+                item_lower = np.full(3, np.inf)
+                item_upper = np.full(3, -np.inf)
                 
-                total_vertices += len(vertices)
-                total_triangles += len(triangles)
+                for mesh, transform in iter_instances(model, self._load_model, item):
+                    result = measure(mesh, transform)
+                    # Per instance, so a part wound inside out cannot cancel another
+                    volume += abs(result['volume'])
+                    area += result['area']
+                    triangles += len(mesh.triangles)
+                    if result['bounds'] is not None:
+                        np.minimum(item_lower, result['bounds'][0], out=item_lower)
+                        np.maximum(item_upper, result['bounds'][1], out=item_upper)
                 
-                # Calculate bounding box
-                for vertex in vertices:
-                    x = float(vertex.get('x'))
-                    y = float(vertex.get('y'))
-                    z = float(vertex.get('z'))
-                    
-                    min_x = min(min_x, x)
-                    min_y = min(min_y, y)
-                    min_z = min(min_z, z)
-                    max_x = max(max_x, x)
-                    max_y = max(max_y, y)
-                    max_z = max(max_z, z)
+                assigned = plate_assignments.get(item.object_id)
+                plate = assigned.pop(0) if assigned else 1
+                size = item_upper - item_lower if triangles else np.zeros(3)
+                
+                objects.append({
+                    'object_id': item.object_id,
+                    'name': model.names.get(item.object_id, f"Object {item.object_id}"),
+                    'plate': plate,
+                    'triangles': triangles,
+                    'dimensions': self._dimensions(size),
+                    'volume_cm3': round(volume / 1000, 2),
+                    'surface_area_cm2': round(area / 100, 2)
+                })
+                
+                totals = plates.setdefault(plate, {'plate': plate, 'objects': 0, 'volume': 0.0, 'area': 0.0})
+                totals['objects'] += 1
+                totals['volume'] += volume
+                totals['area'] += area
+                
+                if triangles:
+                    np.minimum(lower, item_lower, out=lower)
+                    np.maximum(upper, item_upper, out=upper)
             
-            # Calculate dimensions in mm
-            dimensions = {
-                'width': round(max_x - min_x, 2),
-                'depth': round(max_y - min_y, 2),
-                'height': round(max_z - min_z, 2)
-            }
+            # Unique mesh data across all loaded model parts
+            meshes = [m for part in self._models.values() for m in part.meshes.values()]
+            total_vertices = sum(len(m.vertices) for m in meshes)
+            total_triangles = sum(len(m.triangles) for m in meshes)
             
-            # Calculate volume (approximate)
-            volume = dimensions['width'] * dimensions['depth'] * dimensions['height']
+            # Calculate dimensions in mm
+            size = upper - lower if np.isfinite(lower).all() else np.zeros(3)
+            dimensions = self._dimensions(size)
+            volume = sum(p['volume'] for p in plates.values())
+            area = sum(p['area'] for p in plates.values())
             
             return {
                 'vertices': total_vertices,
                 'triangles': total_triangles,
                 'dimensions': dimensions,
                 'volume_cm3': round(volume / 1000, 2),  # Convert to cm³
+                'surface_area_cm2': round(area / 100, 2),  # Convert to cm²
+                'bounding_box_cm3': round(float(np.prod(size)) / 1000, 2),
                 'estimated_print_time': self._estimate_print_time(total_triangles, volume),
-                'estimated_material_grams': self._estimate_material_weight(volume)
+                'estimated_material_grams': self._estimate_material_weight(volume),
+                'objects': objects,
+                'plates': [
+                    {
+                        'plate': p['plate'],
+                        'objects': p['objects'],
+                        'volume_cm3': round(p['volume'] / 1000, 2),
+                        'surface_area_cm2': round(p['area'] / 100, 2),
+                        'estimated_material_grams': self._estimate_material_weight(p['volume'])
+                    }
+                    for p in sorted(plates.values(), key=lambda p: p['plate'])
+                ]
             }
         except Exception as e:
             print(f"Error analyzing model: {e}")
             return {}
+    
+    def _dimensions(self, size: np.ndarray) -> Dict[str, float]:
+        """Convert an (x, y, z) extent into a dimensions dict in mm"""
+        return {
+            'width': round(float(size[0]), 2),
+            'depth': round(float(size[1]), 2),
+            'height': round(float(size[2]), 2)
+        }
             
     def get_print_settings(self) -> Dict[str, Any]:
         """Extract print settings from 3MF file"""
@@ -285,16 +378,26 @@ class ThreeMFAnalyzer:
         except Exception:
             return {}
 
-    def analyze(self) -> Dict[str, Any]:
-        """Perform full analysis of the 3MF file"""
-        thumbnail = self.get_thumbnail()
+    def analyze(self, progress: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """Perform full analysis of the 3MF file
+        
+        Args:
+            progress: Optional callback receiving (stage, fraction complete)
+        """
+        report = progress or (lambda stage, fraction: None)
+        
+        report('thumbnail', 0.0)
+        thumbnails = sorted(self.get_thumbnail_paths())
+        report('model', 0.05)
         model_info = self.get_model_info()
+        report('print_settings', 0.9)
         print_settings = self.get_print_settings()
+        report('bambu_metadata', 0.95)
         bambu_metadata = self.get_bambu_metadata()
+        report('done', 1.0)
         
         return {
-            'has_thumbnail': thumbnail is not None,
-            'thumbnail': thumbnail,
+            'thumbnails': thumbnails,
             'model_info': model_info,
             'print_settings': print_settings,
             'bambu_metadata': bambu_metadata
@@ -0,0 +1,197 @@
+"""Topic-based WebSocket fan-out with a bounded send queue and writer task per client"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Union
+
+import msgpack
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Close code sent to clients that cannot keep up ("Try Again Later")
+CLOSE_TOO_SLOW = 1013
+
+# WebSocket subprotocols a client may request, mapped to wire encodings.
+# Clients that request none get JSON text frames.
+SUBPROTOCOLS = {"pandaherd.msgpack": "msgpack", "pandaherd.json": "json"}
+
+ENCODERS = {
+    "json": json.dumps,
+    "msgpack": msgpack.packb,
+}
+
+
+class Message:
+    """Outgoing payload, serialized lazily and at most once per encoding
+
+    The same Message is queued for every subscriber, so a broadcast costs
+    one json.dumps (and one msgpack.packb if any client asked for it).
+    """
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, encoding: str) -> Union[str, bytes]:
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = ENCODERS[encoding](self.payload)
+        return data
+
+    @property
+    def droppable(self) -> bool:
+        """Patches can be skipped (the client resyncs); snapshots are the base they apply to"""
+        return self.payload.get("type") != "snapshot"
+
+
+class ClientConnection:
+    """Queue of outgoing messages for one WebSocket, drained by its own task
+
+    When the queue is full the oldest droppable message is dropped;
+    dashboards notice the version gap and resync. Snapshots are never
+    dropped, and a client whose queue holds nothing else is disconnected,
+    as is one whose queue stays full, or whose send blocks, for longer than
+    max_lag seconds.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, max_lag: float, on_close, encoding: str = "json"):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.max_lag = max_lag
+        self.dropped = 0
+        self.topics: Set[str] = set()
+        self._full_since: Optional[float] = None
+        self._on_close = on_close
+        self._task = asyncio.create_task(self._write())
+
+    def send(self, message: Message):
+        """Queue a message without waiting on the network"""
+        if self.queue.full():
+            now = time.monotonic()
+            if self._full_since is None:
+                self._full_since = now
+            elif now - self._full_since > self.max_lag:
+                self.close(CLOSE_TOO_SLOW)
+                return
+            if not self._drop_oldest():
+                self.close(CLOSE_TOO_SLOW)
+                return
+        self.queue.put_nowait(message)
+
+    def _drop_oldest(self) -> bool:
+        """Remove the oldest droppable message, keeping the order of the rest"""
+        queued = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        index = next((i for i, queued_message in enumerate(queued) if queued_message.droppable), None)
+        if index is not None:
+            del queued[index]
+            self.dropped += 1
+        for queued_message in queued:
+            self.queue.put_nowait(queued_message)
+        return index is not None
+
+    def close(self, code: int = 1000):
+        """Stop the writer and close the socket in the background"""
+        if self._task.done():
+            return
+        self._task.cancel()
+        self._on_close(self)
+        asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass  # Already closed by the client
+
+    async def _write(self):
+        try:
+            while True:
+                data = (await self.queue.get()).encode(self.encoding)
+                send = self.websocket.send_bytes if isinstance(data, bytes) else self.websocket.send_text
+                await asyncio.wait_for(send(data), timeout=self.max_lag)
+                if self.queue.empty():
+                    self._full_since = None
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.info("Dropping WebSocket client: send timed out")
+            self._on_close(self)
+            await self._close_socket(CLOSE_TOO_SLOW)
+        except Exception as e:
+            logger.info(f"Dropping WebSocket client: {e!r}")
+            self._on_close(self)
+
+
+class PubSubHub:
+    """Topic subscriptions over WebSockets, one bounded queue per client
+
+    Topics are plain strings such as "fleet" or "printer/printer1"; a
+    client receives only messages published to topics it subscribed to.
+    """
+
+    def __init__(self, max_queue: int = 64, max_lag: float = 10.0):
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.active_connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+
+    async def connect(self, websocket: WebSocket):
+        """Accept a client, negotiating the first subprotocol we support"""
+        requested = websocket.scope.get("subprotocols") or []
+        subprotocol = next((p for p in requested if p in SUBPROTOCOLS), None)
+        await websocket.accept(subprotocol=subprotocol)
+        self.active_connections[websocket] = ClientConnection(
+            websocket, self.max_queue, self.max_lag, self._forget,
+            encoding=SUBPROTOCOLS.get(subprotocol, "json")
+        )
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.active_connections.get(websocket)
+        if connection:
+            connection.close()
+
+    def subscribe(self, websocket: WebSocket, topic: str):
+        connection = self.active_connections.get(websocket)
+        if connection:
+            connection.topics.add(topic)
+            self.subscribers.setdefault(topic, set()).add(connection)
+
+    def unsubscribe(self, websocket: WebSocket, topic: str):
+        connection = self.active_connections.get(websocket)
+        if connection:
+            connection.topics.discard(topic)
+            self._remove_subscriber(topic, connection)
+
+    def topics(self) -> List[str]:
+        """Topics with at least one subscriber"""
+        return list(self.subscribers)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self.subscribers
+
+    def send(self, websocket: WebSocket, message: Message):
+        """Queue a message for one client, ordered with published messages"""
+        connection = self.active_connections.get(websocket)
+        if connection:
+            connection.send(message)
+
+    def publish(self, topic: str, message: Message):
+        """Queue a message for every subscriber of a topic; never waits on a socket"""
+        for connection in list(self.subscribers.get(topic, ())):
+            connection.send(message)
+
+    def _remove_subscriber(self, topic: str, connection: ClientConnection):
+        subscribers = self.subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.subscribers[topic]
+
+    def _forget(self, connection: ClientConnection):
+        if self.active_connections.get(connection.websocket) is connection:
+            del self.active_connections[connection.websocket]
+        for topic in connection.topics:
+            self._remove_subscriber(topic, connection)
@@ -0,0 +1,228 @@
+"""In-memory store merging partial Bambu printer reports into per-printer state
+
+Bambu printers publish ``device/<serial>/report`` messages that contain
+only the fields that changed (plus a full "pushall" on request). The store
+folds them into one compact object per printer and tells listeners which
+fields actually changed, so downstream consumers can skip everything else.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Keys of the report's "print" object mapped to PrinterState attributes
+REPORT_FIELDS = {
+    "gcode_state": "gcode_state",
+    "subtask_name": "job_name",
+    "mc_percent": "progress",
+    "mc_remaining_time": "remaining_minutes",
+    "layer_num": "layer",
+    "total_layer_num": "total_layers",
+    "nozzle_temper": "nozzle_temp",
+    "nozzle_target_temper": "nozzle_target",
+    "bed_temper": "bed_temp",
+    "bed_target_temper": "bed_target",
+    "chamber_temper": "chamber_temp",
+    "cooling_fan_speed": "part_fan",
+    "big_fan1_speed": "aux_fan",
+    "big_fan2_speed": "chamber_fan",
+    "heatbreak_fan_speed": "heatbreak_fan",
+    "print_error": "print_error",
+    "hms": "hms",
+    "wifi_signal": "wifi_signal",
+}
+
+# Reported as strings by the firmware
+NUMERIC_FIELDS = {"part_fan", "aux_fan", "chamber_fan", "heatbreak_fan", "progress",
+                  "remaining_minutes", "layer", "total_layers"}
+
+# AMS tray keys kept in the store, with the names used in the dashboard
+TRAY_FIELDS = {
+    "tray_color": "color",
+    "color": "color",
+    "tray_type": "material",
+    "material": "material",
+    "remain": "remaining",
+    "tray_temp": "temperature",
+    "temp": "temperature",
+}
+
+# gcode_state values mapped to dashboard printer status
+STATUS = {"RUNNING": "printing", "PREPARE": "printing", "SLICING": "printing",
+          "PAUSE": "paused", "FAILED": "error", "FINISH": "idle", "IDLE": "idle"}
+
+# Which dashboard key each field feeds, so only touched sections are rebuilt
+DASHBOARD_KEYS = {
+    "gcode_state": "status", "print_error": "status",
+    "job_name": "current_job", "progress": "current_job", "remaining_minutes": "current_job",
+    "layer": "current_job", "total_layers": "current_job",
+    "nozzle_temp": "temperatures", "nozzle_target": "temperatures", "bed_temp": "temperatures",
+    "bed_target": "temperatures", "chamber_temp": "temperatures",
+    "part_fan": "fans", "aux_fan": "fans", "chamber_fan": "fans", "heatbreak_fan": "fans",
+    "hms": "hms", "wifi_signal": "wifi_signal",
+    "ams": "ams", "active_tray": "ams",
+}
+
+
+def _number(value: Any) -> Any:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return value
+    return int(number) if number.is_integer() else number
+
+
+class PrinterState:
+    """Latest known state of one printer, one attribute per tracked field"""
+
+    __slots__ = tuple(REPORT_FIELDS.values()) + ("ams", "active_tray", "serial", "last_report")
+
+    def __init__(self, serial: Optional[str] = None):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.serial = serial
+        self.last_report: Optional[float] = None  # Unix time of the latest report, changed or not
+        self.ams: Dict[str, Dict[str, Any]] = {}  # "<unit>:<tray>" -> tray fields
+
+    def merge(self, report: Dict[str, Any]) -> FrozenSet[str]:
+        """Fold a (partial) report into the state
+
+        Returns:
+            Names of the attributes whose value changed
+        """
+        data = report.get("print")
+        if not isinstance(data, dict):
+            return frozenset()
+
+        changed = set()
+        for key, name in REPORT_FIELDS.items():
+            if key not in data:
+                continue
+            value = data[key]
+            if name in NUMERIC_FIELDS:
+                value = _number(value)
+            if getattr(self, name) != value:
+                setattr(self, name, value)
+                changed.add(name)
+
+        ams = data.get("ams")
+        if isinstance(ams, dict):
+            if "tray_now" in ams and ams["tray_now"] != self.active_tray:
+                self.active_tray = ams["tray_now"]
+                changed.add("active_tray")
+            if self._merge_ams(ams.get("ams") or []):
+                changed.add("ams")
+        return frozenset(changed)
+
+    def _merge_ams(self, units: List[Dict[str, Any]]) -> bool:
+        changed = False
+        for unit_index, unit in enumerate(units):
+            unit_id = unit.get("id", unit_index)
+            # Current firmware reports "tray", older payloads used "slots"
+            trays = unit.get("tray") or unit.get("slots") or []
+            for tray_index, tray in enumerate(trays):
+                key = f"{unit_id}:{tray.get('id', tray_index)}"
+                stored = self.ams.setdefault(key, {})
+                for source, name in TRAY_FIELDS.items():
+                    if source not in tray:
+                        continue
+                    value = tray[source]
+                    if name == "color" and isinstance(value, str):
+                        value = "#" + value.lstrip("#")[:6].upper()
+                    elif name in ("remaining", "temperature"):
+                        value = _number(value)
+                    if stored.get(name) != value:
+                        stored[name] = value
+                        changed = True
+        return changed
+
+    def dashboard(self, keys: Optional[FrozenSet[str]] = None) -> Dict[str, Any]:
+        """Printer state in the dashboard's shape, optionally only the given sections"""
+        sections = {
+            # Reports carry no display name; the serial stands in until one is configured
+            "name": lambda: self.serial,
+            "status": lambda: "error" if self.print_error else self._status(),
+            "current_job": lambda: {
+                "name": self.job_name,
+                "progress": self.progress or 0,
+                "remaining_minutes": self.remaining_minutes,
+                "layer": self.layer,
+                "total_layers": self.total_layers,
+            } if self.job_name else None,
+            "temperatures": lambda: {
+                "nozzle": self.nozzle_temp, "nozzle_target": self.nozzle_target,
+                "bed": self.bed_temp, "bed_target": self.bed_target, "chamber": self.chamber_temp,
+            },
+            "fans": lambda: {
+                "part": self.part_fan, "aux": self.aux_fan,
+                "chamber": self.chamber_fan, "heatbreak": self.heatbreak_fan,
+            },
+            "hms": lambda: self.hms or [],
+            "wifi_signal": lambda: self.wifi_signal,
+            "ams": lambda: {
+                "slots": [dict(tray) for _, tray in sorted(self.ams.items())],
+                "active_tray": self.active_tray,
+            } if self.ams else None,
+        }
+        return {key: build() for key, build in sections.items() if keys is None or key in keys}
+
+    def _status(self) -> str:
+        # Nothing reported about printing yet, e.g. only temperatures or AMS so far
+        if self.gcode_state is None:
+            return "offline"
+        return STATUS.get(self.gcode_state, "idle")
+
+
+class ChangeSet:
+    """Fields of one printer changed by a report"""
+
+    __slots__ = ("device_id", "fields", "state")
+
+    def __init__(self, device_id: str, fields: FrozenSet[str], state: PrinterState):
+        self.device_id = device_id
+        self.fields = fields
+        self.state = state
+
+    @property
+    def dashboard_keys(self) -> FrozenSet[str]:
+        """Dashboard sections affected by the change"""
+        return frozenset(DASHBOARD_KEYS[field] for field in self.fields)
+
+
+Listener = Callable[[ChangeSet], Awaitable[None]]
+
+
+class DeviceStateStore:
+    """Per-printer state built from partial reports, with change notifications"""
+
+    def __init__(self):
+        self.states: Dict[str, PrinterState] = {}
+        self._listeners: List[Listener] = []
+
+    def get(self, device_id: str) -> Optional[PrinterState]:
+        return self.states.get(device_id)
+
+    def add_listener(self, listener: Listener):
+        """Call listener with every non-empty ChangeSet"""
+        self._listeners.append(listener)
+
+    async def apply(self, device_id: str, report: Dict[str, Any]) -> ChangeSet:
+        """Merge a report and notify listeners if anything changed"""
+        state = self.states.get(device_id)
+        if state is None:
+            state = self.states[device_id] = PrinterState(device_id)
+        state.last_report = time.time()
+        change = ChangeSet(device_id, state.merge(report), state)
+        if change.fields:
+            results = await asyncio.gather(
+                *(listener(change) for listener in self._listeners), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Device state listener failed for {device_id}: {result}")
+        return change
+
+
+device_states = DeviceStateStore()
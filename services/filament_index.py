@@ -0,0 +1,309 @@
+"""In-memory index of the filament loaded in every printer's AMS
+
+Each AMS slot is indexed under (material, color bucket), where a bucket
+is a cube of RGB space BUCKET_SIZE wide per channel. A color query looks
+in its own bucket and the neighbouring ones, then filters by distance, so
+finding the printers that can run a file touches only the slots that
+could match, never the whole fleet.
+
+A slot's entry combines what the AMS reports for the tray (material,
+color, remaining percentage) with the inventory spool loaded there. The
+AMS report wins for material and color; the spool's remaining grams win
+over the percentage. Entries are updated from device state changes and
+inventory writes as they happen. Inventory writes arrive on worker
+threads, so updates and lookups hold the index's lock.
+"""
+import math
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from models.library import LibraryFile
+from services import inventory, printer_state
+from services.device_state import ChangeSet, device_states
+from services.library import normalize_color
+
+BUCKET_SIZE = 32
+# Default largest RGB distance between a wanted and a loaded color
+COLOR_TOLERANCE = 32.0
+# Assumed filament on a full spool when only the AMS percentage is known
+DEFAULT_SPOOL_GRAMS = 1000.0
+TRAYS_PER_UNIT = 4
+
+Location = Tuple[str, int]  # (printer id, 1-based slot)
+RGB = Tuple[int, int, int]
+
+
+def _rgb(color: Optional[str]) -> Optional[RGB]:
+    color = normalize_color(color)
+    if color is None:
+        return None
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+def _bucket(rgb: RGB) -> RGB:
+    return rgb[0] // BUCKET_SIZE, rgb[1] // BUCKET_SIZE, rgb[2] // BUCKET_SIZE
+
+
+def _material(material: Optional[str]) -> Optional[str]:
+    return material.strip().upper() or None if isinstance(material, str) else None
+
+
+class SlotEntry:
+    """Filament available in one AMS slot"""
+
+    __slots__ = ("printer_id", "slot", "material", "color", "rgb", "remaining_g")
+
+    def __init__(self, printer_id: str, slot: int, material: Optional[str], color: Optional[str],
+                 remaining_g: Optional[float]):
+        self.printer_id = printer_id
+        self.slot = slot
+        self.material = material
+        self.rgb = _rgb(color)
+        self.color = normalize_color(color)
+        self.remaining_g = remaining_g  # None if unknown
+
+    @property
+    def key(self) -> Tuple[Optional[str], Optional[RGB]]:
+        return self.material, _bucket(self.rgb) if self.rgb else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "slot": self.slot,
+            "material": self.material,
+            "color": self.color,
+            "remaining_g": None if self.remaining_g is None else round(self.remaining_g, 1),
+        }
+
+
+class Requirement:
+    """Filament a print needs: material, color (None for any) and grams"""
+
+    __slots__ = ("material", "color", "rgb", "grams")
+
+    def __init__(self, material: Optional[str], color: Optional[str] = None, grams: float = 0.0):
+        self.material = _material(material)
+        self.color = normalize_color(color)
+        self.rgb = _rgb(color)
+        self.grams = grams
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"material": self.material, "color": self.color, "grams": round(self.grams, 1)}
+
+
+def file_requirements(file: LibraryFile) -> List[Requirement]:
+    """Filament a library file is sliced to use, one requirement per material and color"""
+    merged: Dict[Tuple[Optional[str], Optional[str]], Requirement] = {}
+    for filament in (file.bambu_metadata or {}).get("ams_mapping") or []:
+        requirement = Requirement(filament.get("type"), filament.get("color"), float(filament.get("weight_used") or 0))
+        key = (requirement.material, requirement.color)
+        if key in merged:
+            merged[key].grams += requirement.grams
+        else:
+            merged[key] = requirement
+    if not merged:
+        return [Requirement(file.material, None, file.estimated_material_grams or 0.0)]
+    return list(merged.values())
+
+
+def _assign_slots(options: List[List[SlotEntry]]) -> Optional[List[SlotEntry]]:
+    """A distinct slot for each requirement out of its matching slots, or None
+
+    Requirements with the fewest options are placed first, and each tries
+    the fullest slots first. A printer has at most a few AMS units, so the
+    backtracking stays small.
+    """
+    options = [sorted(entries, key=lambda entry: -(entry.remaining_g or 0)) for entries in options]
+    order = sorted(range(len(options)), key=lambda i: len(options[i]))
+    chosen: List[Optional[SlotEntry]] = [None] * len(options)
+    used: Set[int] = set()
+
+    def place(position: int) -> bool:
+        if position == len(order):
+            return True
+        i = order[position]
+        for entry in options[i]:
+            if entry.slot in used:
+                continue
+            used.add(entry.slot)
+            chosen[i] = entry
+            if place(position + 1):
+                return True
+            used.discard(entry.slot)
+        return False
+
+    return chosen if place(0) else None
+
+
+class FilamentIndex:
+    """AMS slots of the fleet indexed by material and color"""
+
+    def __init__(self):
+        # What the AMS reports per slot, and the inventory spool loaded there
+        self.trays: Dict[Location, Tuple[Optional[str], Optional[str], Optional[float]]] = {}
+        self.spools: Dict[Location, Tuple[Optional[str], Optional[str], float]] = {}
+        self.spool_locations: Dict[str, Location] = {}
+        self.entries: Dict[Location, SlotEntry] = {}
+        self.printer_slots: Dict[str, Set[int]] = {}
+        self.index: Dict[Tuple[Optional[str], Optional[RGB]], Dict[Location, SlotEntry]] = {}
+        self.by_material: Dict[Optional[str], Dict[Location, SlotEntry]] = {}
+        self._lock = threading.RLock()
+
+    def set_trays(self, printer_id: str, trays: Dict[int, Tuple[Optional[str], Optional[str], Optional[float]]]):
+        """Replace what a printer's AMS reports: slot -> (material, color, remaining percent)"""
+        with self._lock:
+            for slot in self.printer_slots.get(printer_id, set()) - set(trays):
+                if self.trays.pop((printer_id, slot), None) is not None:
+                    self._refresh((printer_id, slot))
+            for slot, (material, color, remaining_pct) in trays.items():
+                location = (printer_id, slot)
+                tray = (_material(material), normalize_color(color), remaining_pct)
+                if self.trays.get(location) != tray:
+                    self.trays[location] = tray
+                    self._refresh(location)
+
+    def set_spool(self, spool: Dict[str, Any]):
+        """Record where an inventory spool is loaded and how much is left (see Spool.to_dict)
+
+        Called from the worker threads that write the inventory.
+        """
+        with self._lock:
+            previous = self.spool_locations.pop(spool["id"], None)
+            if previous is not None:
+                self.spools.pop(previous, None)
+                self._refresh(previous)
+            if spool.get("printer") and spool.get("slot"):
+                location = (spool["printer"], spool["slot"])
+                self.spool_locations[spool["id"]] = location
+                self.spools[location] = (_material(spool["material"]), spool["color"], spool["remaining_g"])
+                self._refresh(location)
+
+    def _refresh(self, location: Location):
+        """Rebuild one slot's entry (lock held)"""
+        old = self.entries.pop(location, None)
+        if old is not None:
+            self.index[old.key].pop(location, None)
+            self.by_material[old.material].pop(location, None)
+
+        tray, spool = self.trays.get(location), self.spools.get(location)
+        if tray is None and spool is None:
+            self.printer_slots.get(location[0], set()).discard(location[1])
+            return
+        material = (tray and tray[0]) or (spool and spool[0])
+        color = (tray and tray[1]) or (spool and spool[1])
+        if spool is not None:
+            remaining = spool[2]
+        elif tray[2] is not None and tray[2] >= 0:
+            remaining = tray[2] / 100 * DEFAULT_SPOOL_GRAMS
+        else:
+            remaining = None
+        entry = self.entries[location] = SlotEntry(location[0], location[1], material, color, remaining)
+        self.index.setdefault(entry.key, {})[location] = entry
+        self.by_material.setdefault(material, {})[location] = entry
+        self.printer_slots.setdefault(location[0], set()).add(location[1])
+
+    def candidates(self, requirement: Requirement, tolerance: float = COLOR_TOLERANCE) -> Iterator[SlotEntry]:
+        """Slots holding enough of the required material in a close enough color
+
+        Slots whose remaining amount is unknown are assumed to have enough.
+        Iterate with the lock held, as find_printers does.
+        """
+        if requirement.rgb is None:
+            entries: Iterable[SlotEntry] = self.by_material.get(requirement.material, {}).values()
+        else:
+            reach = math.ceil(tolerance / BUCKET_SIZE)
+            r, g, b = _bucket(requirement.rgb)
+            entries = (
+                entry
+                for dr in range(-reach, reach + 1)
+                for dg in range(-reach, reach + 1)
+                for db in range(-reach, reach + 1)
+                for entry in self.index.get((requirement.material, (r + dr, g + dg, b + db)), {}).values()
+            )
+        limit = tolerance * tolerance
+        for entry in entries:
+            if requirement.rgb is not None and sum((a - b) ** 2 for a, b in zip(entry.rgb, requirement.rgb)) > limit:
+                continue
+            if entry.remaining_g is not None and entry.remaining_g < requirement.grams:
+                continue
+            yield entry
+
+    def find_printers(
+        self,
+        requirements: List[Requirement],
+        printer_ids: Optional[Iterable[str]] = None,
+        tolerance: float = COLOR_TOLERANCE
+    ) -> Dict[str, List[SlotEntry]]:
+        """Printers that have a slot for every requirement
+
+        Each requirement gets a slot of its own, so two requirements in
+        similar colors never count on the same spool and every slot holds
+        the grams of the one requirement it feeds.
+
+        Returns:
+            printer id -> the slot chosen for each requirement, in order;
+            the fullest matching slots are preferred
+        """
+        allowed = set(printer_ids) if printer_ids is not None else None
+        with self._lock:
+            return self._find_printers(requirements, allowed, tolerance)
+
+    def _find_printers(
+        self,
+        requirements: List[Requirement],
+        allowed: Optional[Set[str]],
+        tolerance: float
+    ) -> Dict[str, List[SlotEntry]]:
+        # Printer -> matching slots per requirement so far
+        options: Optional[Dict[str, List[List[SlotEntry]]]] = None
+        for requirement in requirements:
+            found: Dict[str, List[SlotEntry]] = {}
+            for entry in self.candidates(requirement, tolerance):
+                if allowed is not None and entry.printer_id not in allowed:
+                    continue
+                if options is not None and entry.printer_id not in options:
+                    continue
+                found.setdefault(entry.printer_id, []).append(entry)
+            if options is None:
+                options = {printer_id: [entries] for printer_id, entries in found.items()}
+            else:
+                options = {printer_id: options[printer_id] + [entries] for printer_id, entries in found.items()}
+            if not options:
+                return {}
+
+        matches = {}
+        for printer_id, slots in (options or {}).items():
+            chosen = _assign_slots(slots)
+            if chosen is not None:
+                matches[printer_id] = chosen
+        return matches
+
+    async def on_device_change(self, change: ChangeSet):
+        """Index a printer's AMS trays when its report changes them"""
+        if "ams" not in change.fields:
+            return
+        trays = {}
+        for key, tray in change.state.ams.items():
+            unit, _, index = key.partition(":")
+            try:
+                slot = int(unit) * TRAYS_PER_UNIT + int(index) + 1
+            except ValueError:
+                continue
+            trays[slot] = (tray.get("material"), tray.get("color"), tray.get("remaining"))
+        self.set_trays(change.device_id, trays)
+
+    def set_dashboard_trays(self, printer_id: str, ams: Optional[Dict[str, Any]]):
+        """Index trays given in the dashboard's {"slots": [...]} shape, numbered by position"""
+        slots = (ams or {}).get("slots") or []
+        self.set_trays(printer_id, {
+            i + 1: (tray.get("material"), tray.get("color"), tray.get("remaining"))
+            for i, tray in enumerate(slots)
+        })
+
+
+def idle_printers() -> List[str]:
+    return [printer_id for printer_id, state in printer_state.printers.items() if state.get("status") == "idle"]
+
+
+filament_index = FilamentIndex()
+device_states.add_listener(filament_index.on_device_change)
+inventory.view_listeners.append(filament_index.set_spool)
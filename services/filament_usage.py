@@ -0,0 +1,139 @@
+"""Deduct filament from the loaded spools when a print ends
+
+The grams a print uses per filament come from the sliced file's
+bambu_metadata.ams_mapping (weight_used). The file is either registered
+when PandaHerd starts the print, or looked up in the library by the job
+name the printer reports. Each filament is charged to the spool that the
+inventory has loaded in its AMS slot on that printer. A single-filament
+print is charged to the tray the printer last reported as active, which
+also covers prints started from the printer itself. Failed prints are
+charged in proportion to their progress.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.database import SessionLocal
+from models.filament import UsageRecord
+from models.library import LibraryFile
+from services import printer_state
+from services.device_state import ChangeSet, device_states
+from services.inventory import InventoryRepository
+from services.library import LibraryRepository
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = {"PREPARE", "SLICING", "RUNNING", "PAUSE"}
+# tray_now values from 254 up mean the external spool or no tray
+FIRST_NON_AMS_TRAY = 254
+
+Filaments = List[Tuple[Optional[int], float]]  # (global AMS tray, grams)
+
+
+def _tray(value: Any) -> Optional[int]:
+    try:
+        tray = int(value)
+    except (TypeError, ValueError):
+        return None
+    return tray if 0 <= tray < FIRST_NON_AMS_TRAY else None
+
+
+def file_filaments(file: LibraryFile) -> Filaments:
+    """Grams per AMS tray a library file is sliced to use"""
+    mapping = (file.bambu_metadata or {}).get("ams_mapping") or []
+    filaments = [(_tray(f.get("ams_slot")), float(f.get("weight_used") or 0)) for f in mapping]
+    filaments = [(tray, grams) for tray, grams in filaments if grams > 0]
+    if not filaments and file.estimated_material_grams:
+        filaments = [(None, file.estimated_material_grams)]
+    return filaments
+
+
+class PrintUsage:
+    """Filament one print is expected to use"""
+
+    __slots__ = ("job_name", "filaments", "tray")
+
+    def __init__(self, job_name: Optional[str], filaments: Optional[Filaments] = None):
+        self.job_name = job_name
+        self.filaments = filaments  # None until looked up by job name
+        self.tray: Optional[int] = None  # Last AMS tray reported active
+
+
+class UsageTracker:
+    """Follows prints through device reports and records their filament usage"""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.jobs: Dict[str, PrintUsage] = {}
+        # Started by PandaHerd but not yet reported running
+        self.expected: Dict[str, PrintUsage] = {}
+
+    def expect(self, printer_id: str, job_name: str, filaments: Filaments):
+        """Register the print a printer is about to start and the grams it uses per tray"""
+        self.expected[printer_id] = PrintUsage(job_name, filaments)
+
+    async def on_change(self, change: ChangeSet):
+        state = change.state
+        printer_id = change.device_id
+        job = self.jobs.get(printer_id)
+
+        if state.gcode_state in ACTIVE_STATES:
+            if job is None:
+                job = self.jobs[printer_id] = self._start(printer_id, state.job_name)
+            tray = _tray(state.active_tray)
+            if tray is not None:
+                job.tray = tray
+        elif job is not None and "gcode_state" in change.fields:
+            del self.jobs[printer_id]
+            if state.gcode_state == "FINISH":
+                await self._settle(printer_id, job, 1.0)
+            elif state.gcode_state == "FAILED":
+                await self._settle(printer_id, job, max(0, min(100, state.progress or 0)) / 100)
+
+    def _start(self, printer_id: str, job_name: Optional[str]) -> PrintUsage:
+        expected = self.expected.pop(printer_id, None)
+        if expected and (not job_name or expected.job_name == job_name
+                         or expected.job_name.startswith(f"{job_name}.")):
+            return expected
+        return PrintUsage(job_name)
+
+    async def _settle(self, printer_id: str, job: PrintUsage, fraction: float):
+        if fraction <= 0:
+            return
+        spools = await asyncio.get_running_loop().run_in_executor(
+            None, self._record, printer_id, job, fraction
+        )
+        if spools:
+            await printer_state.publisher.sync()
+
+    def _record(self, printer_id: str, job: PrintUsage, fraction: float) -> list:
+        with self.session_factory() as db:
+            filaments = job.filaments
+            if filaments is None:
+                file = LibraryRepository(db).find_by_job_name(job.job_name) if job.job_name else None
+                filaments = file_filaments(file) if file else []
+            if len(filaments) == 1 and job.tray is not None:
+                filaments = [(job.tray, filaments[0][1])]
+            if not filaments:
+                logger.info(f"No filament usage known for {job.job_name!r} on {printer_id}")
+                return []
+
+            repo = InventoryRepository(db)
+            loaded = {spool.slot: spool for spool in repo.search(printer_id=printer_id) if spool.slot}
+            records = []
+            for tray, grams in filaments:
+                spool = loaded.get(tray + 1) if tray is not None else None
+                if spool is None:
+                    logger.warning(f"No spool in tray {tray} of {printer_id} for {job.job_name!r}")
+                    continue
+                records.append(UsageRecord(
+                    spool_id=spool.id,
+                    job_name=job.job_name or "Unknown job",
+                    grams_used=round(grams * fraction, 2),
+                    notes=None if fraction == 1.0 else f"Failed at {fraction:.0%}"
+                ))
+            return repo.record_usage_bulk(records)
+
+
+usage_tracker = UsageTracker()
+device_states.add_listener(usage_tracker.on_change)
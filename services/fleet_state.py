@@ -0,0 +1,208 @@
+"""Versioned per-topic state with JSON-patch style deltas for WebSocket clients"""
+import asyncio
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.connections import Message, PubSubHub
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(key: str) -> str:
+    """Escape a key for use in a JSON pointer (RFC 6901)"""
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """Compute add/remove/replace operations turning old into new
+
+    Dicts are compared key by key and lists of equal length item by item;
+    anything else that differs is replaced whole.
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(diff(old[key], value, child))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for i, (a, b) in enumerate(zip(old, new)):
+            ops.extend(diff(a, b, f"{path}/{i}"))
+        return ops
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def _replace(tree: Dict[str, Any], path: Tuple[str, ...], value: Any) -> Dict[str, Any]:
+    """Copy of tree with value at path, sharing everything off the path"""
+    root = node = dict(tree)
+    for key in path[:-1]:
+        node[key] = dict(node[key])
+        node = node[key]
+    node[path[-1]] = value
+    return root
+
+
+class TopicState:
+    """Last published value of one topic and its version"""
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.version = 0
+        self.state: Any = None
+        self._snapshot: Optional[Message] = None
+
+    def snapshot_message(self) -> Message:
+        """Full state, built (and serialized) at most once per version"""
+        if self._snapshot is None:
+            self._snapshot = Message({
+                "topic": self.topic, "type": "snapshot", "version": self.version, "state": self.state
+            })
+        return self._snapshot
+
+    def update(self, value: Any) -> Optional[Message]:
+        """Store a new value and return the patch, or None if unchanged"""
+        # Round-trip through JSON so later in-place mutations are detected
+        # and values are exactly what clients see
+        current = json.loads(json.dumps(value, default=str))
+        ops = diff(self.state, current)
+        if not ops:
+            return None
+
+        self.state = current
+        return self._patch(ops)
+
+    def update_at(self, values: Dict[Tuple[str, ...], Any]) -> Optional[Message]:
+        """Store new values at the given key paths and return the patch, or None if unchanged
+
+        Only those paths are diffed. A path whose parent does not exist yet
+        is skipped; the next full update picks it up. The dicts along each
+        path are copied rather than changed, since queued messages that
+        have not been encoded yet still refer to the old tree.
+        """
+        ops = []
+        for path, value in values.items():
+            parent = self.state
+            for key in path[:-1]:
+                parent = parent.get(key) if isinstance(parent, dict) else None
+            if not isinstance(parent, dict):
+                continue
+            current = json.loads(json.dumps(value, default=str))
+            pointer = "".join(f"/{_escape(key)}" for key in path)
+            if path[-1] not in parent:
+                ops.append({"op": "add", "path": pointer, "value": current})
+            else:
+                path_ops = diff(parent[path[-1]], current, pointer)
+                if not path_ops:
+                    continue
+                ops.extend(path_ops)
+            self.state = _replace(self.state, path, current)
+        return self._patch(ops) if ops else None
+
+    def _patch(self, ops: List[Dict[str, Any]]) -> Message:
+        self.version += 1
+        self._snapshot = None
+        return Message({"topic": self.topic, "type": "patch", "version": self.version, "ops": ops})
+
+
+class StatePublisher:
+    """Single producer of WebSocket state updates
+
+    Each topic ("fleet", "printer/<id>", ...) is computed by a registered
+    view, diffed against what was last published, serialized once and
+    published to its subscribers. Views are only evaluated for topics
+    somebody is subscribed to. Clients get a snapshot when they subscribe
+    or miss a version, and apply patches in version order.
+    """
+
+    def __init__(self, hub: PubSubHub):
+        self.hub = hub
+        self.views: Dict[str, Callable[[Optional[str]], Any]] = {}
+        self.states: Dict[str, TopicState] = {}
+        self._lock = asyncio.Lock()
+
+    def register(self, name: str, view: Callable[[Optional[str]], Any]):
+        """Add a topic family; "name/arg" topics call view(arg), "name" calls view(None)"""
+        self.views[name] = view
+
+    def is_topic(self, topic: str) -> bool:
+        return topic.partition("/")[0] in self.views
+
+    def _evaluate(self, topic: str) -> Any:
+        name, _, arg = topic.partition("/")
+        return self.views[name](arg or None)
+
+    async def subscribe(self, websocket, topic: str):
+        """Subscribe a client to a topic and queue its snapshot
+
+        Bringing the topic up to date, subscribing and queuing the snapshot
+        happen under the lock with nothing awaited in between, so no patch
+        can reach the client ahead of its snapshot. Also used to resync.
+        """
+        async with self._lock:
+            state = self.states.get(topic)
+            if state is None:
+                # First subscriber: nobody else needs a patch
+                state = self.states[topic] = TopicState(topic)
+                state.update(self._evaluate(topic))
+            else:
+                patch = state.update(self._evaluate(topic))
+                if patch:
+                    self.hub.publish(topic, patch)
+            self.hub.subscribe(websocket, topic)
+            self.hub.send(websocket, state.snapshot_message())
+
+    async def sync(self) -> bool:
+        """Publish changes on every subscribed topic
+
+        Returns:
+            Whether anything changed
+        """
+        async with self._lock:
+            active = set(self.hub.topics())
+            # Forget topics nobody watches; a new subscriber starts from a snapshot
+            for topic in list(self.states):
+                if topic not in active:
+                    del self.states[topic]
+
+            changed = False
+            for topic in active:
+                state = self.states.get(topic)
+                if state is None:
+                    state = self.states[topic] = TopicState(topic)
+                patch = state.update(self._evaluate(topic))
+                if patch:
+                    self.hub.publish(topic, patch)
+                    changed = True
+            return changed
+
+    async def patch(self, topic: str, values: Dict[Tuple[str, ...], Any]):
+        """Publish new values at key paths of one topic without evaluating its view
+
+        For callers that know exactly what changed, e.g. a printer report
+        touching a few sections; topics nobody subscribed to are skipped.
+        """
+        async with self._lock:
+            state = self.states.get(topic)
+            if state is None or state.state is None:
+                return
+            patch = state.update_at(values)
+            if patch:
+                self.hub.publish(topic, patch)
+
+    async def run(self, interval: float = 1.0):
+        """Poll subscribed topics for changes until cancelled"""
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Failed to publish state updates: {e}")
+            await asyncio.sleep(interval)
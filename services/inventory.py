@@ -0,0 +1,313 @@
+"""Persistence for the filament spool inventory"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from models.filament import FilamentSpool, UsageRecord
+from models.inventory import Spool, SpoolUsage, SpoolWeighing
+from services.library import normalize_color
+
+# Columns the inventory can be totalled by
+GROUP_COLUMNS = {
+    "material": Spool.material,
+    "color": Spool.color,
+    "brand": Spool.brand,
+}
+
+MAX_PAGE_SIZE = 500
+MAX_BULK_RECORDS = 50000
+
+# Serialized spools by id, kept in step with every write for the "filament" topic
+spool_views: Dict[str, Dict[str, Any]] = {}
+# Called with each spool's view after it is written or loaded
+view_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def _utc(timestamp: datetime) -> datetime:
+    """Naive UTC, as stored; naive input is taken to be UTC already"""
+    if timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _publish(spool: Spool):
+    view = spool_views[spool.id] = spool.to_dict()
+    for listener in view_listeners:
+        listener(view)
+
+
+def load_views(db: Session):
+    """Fill spool_views from the database"""
+    spool_views.clear()
+    for spool in db.scalars(select(Spool)):
+        _publish(spool)
+
+
+class InventoryRepository:
+    """Queries and updates filament spools through a database session"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get(self, spool_id: str) -> Optional[Spool]:
+        """Look up a spool by id (primary key)"""
+        return self.db.get(Spool, spool_id)
+
+    def search(
+        self,
+        spool_ids: Iterable[str] = (),
+        material: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        printer_id: Optional[str] = None,
+        max_remaining_pct: Optional[float] = None,
+    ) -> List[Spool]:
+        """Spools matching every given filter, ordered by id"""
+        stmt = select(Spool)
+        spool_ids = list(spool_ids)
+        if spool_ids:
+            stmt = stmt.where(Spool.id.in_(spool_ids))
+        if material:
+            stmt = stmt.where(Spool.material == material)
+        if color:
+            stmt = stmt.where(Spool.color == normalize_color(color))
+        if brand:
+            stmt = stmt.where(Spool.brand == brand)
+        if printer_id:
+            stmt = stmt.where(Spool.printer_id == printer_id)
+        if max_remaining_pct is not None:
+            stmt = stmt.where(Spool.remaining_pct <= max_remaining_pct)
+        return list(self.db.scalars(stmt.order_by(Spool.id)))
+
+    def summary(self, low_stock_pct: float = settings.filament_low_stock_pct) -> Dict[str, Any]:
+        """Spool count, filament left in grams and low-stock count of the whole inventory"""
+        spools, remaining, low = self.db.execute(select(
+            func.count(),
+            func.coalesce(func.sum(Spool.remaining_g), 0.0),
+            func.coalesce(func.sum(case((Spool.remaining_pct <= low_stock_pct, 1), else_=0)), 0)
+        ).select_from(Spool)).one()
+        return {"total_spools": spools, "total_weight": round(remaining, 1), "low_stock_count": low}
+
+    def totals(self, by: str, low_stock_pct: float = settings.filament_low_stock_pct) -> List[Dict[str, Any]]:
+        """Inventory totals grouped by material, color or brand"""
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by {by}; use one of {', '.join(GROUP_COLUMNS)}")
+        key = GROUP_COLUMNS[by]
+        rows = self.db.execute(
+            select(
+                key,
+                func.count(),
+                func.sum(Spool.remaining_g),
+                func.sum(Spool.total_used_g),
+                func.sum(Spool.total_purge_g),
+                func.sum(case((Spool.remaining_pct <= low_stock_pct, 1), else_=0))
+            ).group_by(key).order_by(key)
+        )
+        return [
+            {
+                by: value,
+                "spools": spools,
+                "remaining_g": round(remaining, 1),
+                "used_g": round(used, 1),
+                "purge_g": round(purge, 1),
+                "low_stock_count": low,
+            }
+            for value, spools, remaining, used, purge, low in rows
+        ]
+
+    def low_stock(self, low_stock_pct: float = settings.filament_low_stock_pct) -> List[Spool]:
+        """Spools at or below the threshold, emptiest first"""
+        return list(self.db.scalars(
+            select(Spool).where(Spool.remaining_pct <= low_stock_pct).order_by(Spool.remaining_pct, Spool.id)
+        ))
+
+    def usage(
+        self, spool_id: str, limit: int = 50, before: Optional[int] = None
+    ) -> Tuple[List[SpoolUsage], Optional[int]]:
+        """Usage records of a spool, newest first, one page at a time
+
+        Returns:
+            The page of records and the value of before for the next page
+            (None at the end)
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        stmt = select(SpoolUsage).where(SpoolUsage.spool_id == spool_id)
+        if before is not None:
+            stmt = stmt.where(SpoolUsage.id < before)
+        records = list(self.db.scalars(stmt.order_by(SpoolUsage.id.desc()).limit(limit + 1)))
+        if len(records) > limit:
+            return records[:limit], records[limit - 1].id
+        return records, None
+
+    def add(self, spool: FilamentSpool, printer_id: Optional[str] = None, slot: Optional[int] = None,
+            color_name: Optional[str] = None) -> Spool:
+        """Store a new spool together with any history it already has"""
+        color = normalize_color(spool.color)
+        if color is None:
+            raise ValueError(f"Invalid color: {spool.color}")
+        if self.get(spool.id) is not None:
+            raise ValueError(f"Spool {spool.id} already exists")
+
+        log = spool.usage_history
+        row = Spool(
+            id=spool.id,
+            name=spool.name,
+            brand=spool.brand,
+            material=spool.material,
+            color=color,
+            color_name=color_name,
+            initial_weight_g=spool.initial_weight_g,
+            empty_spool_weight_g=spool.empty_spool_weight_g,
+            total_used_g=spool.total_used_g,
+            total_purge_g=spool.total_purge_g,
+            printer_id=printer_id,
+            slot=slot,
+            last_used_at=datetime.utcfromtimestamp(log.timestamps[-1]) if len(log) else None
+        )
+        row.set_remaining(spool.get_remaining_weight())
+        self.db.add(row)
+        self.db.flush()
+        if len(log):
+            self.db.execute(insert(SpoolUsage), [
+                {
+                    "spool_id": spool.id,
+                    "timestamp": datetime.utcfromtimestamp(timestamp),
+                    "job_name": job_name,
+                    "grams_used": grams,
+                    "purge_tower_grams": purge,
+                    "notes": log.notes.get(i),
+                }
+                for i, (timestamp, job_name, grams, purge)
+                in enumerate(zip(log.timestamps, log.job_names, log.grams_used, log.purge_tower_grams))
+            ])
+        for measurement in spool.weight_measurements:
+            self.db.add(SpoolWeighing(
+                spool_id=spool.id,
+                timestamp=measurement.timestamp,
+                total_weight_g=measurement.total_weight_g,
+                notes=measurement.notes
+            ))
+        self._commit([row])
+        return row
+
+    def record_usage(
+        self,
+        spool_id: str,
+        job_name: str,
+        grams_used: float,
+        purge_tower_grams: float = 0.0,
+        notes: Optional[str] = None
+    ) -> Optional[Spool]:
+        """Record filament used by a print job, or None if the spool does not exist"""
+        spool = self.get(spool_id)
+        if spool is None:
+            return None
+        if grams_used < 0 or purge_tower_grams < 0:
+            raise ValueError("Filament usage cannot be negative")
+        self.record_usage_bulk([UsageRecord(
+            spool_id=spool_id,
+            job_name=job_name,
+            grams_used=grams_used,
+            purge_tower_grams=purge_tower_grams,
+            notes=notes
+        )])
+        return spool
+
+    def record_usage_bulk(self, records: Sequence[UsageRecord]) -> List[Spool]:
+        """Record many usage records in one transaction
+
+        Usage timestamped before a spool's latest weighing is already part
+        of the measured weight, so it only adds to the usage totals.
+
+        Returns:
+            The spools that were updated
+
+        Raises:
+            ValueError: If a record names an unknown spool (nothing is recorded)
+        """
+        if len(records) > MAX_BULK_RECORDS:
+            raise ValueError(f"At most {MAX_BULK_RECORDS} usage records can be recorded at once")
+        ids = {record.spool_id for record in records}
+        if not ids:
+            return []
+        spools = {spool.id: spool for spool in self.db.scalars(select(Spool).where(Spool.id.in_(ids)))}
+        missing = ids - spools.keys()
+        if missing:
+            raise ValueError(f"Spools not found: {', '.join(sorted(missing))}")
+        weighed = dict(self.db.execute(
+            select(SpoolWeighing.spool_id, func.max(SpoolWeighing.timestamp))
+            .where(SpoolWeighing.spool_id.in_(ids))
+            .group_by(SpoolWeighing.spool_id)
+        ).all())
+
+        now = datetime.utcnow()
+        deducted = dict.fromkeys(ids, 0.0)
+        rows = []
+        for record in records:
+            timestamp = _utc(record.timestamp) if record.timestamp else now
+            spool = spools[record.spool_id]
+            spool.total_used_g += record.grams_used
+            spool.total_purge_g += record.purge_tower_grams
+            if record.spool_id not in weighed or timestamp > weighed[record.spool_id]:
+                deducted[record.spool_id] += record.grams_used + record.purge_tower_grams
+            if spool.last_used_at is None or timestamp > spool.last_used_at:
+                spool.last_used_at = timestamp
+            rows.append({
+                "spool_id": record.spool_id,
+                "timestamp": timestamp,
+                "job_name": record.job_name,
+                "grams_used": record.grams_used,
+                "purge_tower_grams": record.purge_tower_grams,
+                "notes": record.notes,
+            })
+        for spool_id, grams in deducted.items():
+            spools[spool_id].set_remaining(spools[spool_id].remaining_g - grams)
+        self.db.execute(insert(SpoolUsage), rows)
+        self._commit(spools.values())
+        return list(spools.values())
+
+    def record_weight(self, spool_id: str, total_weight_g: float, notes: Optional[str] = None) -> Optional[Spool]:
+        """Record a manual weight measurement, or None if the spool does not exist"""
+        spool = self.get(spool_id)
+        if spool is None:
+            return None
+        if total_weight_g < spool.empty_spool_weight_g:
+            raise ValueError(
+                f"Total weight ({total_weight_g}g) cannot be less than "
+                f"empty spool weight ({spool.empty_spool_weight_g}g)"
+            )
+
+        self.db.add(SpoolWeighing(spool_id=spool_id, total_weight_g=total_weight_g, notes=notes))
+        spool.set_remaining(total_weight_g - spool.empty_spool_weight_g)
+        self._commit([spool])
+        return spool
+
+    def seed(self, spools: Iterable[Dict[str, Any]]):
+        """Add spools given as dicts (see Spool.to_dict) if the inventory is empty"""
+        if self.db.scalar(select(func.count()).select_from(Spool)):
+            return
+        for data in spools:
+            row = Spool(
+                id=data["id"],
+                name=data["name"],
+                brand=data.get("brand", ""),
+                material=data["material"],
+                color=normalize_color(data["color"]),
+                color_name=data.get("color_name"),
+                initial_weight_g=data.get("initial_weight_g", 1000.0),
+                empty_spool_weight_g=data.get("empty_spool_g", 250.0),
+                printer_id=data.get("printer"),
+                slot=data.get("slot"),
+                last_used_at=data.get("last_used_at")
+            )
+            row.set_remaining(data["remaining_pct"] / 100 * row.initial_weight_g)
+            self.db.add(row)
+        self.db.commit()
+
+    def _commit(self, spools: Iterable[Spool]):
+        self.db.commit()
+        for spool in spools:
+            _publish(spool)
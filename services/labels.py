@@ -0,0 +1,251 @@
+"""Printable QR label sheets for filament spools
+
+Pages are rendered in a process pool and streamed out one at a time, so a
+sheet for hundreds of spools neither blocks the event loop nor has to be
+held in memory as a whole.
+"""
+import asyncio
+import io
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+from pydantic import BaseModel, Field
+
+from services.qrcodes import render_qr_code, spool_qr_data
+
+PAGE_SIZES_MM = {"A4": (210.0, 297.0), "Letter": (215.9, 279.4)}
+
+MM_PER_INCH = 25.4
+POINTS_PER_INCH = 72
+
+
+class LabelLayout(BaseModel):
+    """Grid of labels on a page"""
+    page_size: str = Field(default="A4", pattern="^(A4|Letter)$")
+    columns: int = Field(default=3, ge=1, le=10)
+    rows: int = Field(default=8, ge=1, le=30)
+    margin_mm: float = Field(default=8.0, ge=0, le=50)
+    gap_mm: float = Field(default=2.0, ge=0, le=20)
+    dpi: int = Field(default=200, ge=72, le=600)
+
+    @property
+    def per_page(self) -> int:
+        return self.columns * self.rows
+
+    @property
+    def page_mm(self):
+        return PAGE_SIZES_MM[self.page_size]
+
+    @property
+    def page_px(self):
+        return tuple(round(mm / MM_PER_INCH * self.dpi) for mm in self.page_mm)
+
+    @property
+    def page_points(self):
+        return tuple(mm / MM_PER_INCH * POINTS_PER_INCH for mm in self.page_mm)
+
+    def px(self, mm: float) -> int:
+        return round(mm / MM_PER_INCH * self.dpi)
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow without FreeType only has the fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _fit_text(draw: ImageDraw.ImageDraw, text: str, font, max_width: int) -> str:
+    """Truncate text with an ellipsis so it fits max_width"""
+    if draw.textlength(text, font=font) <= max_width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > max_width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _draw_label(page: Image.Image, spool: Dict[str, Any], box, layout: LabelLayout):
+    """Draw one spool label (QR code, name, material and color swatch) into box"""
+    left, top, right, bottom = box
+    draw = ImageDraw.Draw(page)
+    draw.rectangle(box, outline=(200, 200, 200), width=1)
+
+    padding = layout.px(1.5)
+    qr_side = max(1, min(bottom - top, right - left) - 2 * padding)
+    with Image.open(io.BytesIO(render_qr_code(spool_qr_data(spool["id"]), 10, "png"))) as qr:
+        page.paste(qr.convert("RGB").resize((qr_side, qr_side), Image.NEAREST), (left + padding, top + padding))
+
+    text_left = left + qr_side + 2 * padding
+    text_width = right - padding - text_left
+    if text_width <= 0:
+        return
+
+    height = bottom - top
+    title, body, small = _font(max(8, height // 6)), _font(max(7, height // 8)), _font(max(6, height // 10))
+    y = top + padding
+    lines = [
+        (spool.get("name") or spool["id"], title),
+        (spool.get("brand") or "", body),
+        (f"{spool.get('material', '')} · {spool.get('color_name') or spool.get('color', '')}", body),
+    ]
+    for text, font in lines:
+        if text:
+            draw.text((text_left, y), _fit_text(draw, text, font, text_width), fill=(0, 0, 0), font=font)
+        y += round(font.size * 1.25) if hasattr(font, "size") else 12
+
+    swatch = max(6, height // 6)
+    if y + swatch <= bottom - padding:
+        draw.rectangle(
+            (text_left, y, text_left + swatch, y + swatch),
+            fill=spool.get("color") or "#FFFFFF", outline=(0, 0, 0)
+        )
+        draw.text(
+            (text_left + swatch + padding, y),
+            _fit_text(draw, spool["id"], small, text_width - swatch - padding),
+            fill=(80, 80, 80), font=small
+        )
+
+
+def render_label_page(spools: List[Dict[str, Any]], layout: LabelLayout, format: str = "jpeg") -> bytes:
+    """Render a single page of labels (runs in a worker process)"""
+    width, height = layout.page_px
+    page = Image.new("RGB", (width, height), "white")
+
+    margin, gap = layout.px(layout.margin_mm), layout.px(layout.gap_mm)
+    cell_w = (width - 2 * margin - (layout.columns - 1) * gap) // layout.columns
+    cell_h = (height - 2 * margin - (layout.rows - 1) * gap) // layout.rows
+    for i, spool in enumerate(spools[:layout.per_page]):
+        row, col = divmod(i, layout.columns)
+        left = margin + col * (cell_w + gap)
+        top = margin + row * (cell_h + gap)
+        _draw_label(page, spool, (left, top, left + cell_w, top + cell_h), layout)
+
+    buffer = io.BytesIO()
+    if format == "png":
+        page.save(buffer, "PNG", optimize=True)
+    else:
+        page.save(buffer, "JPEG", quality=90, dpi=(layout.dpi, layout.dpi))
+    return buffer.getvalue()
+
+
+class PdfStreamWriter:
+    """Minimal PDF writer emitting one full-page JPEG per page as it goes
+
+    Object 1 is the catalog and object 2 the page tree; both are written
+    last, once every page object number is known.
+    """
+
+    def __init__(self, width_pt: float, height_pt: float):
+        self.width_pt = width_pt
+        self.height_pt = height_pt
+        self.offsets: Dict[int, int] = {}
+        self.position = 0
+        self.next_object = 3
+        self.pages: List[int] = []
+
+    def _emit(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def _object(self, number: int, body: bytes, stream: Optional[bytes] = None) -> bytes:
+        self.offsets[number] = self.position
+        data = f"{number} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        return self._emit(data + b"\nendobj\n")
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, jpeg: bytes, width_px: int, height_px: int) -> bytes:
+        image, content, page = self.next_object, self.next_object + 1, self.next_object + 2
+        self.next_object += 3
+        self.pages.append(page)
+
+        draw = f"q {self.width_pt:.2f} 0 0 {self.height_pt:.2f} 0 0 cm /Im0 Do Q".encode()
+        return b"".join((
+            self._object(image, (
+                f"<< /Type /XObject /Subtype /Image /Width {width_px} /Height {height_px} "
+                f"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode /Length {len(jpeg)} >>"
+            ).encode(), jpeg),
+            self._object(content, f"<< /Length {len(draw)} >>".encode(), draw),
+            self._object(page, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.width_pt:.2f} {self.height_pt:.2f}] "
+                f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>"
+            ).encode()),
+        ))
+
+    def close(self) -> bytes:
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        data = self._object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode())
+        data += self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self.position
+        count = self.next_object
+        xref = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        xref += [f"{self.offsets[n]:010d} 00000 n \n" for n in range(1, count)]
+        xref.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return data + self._emit("".join(xref).encode())
+
+
+class LabelRenderer:
+    """Renders label sheet pages in a process pool with a bounded number in flight"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @staticmethod
+    def page_count(spools: List[Dict[str, Any]], layout: LabelLayout) -> int:
+        return max(1, -(-len(spools) // layout.per_page))
+
+    async def render_page(
+        self, spools: List[Dict[str, Any]], layout: LabelLayout, page: int, format: str = "png"
+    ) -> bytes:
+        """Render one page (0-based) of the sheet"""
+        if self._pool is None:
+            raise RuntimeError("Label renderer not started")
+        chunk = spools[page * layout.per_page:(page + 1) * layout.per_page]
+        return await asyncio.get_running_loop().run_in_executor(
+            self._pool, render_label_page, chunk, layout, format
+        )
+
+    async def stream_pdf(self, spools: List[Dict[str, Any]], layout: LabelLayout) -> AsyncIterator[bytes]:
+        """Yield a PDF of the whole sheet, one page at a time
+
+        At most two pages per worker are rendering or waiting to be sent,
+        which bounds memory regardless of the number of labels.
+        """
+        if self._pool is None:
+            raise RuntimeError("Label renderer not started")
+        loop = asyncio.get_running_loop()
+        width_px, height_px = layout.page_px
+        writer = PdfStreamWriter(*layout.page_points)
+        pending: deque = deque()
+        window = self.max_workers * 2
+
+        yield writer.header()
+        try:
+            for page in range(self.page_count(spools, layout)):
+                chunk = spools[page * layout.per_page:(page + 1) * layout.per_page]
+                pending.append(loop.run_in_executor(self._pool, render_label_page, chunk, layout, "jpeg"))
+                if len(pending) >= window:
+                    yield writer.add_page(await pending.popleft(), width_px, height_px)
+            while pending:
+                yield writer.add_page(await pending.popleft(), width_px, height_px)
+            yield writer.close()
+        finally:
+            # Client went away: drop pages that have not started yet
+            for future in pending:
+                future.cancel()
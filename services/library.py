@@ -0,0 +1,246 @@
+"""Persistence for the 3MF file library"""
+import base64
+import json
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, column, delete, exists, func, insert, literal_column, or_, select, table
+from sqlalchemy.orm import Session
+
+from models.library import LibraryFile, LibraryFileColor
+
+# Full-text index created alongside the models (see models/library.py)
+library_fts = table("library_files_fts", column("file_id"), column("name"), column("keywords"))
+
+# Sortable columns; nullable ones sort as 0 so cursors stay comparable
+SORT_COLUMNS = {
+    "uploaded_at": LibraryFile.uploaded_at,
+    "name": LibraryFile.name,
+    "size": LibraryFile.size_bytes,
+    "print_time": func.coalesce(LibraryFile.print_time_minutes, 0),
+    "volume": func.coalesce(LibraryFile.volume_cm3, 0),
+}
+
+MAX_PAGE_SIZE = 100
+
+
+def normalize_color(color: str) -> Optional[str]:
+    """Normalize a filament color to "#RRGGBB" (drops any alpha channel)"""
+    match = re.fullmatch(r"#?([0-9a-fA-F]{6})(?:[0-9a-fA-F]{2})?", (color or "").strip())
+    return f"#{match.group(1).upper()}" if match else None
+
+
+def parse_print_time(value: Optional[str]) -> Optional[int]:
+    """Convert an estimate such as "2h 15m" into minutes"""
+    parts = re.findall(r"(\d+)\s*([dhms])", value or "")
+    if not parts:
+        return None
+    factors = {"d": 1440, "h": 60, "m": 1, "s": 1 / 60}
+    return int(sum(int(amount) * factors[unit] for amount, unit in parts))
+
+
+def _fts_query(text: str) -> Optional[str]:
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words) or None
+
+
+def _encode_cursor(value: Any, file_id: str) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, file_id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str, sort: str) -> Tuple[Any, str]:
+    try:
+        value, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == "uploaded_at":
+            value = datetime.fromisoformat(value)
+        return value, file_id
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class LibraryRepository:
+    """Queries and updates library files through a database session"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.full_text = db.get_bind().dialect.name == "sqlite"
+
+    def get(self, file_id: str) -> Optional[LibraryFile]:
+        """Look up a file by id (primary key)"""
+        return self.db.get(LibraryFile, file_id)
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        material: Optional[str] = None,
+        min_print_minutes: Optional[int] = None,
+        max_print_minutes: Optional[int] = None,
+        bed: Optional[Tuple[Optional[float], Optional[float], Optional[float]]] = None,
+        colors: Iterable[str] = (),
+        sort: str = "uploaded_at",
+        descending: bool = True,
+        limit: int = 24,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[LibraryFile], Optional[str]]:
+        """Find files matching the given filters, one page at a time
+
+        Args:
+            query: Free text matched against names and extracted metadata
+            bed: (width, depth, height) in mm the model has to fit, in either
+                orientation on the plate; any dimension may be None
+            colors: Filament colors the file must all use
+            cursor: next_cursor from the previous page
+
+        Returns:
+            The page of files and the cursor for the next page (None at the end)
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort field: {sort}")
+        sort_column = SORT_COLUMNS[sort]
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        stmt = select(LibraryFile)
+
+        if query:
+            match = _fts_query(query)
+            if match and self.full_text:
+                stmt = stmt.where(LibraryFile.id.in_(
+                    select(library_fts.c.file_id)
+                    .where(literal_column("library_files_fts").op("MATCH")(match))
+                ))
+            elif match:
+                stmt = stmt.where(LibraryFile.name.ilike(f"%{query}%"))
+        if category:
+            stmt = stmt.where(LibraryFile.category == category)
+        if material:
+            stmt = stmt.where(LibraryFile.material == material)
+        if min_print_minutes is not None:
+            stmt = stmt.where(LibraryFile.print_time_minutes >= min_print_minutes)
+        if max_print_minutes is not None:
+            stmt = stmt.where(LibraryFile.print_time_minutes <= max_print_minutes)
+        if bed:
+            stmt = stmt.where(*self._fits_bed(*bed))
+
+        wanted = {c for c in (normalize_color(c) for c in colors) if c}
+        if wanted:
+            stmt = stmt.where(LibraryFile.id.in_(
+                select(LibraryFileColor.file_id)
+                .where(LibraryFileColor.color.in_(wanted))
+                .group_by(LibraryFileColor.file_id)
+                .having(func.count() == len(wanted))
+            ))
+
+        # Keyset pagination on (sort value, id) so deep pages stay cheap
+        if cursor:
+            value, file_id = _decode_cursor(cursor, sort)
+            if descending:
+                stmt = stmt.where(or_(sort_column < value, and_(sort_column == value, LibraryFile.id < file_id)))
+            else:
+                stmt = stmt.where(or_(sort_column > value, and_(sort_column == value, LibraryFile.id > file_id)))
+
+        order = (sort_column.desc(), LibraryFile.id.desc()) if descending else (sort_column.asc(), LibraryFile.id.asc())
+        rows = self.db.execute(stmt.add_columns(sort_column).order_by(*order).limit(limit + 1)).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1][1], rows[-1][0].id)
+        return [row[0] for row in rows], next_cursor
+
+    @staticmethod
+    def _fits_bed(width: Optional[float], depth: Optional[float], height: Optional[float]) -> list:
+        # A bed given by a single side is treated as square
+        width = width if width is not None else depth
+        depth = depth if depth is not None else width
+        conditions = []
+        if width is not None:
+            conditions.append(or_(
+                and_(LibraryFile.width <= width, LibraryFile.depth <= depth),
+                and_(LibraryFile.width <= depth, LibraryFile.depth <= width),
+            ))
+        if height is not None:
+            conditions.append(LibraryFile.height <= height)
+        return conditions
+
+    def find_by_job_name(self, job_name: str) -> Optional[LibraryFile]:
+        """Newest file a printer would report as job_name ("benchy" for benchy.3mf)"""
+        names = [job_name, f"{job_name}.3mf", f"{job_name}.gcode.3mf"]
+        return self.db.scalars(
+            select(LibraryFile).where(LibraryFile.name.in_(names)).order_by(LibraryFile.uploaded_at.desc())
+        ).first()
+
+    def categories(self) -> List[str]:
+        """Distinct categories in use, alphabetically"""
+        return self.db.scalars(
+            select(LibraryFile.category).distinct().order_by(LibraryFile.category)
+        ).all()
+
+    def has_blob(self, sha256: str) -> bool:
+        """Whether any file still references the given content hash"""
+        return self.db.scalar(select(exists().where(LibraryFile.sha256 == sha256)))
+
+    def add_from_analysis(
+        self, filename: str, sha256: str, size_bytes: int, analysis: Dict[str, Any]
+    ) -> LibraryFile:
+        """Create a library entry from ThreeMFAnalyzer.analyze() output"""
+        model_info = analysis.get('model_info') or {}
+        print_settings = analysis.get('print_settings') or {}
+        bambu_metadata = analysis.get('bambu_metadata') or {}
+        dimensions = model_info.get('dimensions') or {}
+        print_time = model_info.get('estimated_print_time', 'Unknown')
+        filaments = bambu_metadata.get('ams_mapping') or []
+        colors = {c for c in (normalize_color(f.get('color')) for f in filaments) if c}
+
+        file = LibraryFile(
+            id=f"file-{uuid.uuid4().hex[:12]}",
+            name=filename,
+            sha256=sha256,
+            category="Uncategorized",
+            material=print_settings.get('material') or 'PLA',
+            size_bytes=size_bytes,
+            print_time=print_time,
+            print_time_minutes=parse_print_time(print_time),
+            thumbnails=analysis.get('thumbnails') or [],
+            width=dimensions.get('width'),
+            depth=dimensions.get('depth'),
+            height=dimensions.get('height'),
+            volume_cm3=model_info.get('volume_cm3', 0),
+            vertices=model_info.get('vertices', 0),
+            triangles=model_info.get('triangles', 0),
+            estimated_material_grams=model_info.get('estimated_material_grams'),
+            print_settings=print_settings,
+            bambu_metadata=bambu_metadata,
+            colors=[LibraryFileColor(color=c) for c in sorted(colors)]
+        )
+        self.db.add(file)
+        self._index(file)
+        self.db.commit()
+        return file
+
+    def delete(self, file: LibraryFile):
+        if self.full_text:
+            self.db.execute(delete(library_fts).where(library_fts.c.file_id == file.id))
+        self.db.delete(file)
+        self.db.commit()
+
+    def _index(self, file: LibraryFile):
+        """Add a file's name and metadata to the full-text index"""
+        if not self.full_text:
+            return
+        filaments = (file.bambu_metadata or {}).get('ams_mapping') or []
+        plate_info = (file.bambu_metadata or {}).get('plate_info') or {}
+        keywords = [file.category, file.material, plate_info.get('plate_type')]
+        keywords += [v for v in (file.print_settings or {}).values() if v]
+        for filament in filaments:
+            keywords += [filament.get('name'), filament.get('type'), filament.get('color')]
+        self.db.execute(insert(library_fts).values(
+            file_id=file.id,
+            name=file.name,
+            keywords=" ".join(str(k) for k in keywords if k)
+        ))
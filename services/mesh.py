@@ -0,0 +1,223 @@
+"""Streaming mesh extraction for 3MF model parts"""
+from typing import IO, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+import numpy as np
+
+# Number of vertices/triangles converted to NumPy at a time
+CHUNK_SIZE = 65536
+
+# Guard against cyclic component references
+MAX_COMPONENT_DEPTH = 16
+
+IDENTITY = np.eye(4)
+
+
+def _local_name(tag: str) -> str:
+    """Strip the XML namespace from a tag"""
+    return tag.rsplit('}', 1)[-1]
+
+
+class _ChunkedArray:
+    """Collects attribute triples and converts them to an (N, 3) array in chunks"""
+
+    def __init__(self, keys: tuple, dtype):
+        self.keys = keys
+        self.dtype = dtype
+        self._pending: List[str] = []
+        self._chunks: List[np.ndarray] = []
+
+    def append(self, attrib: dict) -> bool:
+        """Queue one row; returns True when a chunk was flushed"""
+        a, b, c = self.keys
+        self._pending.append(attrib.get(a))
+        self._pending.append(attrib.get(b))
+        self._pending.append(attrib.get(c))
+        if len(self._pending) >= CHUNK_SIZE * 3:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        """Convert pending string values into a NumPy chunk"""
+        if self._pending:
+            chunk = np.array(self._pending, dtype=self.dtype).reshape(-1, 3)
+            self._chunks.append(chunk)
+            self._pending = []
+
+    def to_array(self) -> np.ndarray:
+        """Return all rows as a single contiguous array"""
+        self.flush()
+        if not self._chunks:
+            return np.empty((0, 3), dtype=self.dtype)
+        if len(self._chunks) == 1:
+            return self._chunks[0]
+        return np.concatenate(self._chunks)
+
+
+class Mesh:
+    """Vertex and triangle arrays of a single 3MF mesh object"""
+
+    __slots__ = ('object_id', 'vertices', 'triangles')
+
+    def __init__(self, object_id: str, vertices: np.ndarray, triangles: np.ndarray):
+        self.object_id = object_id
+        self.vertices = vertices  # (N, 3) float64, millimetres
+        self.triangles = triangles  # (M, 3) int64 vertex indices
+
+    def bounds(self) -> Optional[np.ndarray]:
+        """Return a (2, 3) array of min/max corners, or None for an empty mesh"""
+        if not len(self.vertices):
+            return None
+        return np.stack((self.vertices.min(axis=0), self.vertices.max(axis=0)))
+
+
+class Component(NamedTuple):
+    """Reference to an object, optionally in another model part, with a transform"""
+    object_id: str
+    path: Optional[str]
+    transform: np.ndarray
+
+
+class Model:
+    """Meshes, component assemblies and build items of one 3MF model part"""
+
+    def __init__(self):
+        self.meshes: Dict[str, Mesh] = {}
+        self.components: Dict[str, List[Component]] = {}
+        self.names: Dict[str, str] = {}
+        self.items: List[Component] = []
+
+
+def parse_transform(value: Optional[str]) -> np.ndarray:
+    """Convert a 3MF 3x4 transform attribute into a 4x4 row-vector matrix"""
+    if not value:
+        return IDENTITY
+    values = np.array(value.split(), dtype=np.float64)
+    if values.size != 12:
+        raise ValueError(f"Invalid transform: {value!r}")
+    matrix = np.eye(4)
+    matrix[:, :3] = values.reshape(4, 3)
+    return matrix
+
+
+def _reference(attrib: dict) -> Component:
+    """Build a Component from a <component> or <item> element's attributes"""
+    path = next((v for k, v in attrib.items() if _local_name(k) == 'path'), None)
+    return Component(attrib.get('objectid'), path, parse_transform(attrib.get('transform')))
+
+
+def read_model(stream: IO[bytes]) -> Model:
+    """Incrementally parse a 3MF model stream
+
+    Elements are cleared as soon as they have been consumed so memory use is
+    bounded by the NumPy arrays of the meshes rather than by the size of the
+    XML document.
+    """
+    model = Model()
+    object_id = None
+    vertices = triangles = None
+    container = None
+
+    for event, elem in ET.iterparse(stream, events=('start', 'end')):
+        name = _local_name(elem.tag)
+
+        if event == 'start':
+            if name == 'object':
+                object_id = elem.get('id')
+                if elem.get('name'):
+                    model.names[object_id] = elem.get('name')
+            elif name == 'mesh':
+                vertices = _ChunkedArray(('x', 'y', 'z'), np.float64)
+                triangles = _ChunkedArray(('v1', 'v2', 'v3'), np.int64)
+            elif name in ('vertices', 'triangles'):
+                container = elem
+            continue
+
+        if name == 'vertex' and vertices is not None:
+            if vertices.append(elem.attrib):
+                container.clear()
+        elif name == 'triangle' and triangles is not None:
+            if triangles.append(elem.attrib):
+                container.clear()
+        elif name in ('vertices', 'triangles'):
+            elem.clear()
+            container = None
+        elif name == 'mesh':
+            model.meshes[object_id] = Mesh(object_id, vertices.to_array(), triangles.to_array())
+            vertices = triangles = None
+            elem.clear()
+        elif name == 'component':
+            model.components.setdefault(object_id, []).append(_reference(elem.attrib))
+            elem.clear()
+        elif name == 'item':
+            model.items.append(_reference(elem.attrib))
+            elem.clear()
+        elif name == 'object':
+            object_id = None
+            elem.clear()
+
+    # Models without a build section place every mesh object as-is
+    if not model.items:
+        model.items = [Component(oid, None, IDENTITY) for oid in model.meshes]
+    return model
+
+
+def iter_instances(
+    model: Model,
+    load: Callable[[str], Model],
+    ref: Component,
+    transform: np.ndarray = IDENTITY,
+    depth: int = 0
+) -> Iterator[Tuple[Mesh, np.ndarray]]:
+    """Expand a reference into (mesh, world transform) pairs
+
+    Component references are followed recursively; references carrying a
+    production-extension path are resolved through ``load``.
+    """
+    if depth > MAX_COMPONENT_DEPTH:
+        raise ValueError("Component nesting too deep (cyclic reference?)")
+    if ref.path:
+        model = load(ref.path)
+    world = ref.transform @ transform
+
+    mesh = model.meshes.get(ref.object_id)
+    if mesh is not None:
+        yield mesh, world
+    for child in model.components.get(ref.object_id, []):
+        yield from iter_instances(model, load, child, world, depth + 1)
+
+
+def measure(mesh: Mesh, transform: np.ndarray = IDENTITY) -> Dict[str, Any]:
+    """Compute volume (mm³), surface area (mm²) and bounds of a placed mesh
+
+    Volume is the sum of signed tetrahedra formed by each triangle and a
+    common origin, computed in batches to bound temporary memory. A
+    mirroring transform reverses the winding, so its sign is undone and
+    the volume keeps the sign of the mesh's own orientation.
+    """
+    if not len(mesh.vertices):
+        return {'volume': 0.0, 'area': 0.0, 'bounds': None}
+
+    vertices = mesh.vertices @ transform[:3, :3] + transform[3, :3]
+    # Measure relative to the centroid to limit cancellation error
+    origin = vertices.mean(axis=0)
+    volume = 0.0
+    area = 0.0
+
+    for start in range(0, len(mesh.triangles), CHUNK_SIZE):
+        corners = vertices[mesh.triangles[start:start + CHUNK_SIZE]]
+        v0 = corners[:, 0] - origin
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        area += 0.5 * float(np.linalg.norm(normals, axis=1).sum())
+        # Triple product of the tetrahedron (origin, v0, v1, v2)
+        volume += float(np.einsum('ij,ij->', v0, normals)) / 6.0
+
+    if np.linalg.det(transform[:3, :3]) < 0:
+        volume = -volume
+
+    return {
+        'volume': volume,
+        'area': area,
+        'bounds': np.stack((vertices.min(axis=0), vertices.max(axis=0)))
+    }
@@ -1,77 +1,439 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 import json
+import ssl
 import asyncio
-from asyncio_mqtt import Client, MqttError
-from .printer_state import update_printer_state
+import logging
+import random
+import time
+from contextlib import AsyncExitStack
+from functools import lru_cache
+from aiomqtt import Client, Message, MqttError
+from core.config import settings
+from .device_state import device_states
 
-class MQTTClient:
-    def __init__(self):
-        self.printers: Dict[str, Dict[str, Any]] = {}
+logger = logging.getLogger(__name__)
+
+LAN_PORT = 8883
+LAN_USERNAME = "bblp"
+
+# Asks the printer for a full report instead of waiting for deltas
+PUSHALL = json.dumps({"pushing": {"sequence_id": "0", "command": "pushall"}})
+
+
+# Lists of AMS units and their trays; reports carry only the entries that
+# changed, so these are merged entry by entry like PrinterState._merge_ams
+ID_LISTS = {"ams", "tray", "slots"}
+
+
+def merge_report(base: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    """Deep-merge a partial report into another; values in update win"""
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merge_report(base[key], value)
+        elif key in ID_LISTS and isinstance(value, list) and isinstance(base.get(key), list):
+            _merge_by_id(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def _merge_by_id(base: List[Any], update: List[Any]):
+    """Merge list entries by their "id", or by position for entries without one"""
+    def key(index: int, entry: Any) -> Any:
+        return entry.get("id", index) if isinstance(entry, dict) else index
+
+    positions = {key(i, entry): i for i, entry in enumerate(base)}
+    for i, entry in enumerate(update):
+        position = positions.get(key(i, entry))
+        if position is None:
+            positions[key(i, entry)] = len(base)
+            base.append(entry)
+        elif isinstance(entry, dict) and isinstance(base[position], dict):
+            merge_report(base[position], entry)
+        else:
+            base[position] = entry
+
+
+class PrinterLink:
+    """Where and how to reach one printer's built-in broker in LAN mode"""
+
+    __slots__ = ("serial", "host", "access_code", "port")
+
+    def __init__(self, serial: str, host: str, access_code: str, port: int = LAN_PORT):
+        self.serial = serial
+        self.host = host
+        self.access_code = access_code
+        self.port = port
+
+
+def parse_lan_printers(spec: str) -> List[PrinterLink]:
+    """Parse "SERIAL@HOST[:PORT]=ACCESS_CODE" entries separated by commas
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    links = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        serial, at, rest = entry.partition("@")
+        address, eq, access_code = rest.partition("=")
+        host, _, port = address.partition(":")
+        if not (serial and at and host and eq and access_code) or (port and not port.isdigit()):
+            raise ValueError(f"Invalid LAN printer entry: {entry!r}")
+        links.append(PrinterLink(serial, host, access_code, int(port or LAN_PORT)))
+    return links
+
+
+@lru_cache()
+def get_tls_context() -> ssl.SSLContext:
+    """TLS settings shared by every printer connection
+
+    Printers present a self-signed certificate issued for their serial,
+    not their IP, so the hostname is never checked. Certificates are
+    verified only when CERT_PATH points at the Bambu CA bundle.
+    """
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    if settings.cert_path:
+        context.load_verify_locations(settings.cert_path)
+    else:
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class CircuitBreaker:
+    """Stops hammering a printer that keeps failing
+
+    After ``failure_threshold`` consecutive failed sessions the breaker
+    opens and no attempt is made for ``reset_timeout`` seconds. The next
+    attempt is a trial: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    __slots__ = ("failure_threshold", "reset_timeout", "failures", "opened_at")
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def state(self, now: float) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        return self.OPEN if now - self.opened_at < self.reset_timeout else self.HALF_OPEN
+
+    def retry_in(self, now: float) -> float:
+        """Seconds until the next attempt is allowed"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - now)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = now
+
+
+class PrinterConnection:
+    """Session state of one printer's MQTT connection"""
+
+    __slots__ = ("link", "breaker", "client", "last_seen", "probed", "stale", "task")
+
+    def __init__(self, link: PrinterLink, breaker: CircuitBreaker):
+        self.link = link
+        self.breaker = breaker
         self.client: Optional[Client] = None
+        self.last_seen = 0.0
+        self.probed = False
+        self.stale = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def status(self, now: float) -> Dict[str, Any]:
+        return {
+            "serial": self.link.serial,
+            "host": self.link.host,
+            "connected": self.client is not None,
+            "circuit": self.breaker.state(now),
+            "failures": self.breaker.failures,
+            "idle_seconds": round(now - self.last_seen, 1) if self.client else None
+        }
+
+
+class MQTTClient:
+    """Receives printer reports and feeds them to the device state store
+
+    Every printer in LAN mode runs its own broker, so each one gets its own
+    TLS session and connection task in the event loop:
+
+    - connects are spread ``connect_stagger`` seconds apart on startup and
+      at most ``max_concurrent_connects`` TLS handshakes run at once, so a
+      large farm neither stalls startup nor floods the executor;
+    - failed sessions are retried with exponential backoff, and a
+      per-printer circuit breaker parks printers that keep failing;
+    - a single health check task asks printers silent for ``stale_after``
+      seconds for a full report and reconnects those that stay silent.
+
+    Messages from all connections then flow through three shared stages so
+    bursts never block a socket:
+
+    1. receive tasks put raw payloads on a bounded queue, dropping the
+       oldest when it is full;
+    2. the worker parses them and merges every report from the same device
+       that arrives within ``coalesce_window`` seconds (newest fields win);
+    3. each device's merged report is folded into ``device_states`` once
+       per window, which notifies the WebSocket and job layers of the
+       fields that changed.
+
+    Nothing touches the network until ``start`` or ``add_printer`` is
+    awaited from the running loop.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 10000,
+        coalesce_window: float = 0.25,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_concurrent_connects: int = 16,
+        connect_stagger: float = 0.05,
+        stale_after: float = 30.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 300.0
+    ):
+        self.connections: Dict[str, PrinterConnection] = {}
+        self.coalesce_window = coalesce_window
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connect_stagger = connect_stagger
+        self.stale_after = stale_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.queue: "asyncio.Queue[Tuple[str, bytes]]" = asyncio.Queue(maxsize=max_queue)
+        self.counters = {
+            "received": 0,
+            "dropped": 0,
+            "parse_errors": 0,
+            "processed": 0,
+            "applied": 0,
+            "reconnects": 0,
+            "stale": 0
+        }
+        self._connect_slots = asyncio.Semaphore(max_concurrent_connects)
+        self._tasks: List[asyncio.Task] = []
+
+    def metrics(self) -> Dict[str, int]:
+        """Pipeline counters plus queue depth and connection counts"""
+        now = time.monotonic()
+        circuits = [conn.breaker.state(now) for conn in self.connections.values()]
+        return {
+            **self.counters,
+            "queue_depth": self.queue.qsize(),
+            "queue_max": self.queue.maxsize,
+            "printers": len(self.connections),
+            "connected": sum(1 for conn in self.connections.values() if conn.client),
+            "open_circuits": circuits.count(CircuitBreaker.OPEN)
+        }
+
+    def connection_status(self) -> List[Dict[str, Any]]:
+        """Per-printer connection and circuit breaker state"""
+        now = time.monotonic()
+        return [conn.status(now) for conn in self.connections.values()]
+
+    async def start(self, links: Optional[List[PrinterLink]] = None):
+        """Start the worker and health check, then connect to the given printers."""
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self.process_messages()),
+                asyncio.create_task(self._check_health())
+            ]
+        for i, link in enumerate(links or []):
+            await self.add_printer(link, delay=i * self.connect_stagger)
+
+    async def stop(self):
+        """Close every printer connection and stop the background tasks."""
+        tasks = [conn.task for conn in self.connections.values() if conn.task] + self._tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.connections.clear()
+        self._tasks = []
+
+    async def add_printer(self, link: PrinterLink, delay: float = 0.0):
+        """Connect to a printer, replacing any existing connection for its serial."""
+        await self.remove_printer(link.serial)
+        conn = PrinterConnection(link, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        self.connections[link.serial] = conn
+        conn.task = asyncio.create_task(self._run(conn, delay))
 
-    async def connect(self, broker: str, port: int = 1883):
-        """Connect to the MQTT broker."""
-        self.client = Client(broker, port)
-        await self.client.connect()
+    async def remove_printer(self, serial: str):
+        """Disconnect from a printer and stop reconnecting to it."""
+        conn = self.connections.pop(serial, None)
+        if conn and conn.task:
+            conn.task.cancel()
+            await asyncio.gather(conn.task, return_exceptions=True)
 
-    async def subscribe_to_printer(self, device_id: str):
-        """Subscribe to a printer's MQTT topics."""
-        if not self.client:
-            raise RuntimeError("MQTT client not connected")
-        
-        # Subscribe to the printer's report topic
-        topic = f"device/{device_id}/report"
-        await self.client.subscribe(topic)
+    async def _run(self, conn: PrinterConnection, delay: float):
+        """Keep one printer connected, reconnecting with backoff until cancelled."""
+        link = conn.link
+        backoff = self.min_backoff
+        await asyncio.sleep(delay)
+        while True:
+            await asyncio.sleep(conn.breaker.retry_in(time.monotonic()))
+            connected_at = None
+            try:
+                client = Client(
+                    link.host,
+                    link.port,
+                    username=LAN_USERNAME,
+                    password=link.access_code,
+                    tls_context=get_tls_context(),
+                    client_id=f"pandaherd-{link.serial}"
+                )
+                # The session lasts as long as the stack; only connecting takes a slot
+                async with AsyncExitStack() as session:
+                    async with self._connect_slots:
+                        await session.enter_async_context(client)
+                    connected_at = conn.last_seen = time.monotonic()
+                    conn.client = client
+                    conn.probed = False
+                    conn.stale.clear()
+                    # Listen before subscribing, or the reply to pushall can be lost
+                    async with client.messages() as messages:
+                        await client.subscribe(f"device/{link.serial}/report")
+                        await client.publish(f"device/{link.serial}/request", PUSHALL)
+                        conn.breaker.record_success()
+                        await self._receive_until_stale(conn, messages)
+            except MqttError as e:
+                logger.warning(f"MQTT connection to {link.serial} ({link.host}) lost: {e}")
+            except Exception:
+                # TLS and socket errors, or a bug; retry like any other failure
+                # rather than letting the task die and the printer stay offline
+                logger.exception(f"MQTT session with {link.serial} ({link.host}) failed")
+            finally:
+                conn.client = None
+            conn.breaker.record_failure(time.monotonic())
+
+            # Only a connection that stayed up resets the backoff, so a
+            # printer that accepts and immediately drops us is not hammered
+            if connected_at is not None and time.monotonic() - connected_at > self.max_backoff:
+                backoff = self.min_backoff
+            self.counters["reconnects"] += 1
+            # Jitter keeps printers that dropped together from reconnecting in lockstep
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _receive_until_stale(self, conn: PrinterConnection, messages: AsyncIterator[Message]):
+        """Receive until the session drops or the health check gives up on it"""
+        receive = asyncio.create_task(self.receive_messages(conn, messages))
+        stale = asyncio.create_task(conn.stale.wait())
+        try:
+            await asyncio.wait({receive, stale}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            receive.cancel()
+            stale.cancel()
+        if stale.done() and not stale.cancelled():
+            self.counters["stale"] += 1
+            logger.warning(f"Printer {conn.link.serial} stopped reporting, reconnecting")
+        elif receive.done() and not receive.cancelled() and receive.exception():
+            raise receive.exception()
+
+    async def _check_health(self):
+        """Probe silent printers with a pushall and flag unresponsive sessions as stale."""
+        interval = max(self.stale_after / 4, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for conn in list(self.connections.values()):
+                client = conn.client
+                if client is None:
+                    continue
+                idle = now - conn.last_seen
+                if idle > 2 * self.stale_after:
+                    conn.stale.set()
+                elif idle > self.stale_after and not conn.probed:
+                    conn.probed = True
+                    asyncio.create_task(self._request_pushall(client, conn.link.serial))
+
+    async def _request_pushall(self, client: Client, serial: str):
+        try:
+            await client.publish(f"device/{serial}/request", PUSHALL)
+        except MqttError as e:
+            logger.debug(f"Failed to request report from {serial}: {e}")
+
+    async def receive_messages(self, conn: PrinterConnection, messages: AsyncIterator[Message]):
+        """Move raw payloads from a printer onto the shared ingest queue."""
+        async for message in messages:
+            self.counters["received"] += 1
+            conn.last_seen = time.monotonic()
+            conn.probed = False
+            if self.queue.full():
+                # Keep the newest data; older reports are superseded anyway
+                self.queue.get_nowait()
+                self.counters["dropped"] += 1
+            self.queue.put_nowait((str(message.topic), message.payload))
 
     async def process_messages(self):
-        """Process incoming MQTT messages."""
-        if not self.client:
-            raise RuntimeError("MQTT client not connected")
-        
-        async with self.client.messages() as messages:
-            async for message in messages:
+        """Parse queued payloads and apply one merged report per device per window."""
+        while True:
+            topic, payload = await self.queue.get()
+            batch: Dict[str, Dict[str, Any]] = {}
+            self._collect(batch, topic, payload)
+
+            # Gather everything else arriving within the window
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.coalesce_window
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    topic, payload = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                self._collect(batch, topic, payload)
+
+            for device_id, report in batch.items():
                 try:
-                    # Parse the MQTT payload
-                    payload = json.loads(message.payload)
-                    
-                    # Extract device ID from topic
-                    device_id = message.topic.split('/')[1]
-                    
-                    # Update printer state if it contains AMS data
-                    if "print" in payload and "ams" in payload["print"]:
-                        ams_data = payload["print"]["ams"]
-                        
-                        # Extract AMS slot information
-                        slots = []
-                        for ams in ams_data.get("ams", []):
-                            for slot in ams.get("slots", []):
-                                slots.append({
-                                    "color": slot.get("color", "#808080"),
-                                    "remaining": slot.get("remain", 0),
-                                    "material": slot.get("material", "Unknown"),
-                                    "temperature": slot.get("temp", 0),
-                                    "humidity": slot.get("humidity", 0)
-                                })
-                        
-                        # Update printer state with new AMS data
-                        if device_id in self.printers:
-                            self.printers[device_id]["ams"] = {"slots": slots}
-                            
-                            # Notify the printer state service
-                            await update_printer_state(device_id, self.printers[device_id])
-                
-                except json.JSONDecodeError:
-                    print(f"Failed to parse MQTT message: {message.payload}")
+                    await self._apply(device_id, report)
+                    self.counters["applied"] += 1
                 except Exception as e:
-                    print(f"Error processing MQTT message: {e}")
+                    logger.error(f"Error processing MQTT report from {device_id}: {e}")
 
-    async def start(self, broker: str, device_ids: list[str]):
-        """Start the MQTT client and subscribe to all printers."""
+    def _collect(self, batch: Dict[str, Dict[str, Any]], topic: str, payload: bytes):
+        """Parse a payload and merge it into the batch entry for its device"""
+        self.counters["processed"] += 1
         try:
-            await self.connect(broker)
-            for device_id in device_ids:
-                await self.subscribe_to_printer(device_id)
-            await self.process_messages()
-        except MqttError as e:
-            print(f"MQTT Error: {e}")
-            # Implement reconnection logic here
+            report = json.loads(payload)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            self.counters["parse_errors"] += 1
+            logger.warning(f"Failed to parse MQTT message on {topic}")
+            return
+        if not isinstance(report, dict):
+            self.counters["parse_errors"] += 1
+            return
+
+        # Extract device ID from topic
+        device_id = topic.split('/')[1]
+        merge_report(batch.setdefault(device_id, {}), report)
+
+    async def _apply(self, device_id: str, payload: Dict[str, Any]):
+        """Merge a (coalesced) report into the device state store"""
+        await device_states.apply(device_id, payload)
+
+
+@lru_cache()
+def get_mqtt_client() -> MQTTClient:
+    """Shared transport, created on first use inside the running app"""
+    return MQTTClient(
+        max_queue=settings.mqtt_queue_size,
+        max_concurrent_connects=settings.mqtt_connect_concurrency,
+        connect_stagger=settings.mqtt_connect_stagger,
+        stale_after=settings.mqtt_stale_seconds
+    )
@@ -5,7 +5,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from pandaherd.models.printer import Printer
-from pandaherd.services.mqtt import mqtt_client
+from pandaherd.services.mqtt_client import PrinterLink, get_mqtt_client
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +24,12 @@ class PrinterService:
         return result.scalar_one_or_none()
     
     async def add_printer(
-        self, name: str, serial: str, model: str, ip_address: Optional[str] = None
+        self,
+        name: str,
+        serial: str,
+        model: str,
+        ip_address: Optional[str] = None,
+        access_code: Optional[str] = None
     ) -> Printer:
         printer = Printer(
             name=name,
@@ -35,8 +40,9 @@ class PrinterService:
         self.session.add(printer)
         await self.session.commit()
         
-        # Subscribe to printer's MQTT topic
-        mqtt_client.subscribe(serial)
+        # Connect to the printer's own broker in LAN mode
+        if ip_address and access_code:
+            await get_mqtt_client().add_printer(PrinterLink(serial, ip_address, access_code))
         
         return printer
     
@@ -50,8 +56,8 @@ class PrinterService:
     async def remove_printer(self, printer_id: int) -> bool:
         printer = await self.get_printer(printer_id)
         if printer:
-            # Unsubscribe from printer's MQTT topic
-            mqtt_client.unsubscribe(printer.serial)
+            # Close the printer's MQTT connection
+            await get_mqtt_client().remove_printer(printer.serial)
             
             await self.session.delete(printer)
             await self.session.commit()
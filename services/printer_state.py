@@ -1,33 +1,67 @@
-from typing import Dict, Any
-import asyncio
-from fastapi import WebSocket
+"""Live printer state and the WebSocket topics publishing it
+
+Topics:
+    fleet              name, status and current job of every printer
+    ams                AMS slots of every printer
+    printer/<id>       full state of one printer
+    jobs, filament     registered by the modules owning that data
+"""
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from services.connections import PubSubHub
+from services.device_state import ChangeSet, device_states
+from services.fleet_state import StatePublisher
+
+# Latest known state per printer id
+printers: Dict[str, Dict[str, Any]] = {}
+
+hub = PubSubHub(max_queue=settings.ws_queue_size, max_lag=settings.ws_max_lag_seconds)
+publisher = StatePublisher(hub)
+
+SUMMARY_KEYS = ("name", "status", "current_job")
+
+
+def _fleet_view(_: Optional[str]) -> Dict[str, Any]:
+    return {
+        printer_id: {key: state.get(key) for key in SUMMARY_KEYS}
+        for printer_id, state in printers.items()
+    }
+
+
+def _ams_view(_: Optional[str]) -> Dict[str, Any]:
+    return {printer_id: state.get("ams") for printer_id, state in printers.items()}
+
+
+def _printer_view(printer_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    return printers.get(printer_id)
+
+
+publisher.register("fleet", _fleet_view)
+publisher.register("ams", _ams_view)
+publisher.register("printer", _printer_view)
 
-# Store WebSocket connections for each printer
-printer_connections: Dict[str, set[WebSocket]] = {}
 
 async def update_printer_state(printer_id: str, state: Dict[str, Any]):
-    """Update printer state and notify all connected WebSocket clients."""
-    if printer_id in printer_connections:
-        # Send the updated state to all connected clients
-        for websocket in printer_connections[printer_id]:
-            try:
-                await websocket.send_json({
-                    "printer_id": printer_id,
-                    "state": state
-                })
-            except Exception:
-                # Remove failed connections
-                printer_connections[printer_id].remove(websocket)
-
-async def register_websocket(printer_id: str, websocket: WebSocket):
-    """Register a new WebSocket connection for a printer."""
-    if printer_id not in printer_connections:
-        printer_connections[printer_id] = set()
-    printer_connections[printer_id].add(websocket)
-
-async def unregister_websocket(printer_id: str, websocket: WebSocket):
-    """Unregister a WebSocket connection."""
-    if printer_id in printer_connections:
-        printer_connections[printer_id].remove(websocket)
-        if not printer_connections[printer_id]:
-            del printer_connections[printer_id]
+    """Merge a printer's reported state and notify subscribed WebSocket clients."""
+    printers.setdefault(printer_id, {}).update(state)
+    await publisher.sync()
+
+
+async def _on_device_change(change: ChangeSet):
+    """Refresh and publish only the dashboard sections touched by a device report."""
+    printer_id = change.device_id
+    if printer_id not in printers:
+        await update_printer_state(printer_id, change.state.dashboard())
+        return
+    sections = change.state.dashboard(change.dashboard_keys)
+    printers[printer_id].update(sections)
+    await publisher.patch(f"printer/{printer_id}", {(key,): value for key, value in sections.items()})
+    summary = {(printer_id, key): value for key, value in sections.items() if key in SUMMARY_KEYS}
+    if summary:
+        await publisher.patch("fleet", summary)
+    if "ams" in sections:
+        await publisher.patch("ams", {(printer_id,): sections["ams"]})
+
+
+device_states.add_listener(_on_device_change)
@@ -0,0 +1,66 @@
+"""QR code rendering with a bounded in-memory cache"""
+import base64
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+
+from core.config import settings
+
+MEDIA_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+
+def spool_qr_data(spool_id: str) -> str:
+    """URL encoded in a spool's QR code, opening its weight update page"""
+    return f"pandaherd://filament/spool/{spool_id}/weight"
+
+
+@lru_cache(maxsize=settings.qr_cache_size)
+def render_qr_code(data: str, size: int = 10, format: str = "svg") -> bytes:
+    """Render a QR code image, memoized by (data, size, format)
+
+    Args:
+        data: String to encode in QR code
+        size: Size of each module (box) in pixels
+        format: "svg" or "png"
+    """
+    if format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported QR code format: {format}")
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=size,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    factory = qrcode.image.svg.SvgImage if format == "svg" else None
+    img = qr.make_image(image_factory=factory)
+
+    buffer = BytesIO()
+    img.save(buffer)
+    return buffer.getvalue()
+
+
+def generate_qr_code(data: str, size: int = 10, format: str = "svg") -> str:
+    """Generate QR code as a base64 data URL
+
+    Args:
+        data: String to encode in QR code
+        size: Size of each module (box) in pixels
+        format: "svg" or "png"
+
+    Returns:
+        Base64 encoded data URL
+    """
+    encoded = base64.b64encode(render_qr_code(data, size, format)).decode()
+    return f"data:{MEDIA_TYPES[format]};base64,{encoded}"
+
+
+def qr_etag(data: str, size: int, format: str) -> str:
+    """Stable ETag for a rendered QR code; the image depends only on its inputs"""
+    return '"' + hashlib.sha1(f"{data}|{size}|{format}".encode()).hexdigest() + '"'
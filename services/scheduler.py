@@ -0,0 +1,346 @@
+"""Fleet-wide print queue and the scheduler assigning it to printers
+
+Queued jobs sit in a heap ordered by priority, then deadline, then
+estimated duration, so urgent and short prints go first. Planning is
+event driven: submitting or cancelling a job, a printer becoming free, or
+filament being loaded or used wakes the scheduler. It then walks the heap
+in order and places each job on the idle printers it fits. A job fits a
+printer when:
+
+    - the printer's model is one the job allows; the model is the
+      printer's "model" entry or follows from its serial number
+    - the model's bed holds the part, turned on the plate if need be
+    - the AMS has the job's materials and colors with enough grams left
+      (see services/filament_index.py)
+
+Compatible printers are computed once per file in a planning pass, so
+thousands of queued copies of a few files cost little more than the
+files themselves. A printer that finished a print is only used again
+after someone marks its plate as cleared.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from services import inventory, printer_state
+from services.device_state import ChangeSet, device_states
+from services.filament_index import FilamentIndex, Requirement, SlotEntry, filament_index
+from services.filament_usage import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+# Build volume (width, depth, height) in mm
+BED_SIZES = {
+    "X1": (256, 256, 256), "X1C": (256, 256, 256), "X1E": (256, 256, 256),
+    "P1P": (256, 256, 256), "P1S": (256, 256, 256),
+    "A1": (256, 256, 256), "A1 mini": (180, 180, 180),
+}
+DEFAULT_BED = (256, 256, 256)
+# Other names printers are registered under
+MODEL_ALIASES = {"X1 Carbon": "X1C", "X1-Carbon": "X1C", "A1 Mini": "A1 mini", "A1M": "A1 mini"}
+# Serial number prefixes of each model, for printers registered without one
+SERIAL_PREFIXES = {
+    "00M": "X1C", "00W": "X1", "03W": "X1E", "01S": "P1P", "01P": "P1S", "039": "A1", "030": "A1 mini",
+}
+
+ACTIVE_STATES = {"PREPARE", "SLICING", "RUNNING", "PAUSE"}
+ENDED_STATES = {"FINISH", "FAILED"}
+
+Size = Tuple[Optional[float], Optional[float], Optional[float]]
+
+
+def printer_model(printer_id: str, state: Dict[str, Any]) -> Optional[str]:
+    """Model from the printer's "model" entry, else from its serial number"""
+    model = state.get("model")
+    if model:
+        return MODEL_ALIASES.get(model, model)
+    return SERIAL_PREFIXES.get(printer_id[:3])
+
+
+def fits_bed(size: Size, bed: Tuple[float, float, float]) -> bool:
+    """Whether a part fits the bed, turned by 90 degrees on the plate if need be"""
+    width, depth, height = (value or 0 for value in size)
+    if height > bed[2]:
+        return False
+    return (width <= bed[0] and depth <= bed[1]) or (width <= bed[1] and depth <= bed[0])
+
+
+class QueuedJob:
+    """A library file to print quantity times"""
+
+    __slots__ = ("id", "file_id", "file_name", "quantity", "remaining", "priority", "deadline",
+                 "estimated_minutes", "requirements", "size", "models", "submitted_at", "key")
+
+    def __init__(
+        self,
+        file_id: str,
+        file_name: str,
+        requirements: List[Requirement],
+        size: Size = (None, None, None),
+        estimated_minutes: Optional[int] = None,
+        quantity: int = 1,
+        priority: int = 0,
+        deadline: Optional[datetime] = None,
+        models: Optional[List[str]] = None,
+        seq: int = 0
+    ):
+        self.id = f"queue-{uuid.uuid4().hex[:12]}"
+        self.file_id = file_id
+        self.file_name = file_name
+        self.requirements = requirements
+        self.size = size
+        self.estimated_minutes = estimated_minutes
+        self.quantity = self.remaining = quantity
+        self.priority = priority
+        self.deadline = deadline
+        self.models = {MODEL_ALIASES.get(model, model) for model in models} if models else None
+        self.submitted_at = time.time()
+        # Higher priority first, then earliest deadline, then shortest print
+        self.key = (
+            -priority,
+            deadline.timestamp() if deadline else math.inf,
+            estimated_minutes if estimated_minutes is not None else math.inf,
+            seq
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "id": self.id,
+            "file_id": self.file_id,
+            "file_name": self.file_name,
+            "quantity": self.quantity,
+            "remaining": self.remaining,
+            "priority": self.priority,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "estimated_minutes": self.estimated_minutes,
+            # Not finished in time even if started right now
+            "at_risk": bool(self.deadline and self.estimated_minutes
+                            and now + self.estimated_minutes * 60 > self.deadline.timestamp()),
+            "requirements": [r.to_dict() for r in self.requirements],
+            "models": sorted(self.models) if self.models else None,
+            "submitted_at": datetime.fromtimestamp(self.submitted_at, timezone.utc).isoformat(),
+        }
+
+
+class Assignment:
+    """One copy of a queued job given to a printer"""
+
+    __slots__ = ("job", "job_id", "file_name", "printer_id", "slots", "requirements", "assigned_at")
+
+    def __init__(self, job: QueuedJob, printer_id: str, slots: List[SlotEntry]):
+        self.job = job
+        self.job_id = job.id
+        self.file_name = job.file_name
+        self.printer_id = printer_id
+        self.slots = slots
+        self.requirements = job.requirements
+        self.assigned_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "printer_id": self.printer_id,
+            "slots": [entry.to_dict() for entry in self.slots],
+            "assigned_at": datetime.fromtimestamp(self.assigned_at, timezone.utc).isoformat(),
+        }
+
+
+async def start_print(assignment: Assignment):
+    """Start an assigned print (mocked like the manual print start)"""
+    usage_tracker.expect(assignment.printer_id, assignment.file_name, [
+        (entry.slot - 1, requirement.grams) for requirement, entry in zip(assignment.requirements, assignment.slots)
+    ])
+    await printer_state.update_printer_state(assignment.printer_id, {
+        "status": "printing",
+        "current_job": {"name": assignment.file_name, "progress": 0}
+    })
+
+
+class Scheduler:
+    """Priority queue of print jobs and their assignment to idle printers"""
+
+    def __init__(
+        self,
+        index: FilamentIndex = filament_index,
+        printers: Dict[str, Dict[str, Any]] = printer_state.printers,
+        dispatch: Callable[[Assignment], Awaitable[None]] = start_print
+    ):
+        self.index = index
+        self.printers = printers
+        self.dispatch = dispatch
+        self.jobs: Dict[str, QueuedJob] = {}
+        self.heap: List[Tuple[tuple, QueuedJob]] = []
+        self.assignments: Dict[str, Assignment] = {}  # By printer, until its print ends
+        self.needs_clearing: Set[str] = set()
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._loop = None
+
+    def wake(self, *_):
+        self._wake.set()
+
+    def wake_threadsafe(self, *_):
+        """wake() for callers off the event loop, such as inventory writes in worker threads"""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    def submit(self, file_id: str, file_name: str, requirements: List[Requirement], **options) -> QueuedJob:
+        """Queue a job; options are those of QueuedJob"""
+        job = QueuedJob(file_id, file_name, requirements, seq=next(self._seq), **options)
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.key, job))
+        self.wake()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop the copies of a job not yet assigned; the heap entry goes when it surfaces"""
+        if self.jobs.pop(job_id, None) is None:
+            return False
+        if len(self.heap) > 2 * len(self.jobs) + 64:
+            self.heap = list(self._live_entries())
+            heapq.heapify(self.heap)
+        # Jobs behind it in the queue may fit where it did not
+        self.wake()
+        return True
+
+    def mark_cleared(self, printer_id: str):
+        """Allow a printer whose last print ended to take new jobs"""
+        self.needs_clearing.discard(printer_id)
+        self.wake()
+
+    def queued(self, limit: int = 100) -> List[QueuedJob]:
+        """Jobs with copies left, in the order they will be considered"""
+        return [job for _, job in heapq.nsmallest(limit, self._live_entries())]
+
+    def _live_entries(self):
+        return ((key, job) for key, job in self.heap if job.id in self.jobs)
+
+    def idle_printers(self) -> Set[str]:
+        return {
+            printer_id for printer_id, state in self.printers.items()
+            if state.get("status") == "idle"
+            and printer_id not in self.assignments
+            and printer_id not in self.needs_clearing
+        }
+
+    def plan(self) -> List[Assignment]:
+        """Assign queued jobs to idle printers in queue order"""
+        idle = self.idle_printers()
+        assignments: List[Assignment] = []
+        deferred = []
+        # Printers each file could run on during this pass, with the chosen slots
+        compatible: Dict[tuple, Dict[str, List[SlotEntry]]] = {}
+
+        while idle and self.heap:
+            key, job = heapq.heappop(self.heap)
+            if job.id not in self.jobs:
+                continue  # Cancelled
+            signature = (job.file_id, frozenset(job.models) if job.models else None)
+            if signature not in compatible:
+                compatible[signature] = self._compatible(job, idle)
+            candidates = compatible[signature]
+            for printer_id in sorted((p for p in candidates if p in idle), key=self._bed_volume):
+                assignment = Assignment(job, printer_id, candidates[printer_id])
+                assignments.append(assignment)
+                self.assignments[printer_id] = assignment
+                idle.discard(printer_id)
+                job.remaining -= 1
+                if not job.remaining:
+                    break
+            if job.remaining:
+                deferred.append((key, job))
+            else:
+                del self.jobs[job.id]
+
+        for entry in deferred:
+            heapq.heappush(self.heap, entry)
+        return assignments
+
+    def _compatible(self, job: QueuedJob, idle: Set[str]) -> Dict[str, List[SlotEntry]]:
+        printers = [
+            printer_id for printer_id in idle
+            if (job.models is None or self._model(printer_id) in job.models)
+            and fits_bed(job.size, self._bed(printer_id))
+        ]
+        if not printers:
+            return {}
+        return self.index.find_printers(job.requirements, printer_ids=printers)
+
+    def _bed(self, printer_id: str) -> Tuple[float, float, float]:
+        return BED_SIZES.get(self._model(printer_id), DEFAULT_BED)
+
+    def _model(self, printer_id: str) -> Optional[str]:
+        return printer_model(printer_id, self.printers.get(printer_id) or {})
+
+    def _bed_volume(self, printer_id: str) -> tuple:
+        # Keep large printers free for parts only they can print
+        width, depth, height = self._bed(printer_id)
+        return width * depth * height, printer_id
+
+    async def on_device_change(self, change: ChangeSet):
+        """Track printers starting and ending prints, and wake on anything that frees capacity"""
+        if "gcode_state" in change.fields:
+            state = change.state.gcode_state
+            if state in ENDED_STATES:
+                self.assignments.pop(change.device_id, None)
+                self.needs_clearing.add(change.device_id)
+            elif state not in ACTIVE_STATES:
+                self.assignments.pop(change.device_id, None)
+            self.wake()
+        elif "ams" in change.fields:
+            self.wake()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                assignments = self.plan()
+            except Exception as e:
+                logger.error(f"Failed to plan the print queue: {e}")
+                continue
+            for assignment in assignments:
+                try:
+                    await self.dispatch(assignment)
+                except Exception as e:
+                    logger.error(f"Failed to start {assignment.file_name} on {assignment.printer_id}: {e}")
+                    self.assignments.pop(assignment.printer_id, None)
+                    self._requeue(assignment.job)
+
+    def _requeue(self, job: QueuedJob):
+        """Give back a copy whose print failed to start"""
+        if job.remaining:
+            if job.id in self.jobs:
+                job.remaining += 1
+            # Otherwise cancelled while the print was starting
+            return
+        # plan() dropped the job with its last copy
+        job.remaining = 1
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.key, job))
+
+
+scheduler = Scheduler()
+device_states.add_listener(scheduler.on_device_change)
+inventory.view_listeners.append(scheduler.wake_threadsafe)
@@ -0,0 +1,299 @@
+"""Downsampled time series of printer temperatures, fans and progress
+
+Once a second the sampler copies every printer's telemetry fields from
+the device state store into an in-memory chunk. Printers only report
+changes, so steady values are repeated; printers silent for longer than
+stale_after seconds are taken as disconnected and leave gaps instead.
+Chunks hold CHUNK_SAMPLES samples field by field as float32. Each
+resolution tier stores CHUNK_SAMPLES times fewer samples than the one
+below it:
+
+    1 s samples    one chunk per minute
+    1 min means    one chunk per hour
+    1 h means      one chunk per 60 hours
+
+A completed chunk's per-field mean becomes one sample of the next tier.
+Completed chunks are written to the database in batches from a worker
+thread, and tiers older than their retention are pruned. Nothing on the
+ingest path waits for the store.
+"""
+import asyncio
+import logging
+import time
+import warnings
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import settings
+from core.database import SessionLocal
+from models.telemetry import TelemetryChunk
+from services.device_state import DeviceStateStore, device_states
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_FIELDS = (
+    "nozzle_temp", "nozzle_target", "bed_temp", "bed_target", "chamber_temp",
+    "part_fan", "aux_fan", "chamber_fan", "heatbreak_fan", "progress", "layer",
+)
+CHUNK_SAMPLES = 60
+# Seconds per sample of each tier, finest first
+RESOLUTIONS = (1, 60, 3600)
+# Queries without an explicit resolution get at most this many points
+MAX_POINTS = 2000
+
+
+def _value(value: Any) -> float:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class _Chunk:
+    __slots__ = ("start", "values")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.values = np.full((len(TELEMETRY_FIELDS), CHUNK_SAMPLES), np.nan, dtype=np.float32)
+
+
+class TelemetryStore:
+    """Telemetry history of every printer in the device state store"""
+
+    def __init__(
+        self,
+        retention: Dict[int, float],
+        flush_interval: float = 60.0,
+        sample_interval: float = 1.0,
+        states: DeviceStateStore = device_states,
+        stale_after: Optional[float] = None
+    ):
+        self.retention = retention  # resolution -> seconds kept
+        self.flush_interval = flush_interval
+        self.sample_interval = sample_interval
+        self.states = states
+        # The MQTT client asks printers silent for mqtt_stale_seconds for a full
+        # report, so a connected printer is never quiet for much longer
+        self.stale_after = 2 * settings.mqtt_stale_seconds if stale_after is None else stale_after
+        self.open: Dict[Tuple[str, int], _Chunk] = {}
+        # Completed chunks waiting for the next flush, then being written
+        self.pending: List[Tuple[str, int, _Chunk]] = []
+        self.flushing: List[Tuple[str, int, _Chunk]] = []
+        self._last_sample: Optional[int] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._sample_loop()),
+            asyncio.create_task(self._flush_loop())
+        ]
+
+    async def stop(self):
+        """Stop sampling and write everything recorded so far, including open chunks."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.pending.extend((printer_id, resolution, chunk) for (printer_id, resolution), chunk in self.open.items())
+        self.open.clear()
+        await self.flush()
+
+    def sample(self, timestamp: int):
+        """Record the current telemetry of every printer at one point in time"""
+        if timestamp == self._last_sample:
+            return
+        self._last_sample = timestamp
+        for printer_id, state in self.states.states.items():
+            if state.last_report is None or timestamp - state.last_report > self.stale_after:
+                continue  # Disconnected; leave a gap
+            values = np.array([_value(getattr(state, field)) for field in TELEMETRY_FIELDS], dtype=np.float32)
+            self.record(printer_id, timestamp, values)
+
+    def record(self, printer_id: str, timestamp: int, values: np.ndarray, tier: int = 0):
+        """Store one sample; completing a chunk feeds its mean to the next tier"""
+        resolution = RESOLUTIONS[tier]
+        start = timestamp - timestamp % (resolution * CHUNK_SAMPLES)
+        key = (printer_id, resolution)
+        chunk = self.open.get(key)
+        if chunk is not None and chunk.start != start:
+            self._complete(printer_id, tier, chunk)
+            chunk = None
+        if chunk is None:
+            chunk = self.open[key] = _Chunk(start)
+        chunk.values[:, (timestamp - start) // resolution] = values
+
+    def _complete(self, printer_id: str, tier: int, chunk: _Chunk):
+        self.pending.append((printer_id, RESOLUTIONS[tier], chunk))
+        if tier + 1 < len(RESOLUTIONS):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # Fields never reported
+                mean = np.nanmean(chunk.values, axis=1)
+            if not np.isnan(mean).all():
+                self.record(printer_id, chunk.start, mean, tier + 1)
+
+    async def _sample_loop(self):
+        while True:
+            try:
+                self.sample(int(time.time()))
+            except Exception as e:
+                logger.error(f"Failed to sample telemetry: {e}")
+            await asyncio.sleep(self.sample_interval - time.time() % self.sample_interval)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write telemetry: {e}")
+
+    async def flush(self):
+        """Write completed chunks and prune expired ones in a worker thread"""
+        self.flushing, self.pending = self.pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, self.flushing, time.time())
+        except Exception:
+            # Keep the samples for the next attempt
+            self.pending[:0] = self.flushing
+            raise
+        finally:
+            self.flushing = []
+
+    def _write(self, chunks: List[Tuple[str, int, _Chunk]], now: float):
+        with SessionLocal() as db:
+            # Chunks of one flush share a handful of start times
+            starts = {chunk.start for _, _, chunk in chunks}
+            stored = {
+                (row.printer_id, row.resolution, row.start): row
+                for row in db.query(TelemetryChunk).filter(TelemetryChunk.start.in_(starts))
+            } if starts else {}
+            for printer_id, resolution, chunk in chunks:
+                values = chunk.values
+                existing = stored.get((printer_id, resolution, chunk.start))
+                if existing is not None:
+                    # The same period recorded before a restart
+                    values = np.where(np.isnan(values), _decode(existing.data), values)
+                    existing.data = _encode(values)
+                else:
+                    db.add(TelemetryChunk(
+                        printer_id=printer_id, resolution=resolution, start=chunk.start, data=_encode(values)
+                    ))
+            for resolution, keep in self.retention.items():
+                db.query(TelemetryChunk).filter(
+                    TelemetryChunk.resolution == resolution,
+                    TelemetryChunk.start < now - keep - resolution * CHUNK_SAMPLES
+                ).delete(synchronize_session=False)
+            db.commit()
+
+    def pick_resolution(self, start: float, end: float) -> int:
+        """Finest resolution still retained for start that keeps the point count bounded"""
+        now = time.time()
+        for resolution in RESOLUTIONS:
+            if now - start <= self.retention[resolution] and (end - start) / resolution <= MAX_POINTS:
+                return resolution
+        return RESOLUTIONS[-1]
+
+    async def query(
+        self,
+        printer_id: str,
+        start: float,
+        end: float,
+        fields: Optional[Iterable[str]] = None,
+        resolution: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Samples of a printer between start and end (Unix seconds) as arrays
+
+        Returns:
+            {"resolution", "timestamps", "fields": {name: values}} with None
+            for missing samples, or None if nothing was ever recorded in range
+
+        Raises:
+            ValueError: If a field, the resolution or the range is invalid
+        """
+        fields = list(fields or TELEMETRY_FIELDS)
+        unknown = set(fields) - set(TELEMETRY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown telemetry fields: {', '.join(sorted(unknown))}")
+        if end <= start:
+            raise ValueError("end must be after start")
+        if resolution is None:
+            resolution = self.pick_resolution(start, end)
+        elif resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {', '.join(map(str, RESOLUTIONS))}")
+
+        span = resolution * CHUNK_SAMPLES
+        # Nothing older than the retention period can exist
+        start = max(start, min(time.time(), end) - self.retention[resolution] - span)
+        if (end - start) / resolution > MAX_POINTS * 20:
+            raise ValueError("Range too large for this resolution")
+        first = int(start) - int(start) % resolution
+        count = max(0, (int(end) - first) // resolution + 1)
+
+        # Snapshot the in-memory chunks before yielding to the executor
+        chunks = {}
+        for printer, res, chunk in self.flushing + self.pending:
+            if printer == printer_id and res == resolution:
+                chunks.setdefault(chunk.start, []).append(chunk.values)
+        current = self.open.get((printer_id, resolution))
+        if current is not None:
+            chunks.setdefault(current.start, []).append(current.values.copy())
+
+        stored = await asyncio.get_running_loop().run_in_executor(
+            None, self._load, printer_id, resolution, first - span, first + count * resolution
+        )
+        if not stored and not chunks:
+            return None
+
+        series = np.full((len(TELEMETRY_FIELDS), count), np.nan, dtype=np.float32)
+        for chunk_start, values in stored + [(s, v) for s, vs in chunks.items() for v in vs]:
+            offset = (chunk_start - first) // resolution
+            lo, hi = max(offset, 0), min(offset + CHUNK_SAMPLES, count)
+            if lo >= hi:
+                continue
+            window = values[:, lo - offset:hi - offset]
+            target = series[:, lo:hi]
+            # Newer sources come later and win where they have data
+            series[:, lo:hi] = np.where(np.isnan(window), target, window)
+
+        rounded = np.round(series.astype(np.float64), 2).tolist()
+        return {
+            "printer_id": printer_id,
+            "resolution": resolution,
+            "timestamps": list(range(first, first + count * resolution, resolution)),
+            "fields": {
+                # NaN is the only value not equal to itself
+                field: [v if v == v else None for v in rounded[TELEMETRY_FIELDS.index(field)]]
+                for field in fields
+            }
+        }
+
+    def _load(self, printer_id: str, resolution: int, start: int, end: int) -> List[Tuple[int, np.ndarray]]:
+        with SessionLocal() as db:
+            rows = db.query(TelemetryChunk).filter(
+                TelemetryChunk.printer_id == printer_id,
+                TelemetryChunk.resolution == resolution,
+                TelemetryChunk.start > start,
+                TelemetryChunk.start < end
+            ).order_by(TelemetryChunk.start).all()
+            return [(row.start, _decode(row.data)) for row in rows]
+
+
+def _encode(values: np.ndarray) -> bytes:
+    return zlib.compress(values.astype(np.float32).tobytes(), 1)
+
+
+def _decode(data: bytes) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(data), dtype=np.float32).reshape(len(TELEMETRY_FIELDS), CHUNK_SAMPLES)
+
+
+@lru_cache()
+def get_telemetry_store() -> TelemetryStore:
+    """Shared store, created on first use"""
+    return TelemetryStore(
+        retention={
+            1: settings.telemetry_raw_retention_hours * 3600,
+            60: settings.telemetry_minute_retention_days * 86400,
+            3600: settings.telemetry_hour_retention_days * 86400,
+        },
+        flush_interval=settings.telemetry_flush_seconds
+    )
@@ -0,0 +1,91 @@
+"""Resized preview images for library files, stored on disk by content hash"""
+import io
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, features
+
+from core.config import settings
+from services.analyzer import ThreeMFAnalyzer
+
+# Longest edge in pixels for each served size
+THUMBNAIL_SIZES = {"small": 160, "medium": 480, "large": 960}
+
+# Bump whenever rendering changes so stored images are regenerated
+THUMBNAIL_VERSION = 1
+
+# WebP keeps transparency and is much smaller; fall back to JPEG without libwebp
+if features.check("webp"):
+    FORMAT, MEDIA_TYPE, EXTENSION = "WEBP", "image/webp", "webp"
+else:
+    FORMAT, MEDIA_TYPE, EXTENSION = "JPEG", "image/jpeg", "jpg"
+
+
+class ThumbnailStore:
+    """Fixed-size renditions of the preview images embedded in 3MF files
+
+    Images are written under ``thumbnails/`` keyed by the blob's SHA-256,
+    plate number (0 is the cover thumbnail) and size, so identical uploads
+    share them and a file's renditions never change once rendered.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root) / "thumbnails"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, sha256: str, plate: int, size: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}-{plate}-{size}-v{THUMBNAIL_VERSION}.{EXTENSION}"
+
+    def etag(self, sha256: str, plate: int, size: str) -> str:
+        return f'"{sha256[:16]}-{plate}-{size}-v{THUMBNAIL_VERSION}"'
+
+    def render(self, sha256: str, images: Dict[int, bytes]):
+        """Write every size of each extracted image, skipping ones already stored"""
+        for plate, data in images.items():
+            missing = [size for size in THUMBNAIL_SIZES if not self.path(sha256, plate, size).exists()]
+            if not missing:
+                continue
+            try:
+                with Image.open(io.BytesIO(data)) as source:
+                    source.load()
+                    for size in missing:
+                        self._write(source, self.path(sha256, plate, size), THUMBNAIL_SIZES[size])
+            except (OSError, ValueError) as e:
+                print(f"Error rendering thumbnail for plate {plate}: {e}")
+
+    def ensure(self, sha256: str, plate: int, size: str, blob_path: Path) -> Optional[Path]:
+        """Return a stored rendition, rendering it from the blob if it is missing"""
+        path = self.path(sha256, plate, size)
+        if not path.exists():
+            with ThreeMFAnalyzer(file_path=str(blob_path)) as analyzer:
+                name = analyzer.get_thumbnail_paths().get(plate)
+                if name is None:
+                    return None
+                self.render(sha256, {plate: analyzer.zip_file.read(name)})
+        return path if path.exists() else None
+
+    def remove(self, sha256: str):
+        """Delete every stored rendition of a blob"""
+        for path in (self.root / sha256[:2]).glob(f"{sha256}-*"):
+            path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _write(source: Image.Image, path: Path, max_edge: int):
+        image = source.copy()
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if FORMAT == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB" if FORMAT == "JPEG" else "RGBA")
+
+        # Write next to the destination and rename so readers never see partial files
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        image.save(tmp_path, FORMAT, quality=80)
+        os.replace(tmp_path, path)
+
+
+@lru_cache()
+def get_thumbnail_store() -> ThumbnailStore:
+    """Return the shared store, creating its directory on first use"""
+    return ThumbnailStore(settings.library_path)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings are read on import, so point the database and library at a
+# scratch directory before any service module loads
+_scratch = tempfile.mkdtemp(prefix="pandaherd-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/pandaherd.db")
+os.environ.setdefault("LIBRARY_PATH", f"{_scratch}/library")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,82 @@
+from services.filament_index import FilamentIndex, Requirement
+
+
+def make_index(**printers):
+    index = FilamentIndex()
+    for printer_id, trays in printers.items():
+        index.set_trays(printer_id, trays)
+    return index
+
+
+def test_printers_need_a_slot_for_every_requirement():
+    index = make_index(
+        a={1: ("PLA", "#FF0000", 100), 2: ("PETG", "#0000FF", 100)},
+        b={1: ("PLA", "#FF0000", 100)},
+    )
+
+    matches = index.find_printers([Requirement("PLA", "#FF0000", 10), Requirement("PETG", "#0000FF", 10)])
+
+    assert set(matches) == {"a"}
+    assert [entry.slot for entry in matches["a"]] == [1, 2]
+
+
+def test_requirements_in_similar_colors_get_separate_slots():
+    # Both reds match the one red slot; a needs a second slot to print them
+    index = make_index(
+        a={1: ("PLA", "#FF0000", 100)},
+        b={1: ("PLA", "#FF0000", 100), 2: ("PLA", "#F80404", 100)},
+    )
+
+    matches = index.find_printers([Requirement("PLA", "#FF0000", 10), Requirement("PLA", "#FA0202", 10)])
+
+    assert set(matches) == {"b"}
+    assert sorted(entry.slot for entry in matches["b"]) == [1, 2]
+
+
+def test_constrained_requirement_is_placed_first():
+    # The first requirement matches both slots and would prefer the fuller
+    # slot 2, which the second requirement needs
+    index = make_index(a={1: ("PLA", "#FF0000", 50), 2: ("PLA", "#000000", 100)})
+
+    matches = index.find_printers([Requirement("PLA", None, 10), Requirement("PLA", "#000000", 10)])
+
+    assert [entry.slot for entry in matches["a"]] == [1, 2]
+
+
+def test_each_slot_must_hold_the_grams_of_its_requirement():
+    # 30 % of an assumed 1 kg spool is 300 g
+    index = make_index(a={1: ("PLA", "#FF0000", 30)}, b={1: ("PLA", "#FF0000", 80)})
+
+    assert set(index.find_printers([Requirement("PLA", "#FF0000", 500)])) == {"b"}
+    assert set(index.find_printers([Requirement("PLA", "#FF0000", 250)])) == {"a", "b"}
+
+
+def test_fullest_slot_is_preferred():
+    index = make_index(a={1: ("PLA", "#FF0000", 20), 2: ("PLA", "#FF0000", 90)})
+
+    matches = index.find_printers([Requirement("PLA", "#FF0000", 10)])
+
+    assert matches["a"][0].slot == 2
+
+
+def test_color_tolerance():
+    index = make_index(a={1: ("PLA", "#FF0000", 100)})
+    near, far = Requirement("PLA", "#F01010", 10), Requirement("PLA", "#C00000", 10)
+
+    assert set(index.find_printers([near])) == {"a"}
+    assert index.find_printers([far]) == {}
+    assert set(index.find_printers([far], tolerance=80)) == {"a"}
+
+
+def test_printer_ids_limit_the_search():
+    index = make_index(a={1: ("PLA", None, 100)}, b={1: ("PLA", None, 100)})
+
+    assert set(index.find_printers([Requirement("PLA")], printer_ids=["b"])) == {"b"}
+
+
+def test_unloaded_slots_are_forgotten():
+    index = make_index(a={1: ("PLA", "#FF0000", 100), 2: ("PETG", "#0000FF", 100)})
+
+    index.set_trays("a", {1: ("PLA", "#FF0000", 100)})
+
+    assert index.find_printers([Requirement("PETG", "#0000FF", 10)]) == {}
@@ -0,0 +1,136 @@
+import asyncio
+
+from services.fleet_state import StatePublisher, TopicState, diff
+
+
+class RecordingHub:
+    """Stands in for PubSubHub, logging what each client would receive"""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.received = {}
+
+    def subscribe(self, websocket, topic):
+        self.subscribers.setdefault(topic, set()).add(websocket)
+
+    def topics(self):
+        return list(self.subscribers)
+
+    def send(self, websocket, message):
+        self.received.setdefault(websocket, []).append(message.payload)
+
+    def publish(self, topic, message):
+        for websocket in self.subscribers.get(topic, ()):
+            self.send(websocket, message)
+
+
+def test_diff():
+    old = {"a": 1, "b": {"c": [1, 2]}, "gone": True}
+    new = {"a": 1, "b": {"c": [1, 3]}, "new/key": "x"}
+
+    ops = diff(old, new)
+
+    assert sorted(ops, key=lambda op: op["path"]) == [
+        {"op": "replace", "path": "/b/c/1", "value": 3},
+        {"op": "remove", "path": "/gone"},
+        {"op": "add", "path": "/new~1key", "value": "x"},
+    ]
+
+
+def test_versions_only_advance_on_change():
+    state = TopicState("fleet")
+
+    first = state.update({"printers": {"a": {"status": "idle"}}})
+    assert first.payload["version"] == 1
+    assert state.update({"printers": {"a": {"status": "idle"}}}) is None
+
+    second = state.update({"printers": {"a": {"status": "printing"}}})
+    assert second.payload == {
+        "topic": "fleet", "type": "patch", "version": 2,
+        "ops": [{"op": "replace", "path": "/printers/a/status", "value": "printing"}],
+    }
+    assert state.snapshot_message().payload["version"] == 2
+
+
+def test_snapshot_is_rebuilt_per_version():
+    state = TopicState("fleet")
+    state.update({"a": 1})
+    snapshot = state.snapshot_message()
+
+    assert state.snapshot_message() is snapshot
+    state.update({"a": 2})
+    assert state.snapshot_message() is not snapshot
+
+
+def test_update_at_patches_only_given_paths():
+    state = TopicState("printer/a")
+    state.update({"temperatures": {"nozzle": 20, "bed": 20}, "status": "idle"})
+
+    patch = state.update_at({("temperatures",): {"nozzle": 220, "bed": 20}, ("status",): "idle"})
+
+    assert patch.payload["version"] == 2
+    assert patch.payload["ops"] == [{"op": "replace", "path": "/temperatures/nozzle", "value": 220}]
+    assert state.update_at({("status",): "idle"}) is None
+    assert state.version == 2
+
+
+def test_update_at_skips_paths_without_a_parent():
+    state = TopicState("printer/a")
+    state.update({"status": "idle"})
+
+    assert state.update_at({("ams", "trays"): []}) is None
+    patch = state.update_at({("hms",): []})
+    assert patch.payload["ops"] == [{"op": "add", "path": "/hms", "value": []}]
+
+
+def test_queued_messages_keep_their_values():
+    # Messages are encoded when the client's writer gets to them
+    state = TopicState("fleet")
+    state.update({"printers": {"a": {"progress": 10}}})
+    snapshot = state.snapshot_message()
+    first = state.update_at({("printers", "a"): {"progress": 20}})
+
+    state.update_at({("printers", "a"): {"progress": 30}})
+
+    assert snapshot.payload["state"] == {"printers": {"a": {"progress": 10}}}
+    assert first.payload["ops"][0]["value"] == 20
+
+
+def test_subscribers_get_a_snapshot_before_any_patch():
+    async def scenario():
+        fleet = {"printers": 1}
+        hub = RecordingHub()
+        publisher = StatePublisher(hub)
+        publisher.register("fleet", lambda arg: dict(fleet))
+
+        await publisher.subscribe("first", "fleet")
+        fleet["printers"] = 2
+        # The new value is found while subscribing; the earlier client gets
+        # the patch, the new one a snapshot that already includes it
+        await publisher.subscribe("second", "fleet")
+        fleet["printers"] = 3
+        await publisher.sync()
+        return hub.received
+
+    received = asyncio.run(scenario())
+
+    assert [(m["type"], m["version"]) for m in received["first"]] == [("snapshot", 1), ("patch", 2), ("patch", 3)]
+    assert [(m["type"], m["version"]) for m in received["second"]] == [("snapshot", 2), ("patch", 3)]
+    assert received["second"][0]["state"] == {"printers": 2}
+
+
+def test_patch_skips_topics_nobody_watches():
+    async def scenario():
+        hub = RecordingHub()
+        publisher = StatePublisher(hub)
+        publisher.register("printer", lambda arg: {"id": arg, "status": "idle"})
+
+        await publisher.patch("printer/a", {("status",): "printing"})
+        await publisher.subscribe("client", "printer/a")
+        await publisher.patch("printer/a", {("status",): "printing"})
+        return hub.received["client"]
+
+    received = asyncio.run(scenario())
+
+    assert [m["type"] for m in received] == ["snapshot", "patch"]
+    assert received[1]["ops"] == [{"op": "replace", "path": "/status", "value": "printing"}]
@@ -0,0 +1,172 @@
+import asyncio
+
+from services.filament_index import FilamentIndex, Requirement
+from services.scheduler import Scheduler
+
+RED = [Requirement("PLA", "#FF0000", 10)]
+
+
+def make_scheduler(printers, dispatch=None):
+    """Printers are id -> model, all idle with red PLA loaded"""
+    index = FilamentIndex()
+    states = {}
+    for printer_id, model in printers.items():
+        index.set_trays(printer_id, {1: ("PLA", "#FF0000", 100)})
+        states[printer_id] = {"status": "idle", "model": model}
+
+    async def no_dispatch(assignment):
+        pass
+
+    return Scheduler(index=index, printers=states, dispatch=dispatch or no_dispatch)
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_jobs_go_in_priority_order():
+    scheduler = make_scheduler({"a": "X1C"})
+    low = scheduler.submit("f1", "low.3mf", RED)
+    high = scheduler.submit("f2", "high.3mf", RED, priority=2)
+
+    [assignment] = scheduler.plan()
+
+    assert assignment.job is high
+    assert [job.id for job in scheduler.queued()] == [low.id]
+
+
+def test_copies_spread_over_idle_printers():
+    scheduler = make_scheduler({"a": "X1C", "b": "X1C", "c": "X1C"})
+    job = scheduler.submit("f1", "part.3mf", RED, quantity=2)
+
+    assignments = scheduler.plan()
+
+    assert len({assignment.printer_id for assignment in assignments}) == 2
+    assert job.remaining == 0
+    assert job.id not in scheduler.jobs
+    assert scheduler.idle_printers() == {"c"}
+
+
+def test_jobs_only_go_to_allowed_models():
+    scheduler = make_scheduler({"a": "X1 Carbon", "b": "P1S"})
+    scheduler.submit("f1", "part.3mf", RED, models=["X1C"])
+
+    [assignment] = scheduler.plan()
+
+    assert assignment.printer_id == "a"
+
+
+def test_parts_only_go_to_printers_they_fit():
+    scheduler = make_scheduler({"mini": "A1 mini", "big": "X1C"})
+    scheduler.submit("f1", "small.3mf", RED, size=(100, 100, 50))
+    scheduler.submit("f2", "large.3mf", RED, size=(220, 150, 50))
+
+    assignments = {assignment.file_name: assignment.printer_id for assignment in scheduler.plan()}
+
+    # The small part goes first and takes the small printer
+    assert assignments == {"small.3mf": "mini", "large.3mf": "big"}
+
+
+def test_cancelled_jobs_are_skipped():
+    scheduler = make_scheduler({"a": "X1C"})
+    first = scheduler.submit("f1", "first.3mf", RED, priority=1)
+    second = scheduler.submit("f2", "second.3mf", RED)
+    scheduler._wake.clear()
+
+    assert scheduler.cancel(first.id)
+    assert not scheduler.cancel(first.id)
+    assert scheduler._wake.is_set()
+
+    [assignment] = scheduler.plan()
+    assert assignment.job is second
+
+
+def test_cancel_compacts_the_heap():
+    scheduler = make_scheduler({})
+    jobs = [scheduler.submit(f"f{i}", f"part{i}.3mf", RED) for i in range(200)]
+
+    for job in jobs[:150]:
+        scheduler.cancel(job.id)
+
+    assert len(scheduler.heap) <= 2 * len(scheduler.jobs) + 64
+    assert [job.id for job in scheduler.queued(limit=1000)] == [job.id for job in jobs[150:]]
+
+
+def test_failed_dispatch_requeues_the_copy():
+    async def scenario():
+        async def fail(assignment):
+            raise RuntimeError("printer offline")
+
+        scheduler = make_scheduler({"a": "X1C"}, dispatch=fail)
+        scheduler.start()
+        try:
+            job = scheduler.submit("f1", "part.3mf", RED)
+            await settle()
+        finally:
+            await scheduler.stop()
+        return scheduler, job
+
+    scheduler, job = asyncio.run(scenario())
+
+    assert job.remaining == 1
+    assert scheduler.jobs[job.id] is job
+    assert scheduler.queued() == [job]
+    assert scheduler.idle_printers() == {"a"}
+
+
+def test_failed_dispatch_gives_back_one_copy_of_many():
+    async def scenario():
+        async def fail_on_b(assignment):
+            if assignment.printer_id == "b":
+                raise RuntimeError("printer offline")
+
+        scheduler = make_scheduler({"a": "X1C", "b": "X1C"}, dispatch=fail_on_b)
+        scheduler.start()
+        try:
+            job = scheduler.submit("f1", "part.3mf", RED, quantity=3)
+            await settle()
+        finally:
+            await scheduler.stop()
+        return scheduler, job
+
+    scheduler, job = asyncio.run(scenario())
+
+    assert job.remaining == 2
+    assert set(scheduler.assignments) == {"a"}
+    assert scheduler.queued() == [job]
+
+
+def test_job_cancelled_while_starting_is_not_requeued():
+    async def scenario():
+        scheduler = None
+
+        async def cancel_then_fail(assignment):
+            scheduler.cancel(assignment.job_id)
+            raise RuntimeError("printer offline")
+
+        scheduler = make_scheduler({"a": "X1C", "b": "X1C"}, dispatch=cancel_then_fail)
+        scheduler.start()
+        try:
+            job = scheduler.submit("f1", "part.3mf", RED, quantity=3)
+            await settle()
+        finally:
+            await scheduler.stop()
+        return scheduler, job
+
+    scheduler, job = asyncio.run(scenario())
+
+    assert job.id not in scheduler.jobs
+    assert scheduler.queued() == []
+    assert scheduler.assignments == {}
+
+
+def test_finished_printer_waits_for_its_plate_to_be_cleared():
+    scheduler = make_scheduler({"a": "X1C"})
+    scheduler.needs_clearing.add("a")
+    scheduler.submit("f1", "part.3mf", RED)
+
+    assert scheduler.plan() == []
+
+    scheduler.mark_cleared("a")
+    assert len(scheduler.plan()) == 1
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from services.device_state import DeviceStateStore, PrinterState
+from services.telemetry import CHUNK_SAMPLES, TELEMETRY_FIELDS, TelemetryStore
+
+NOZZLE = TELEMETRY_FIELDS.index("nozzle_temp")
+# A minute boundary, so 1 s chunks start here
+T0 = 1_700_000_040
+
+
+def make_store(states=None):
+    return TelemetryStore(
+        retention={1: 3600, 60: 86400, 3600: 86400 * 30},
+        states=states or DeviceStateStore(),
+        stale_after=60
+    )
+
+
+def sample(nozzle: float) -> np.ndarray:
+    values = np.full(len(TELEMETRY_FIELDS), np.nan, dtype=np.float32)
+    values[NOZZLE] = nozzle
+    return values
+
+
+def test_samples_fill_the_open_chunk():
+    store = make_store()
+
+    store.record("a", T0, sample(200))
+    store.record("a", T0 + 5, sample(210))
+
+    chunk = store.open[("a", 1)]
+    assert chunk.start == T0
+    assert chunk.values[NOZZLE, 0] == 200
+    assert chunk.values[NOZZLE, 5] == 210
+    assert np.isnan(chunk.values[NOZZLE, 1])
+    assert store.pending == []
+
+
+def test_rollover_completes_the_chunk_and_feeds_its_mean_up():
+    store = make_store()
+    for second in range(CHUNK_SAMPLES):
+        store.record("a", T0 + second, sample(200 if second % 2 else 220))
+
+    store.record("a", T0 + CHUNK_SAMPLES, sample(230))
+
+    assert [(printer_id, resolution) for printer_id, resolution, _ in store.pending] == [("a", 1)]
+    assert store.pending[0][2].start == T0
+    assert store.open[("a", 1)].start == T0 + CHUNK_SAMPLES
+    minutes = store.open[("a", 60)]
+    assert minutes.start == T0 - T0 % 3600
+    assert minutes.values[NOZZLE, (T0 % 3600) // 60] == pytest.approx(210)
+
+
+def test_minute_means_roll_over_into_hours():
+    store = make_store()
+    hour = T0 - T0 % 3600
+    for minute in range(CHUNK_SAMPLES + 1):
+        store.record("a", hour + minute * 60, sample(minute), tier=1)
+
+    assert [(resolution, chunk.start) for _, resolution, chunk in store.pending] == [(60, hour)]
+    hours = store.open[("a", 3600)]
+    assert hours.values[NOZZLE, (hour - hours.start) // 3600] == pytest.approx(29.5)
+
+
+def test_chunks_with_nothing_reported_are_not_fed_up():
+    store = make_store()
+    store.record("a", T0, sample(np.nan))
+
+    store.record("a", T0 + CHUNK_SAMPLES, sample(np.nan))
+
+    assert len(store.pending) == 1
+    assert ("a", 60) not in store.open
+
+
+def test_sampling_leaves_gaps_for_silent_printers():
+    states = DeviceStateStore()
+    for printer_id, last_report in (("fresh", T0 - 10), ("stale", T0 - 600), ("never", None)):
+        state = states.states[printer_id] = PrinterState(printer_id)
+        state.nozzle_temp = 200
+        state.last_report = last_report
+    store = make_store(states)
+
+    store.sample(T0)
+    store.sample(T0)  # Same second, ignored
+
+    assert set(store.open) == {("fresh", 1)}
+    assert store.open[("fresh", 1)].values[NOZZLE, 0] == 200